@@ -109,47 +109,29 @@ const handleViewPatient = async (patient) => {
     setLoadingAI(true); 
     
     try {
-        const [recRes, stayRes] = await Promise.all([
-            fetch(`${API_BASE}/hospital/patient/recovery`, {
-                method: 'POST', 
-                headers: {'Content-Type':'application/json'},
-                body: JSON.stringify({ 
-                    age: patient.age, 
-                    bmi: 24, // Default or from patient data
-                    heart_rate: patient.heartRate || 75, 
-                    blood_pressure: 120, // Default or from patient data
-                    diagnosis: patient.condition || 'General', 
-                    treatment_type: 'Standard'  // Default or from patient data
-                })
-            }),
-            fetch(`${API_BASE}/hospital/patient/stay`, {
-                method: 'POST', 
-                headers: {'Content-Type':'application/json'},
-                body: JSON.stringify({ 
-                    age: patient.age, 
-                    bmi: 24, // Default or from patient data
-                    heart_rate: patient.heartRate || 75, 
-                    blood_pressure: 120, // Default or from patient data
-                    diagnosis: patient.condition || 'General', 
-                    treatment_type: 'Standard'  // Default or from patient data
-                })
+        // One call returns both recovery and stay predictions
+        const res = await fetch(`${API_BASE}/hospital/patient/outcome`, {
+            method: 'POST', 
+            headers: {'Content-Type':'application/json'},
+            body: JSON.stringify({ 
+                age: patient.age, 
+                bmi: 24, // Default or from patient data
+                heart_rate: patient.heartRate || 75, 
+                blood_pressure: 120, // Default or from patient data
+                diagnosis: patient.condition || 'General', 
+                treatment_type: 'Standard'  // Default or from patient data
             })
-        ]);
-        
-        const recData = await recRes.json();
-        const stayData = await stayRes.json();
+        });
         
-        if (recData.error) {
-            setAiRecovery({ error: recData.error });
-        } else {
-            setAiRecovery(recData);
-        }
+        const outcomeData = await res.json();
         
-        if (stayData.error) {
-            setAiStay({ error: stayData.error });
-        } else {
-            setAiStay(stayData);
-        }
+        // Each head can fail on its own; fill each panel from whatever it returned
+        setAiRecovery(outcomeData.recovery_probability !== undefined
+            ? { recovery_probability: outcomeData.recovery_probability }
+            : { error: outcomeData.recovery_error || outcomeData.error || 'Recovery prediction unavailable' });
+        setAiStay(outcomeData.predicted_stay_days !== undefined
+            ? { predicted_stay_days: outcomeData.predicted_stay_days }
+            : { error: outcomeData.stay_error || outcomeData.error || 'Stay prediction unavailable' });
     } catch (err) { 
         console.error("AI Insight Error", err); 
         setAiRecovery({ error: `Failed to get recovery prediction: ${err.message}` });
@@ -1,16 +1,20 @@
 import pandas as pd
 import joblib
 import sys
+import os
 import json
 import re
 import random 
-from collections import defaultdict 
-from sklearn.model_selection import train_test_split
-from sklearn.feature_extraction.text import TfidfVectorizer
+import time
+from collections import defaultdict, OrderedDict
+from sklearn.model_selection import train_test_split, KFold
+from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer
 from sklearn.naive_bayes import MultinomialNB, GaussianNB
 from sklearn.pipeline import Pipeline
+from sklearn.base import clone
 from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor, IsolationForest
-from sklearn.preprocessing import OneHotEncoder, StandardScaler
+from sklearn.ensemble import HistGradientBoostingClassifier, HistGradientBoostingRegressor
+from sklearn.preprocessing import OneHotEncoder, StandardScaler, TargetEncoder
 from sklearn.compose import ColumnTransformer
 from sklearn.impute import SimpleImputer
 import numpy as np
@@ -24,14 +28,843 @@ except ImportError:
     print(json.dumps({"error": "Prophet library not found. Please run 'pip install prophet'"}))
     sys.exit(1)
 import logging
+import io
+import inspect
+import contextlib
+import errno
+import tempfile
+import functools
+import itertools
+import hashlib
+import math
+import multiprocessing
+import shutil
+import signal
+import sqlite3
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, Future, as_completed
+import threading
+from ml_encoders import HashingEncoder, FrequencyEncoder
+from scipy.optimize import linear_sum_assignment
 try:
     import networkx as nx
 except ImportError:
     print(json.dumps({"error": "NetworkX library not found. Please run 'pip install networkx'"}))
     sys.exit(1)
 
+try:
+    import pyarrow
+    _HAS_PYARROW = True
+except ImportError:
+    _HAS_PYARROW = False
+
 logging.getLogger('cmdstanpy').setLevel(logging.WARNING)
 
+# ===============================================
+# === TRAINING UTILITIES ===
+# ===============================================
+
+_DATASET_CACHE = {}
+_SHARED_DATASET_PATHS = set()
+
+def _load_dataset(csv_path):
+    # Datasets marked as shared by train_all are parsed once, on first use, and
+    # then handed to every trainer in the group. Each trainer gets its own copy
+    # since most of them mutate the frame.
+    key = os.path.abspath(csv_path)
+    cached = _DATASET_CACHE.get(key)
+    if cached is not None:
+        return cached.copy()
+    df = _read_columnar_dataset(csv_path)
+    if df is None:
+        df = pd.read_csv(csv_path)
+    if key in _SHARED_DATASET_PATHS:
+        _DATASET_CACHE[key] = df
+        return df.copy()
+    return df
+
+def _peak_memory_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+def _proc_memory_mb(field):
+    # VmRSS (current) or VmHWM (peak since the last reset) of this process; Linux only
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+def _reset_peak_memory():
+    # Writing 5 to clear_refs resets VmHWM to the current RSS
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def _file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _library_versions():
+    import sklearn
+    import prophet
+    return {
+        "python": f"{sys.version_info.major}.{sys.version_info.minor}",
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "scikit-learn": sklearn.__version__,
+        "joblib": joblib.__version__,
+        "prophet": prophet.__version__
+    }
+
+def _manifest_path(model_output_path):
+    return f"{model_output_path}.manifest.json"
+
+def _read_manifest(model_output_path):
+    try:
+        with open(_manifest_path(model_output_path)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _dataset_fingerprint(csv_path, previous=None):
+    # Hashing a large CSV is the expensive part, so reuse the previous hash when
+    # the file's size and mtime are exactly what they were when it was recorded.
+    stat = os.stat(csv_path)
+    stat_key = [stat.st_size, stat.st_mtime_ns]
+    if previous and previous.get('stat') == stat_key:
+        return previous
+    return {"path": csv_path, "stat": stat_key, "sha256": _file_sha256(csv_path)}
+
+_TRAINER_SOURCE_HASHES = {}
+
+def _code_names(code):
+    # Global names a function uses, including inside its nested functions and lambdas
+    names = set(code.co_names)
+    for constant in code.co_consts:
+        if inspect.iscode(constant):
+            names |= _code_names(constant)
+    return names
+
+def _trainer_source_sha256(trainer):
+    """
+    Hashes the source of the trainer and of every helper it reaches in this
+    package (functions, classes and their methods, followed transitively), plus
+    the module-level constants those use. Editing a shared helper such as
+    build_feature_matrices therefore invalidates the artifacts built with it,
+    while unrelated edits do not.
+    """
+    digest = _TRAINER_SOURCE_HASHES.get(trainer)
+    if digest is not None:
+        return digest
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    seen, pending, parts = set(), [inspect.unwrap(trainer)], []
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        parts.append(inspect.getsource(obj))
+        functions = [obj] if inspect.isfunction(obj) else [
+            inspect.unwrap(member) for member in vars(obj).values() if inspect.isfunction(inspect.unwrap(member))]
+        for function in functions:
+            namespace = function.__globals__
+            for name in sorted(_code_names(function.__code__)):
+                value = namespace.get(name)
+                if inspect.isfunction(value) or inspect.isclass(value):
+                    value = inspect.unwrap(value)
+                    try:
+                        source_file = inspect.getsourcefile(value)
+                    except TypeError:
+                        # Built-in or compiled: not ours to hash
+                        source_file = None
+                    if source_file and os.path.dirname(os.path.abspath(source_file)) == package_dir:
+                        pending.append(value)
+                elif isinstance(value, (str, int, float, bool, list, tuple, dict, set, frozenset)) and not name.startswith('_'):
+                    parts.append(f"{name} = {value!r}")
+    digest = hashlib.sha256("\n".join(sorted(set(parts))).encode()).hexdigest()
+    _TRAINER_SOURCE_HASHES[trainer] = digest
+    return digest
+
+def _build_training_manifest(trainer, params, previous=None):
+    config = {
+        "trainer": trainer.__name__,
+        "source_sha256": _trainer_source_sha256(trainer),
+        "params": {k: v for k, v in params.items() if k not in ('csv_path', 'model_output_path')}
+    }
+    csv_path = params.get('csv_path')
+    data = None
+    if csv_path is not None:
+        # The CSV is the source of truth; fall back to the columnar copy if it is all that exists
+        source = csv_path if os.path.exists(csv_path) else (_columnar_dataset_path(csv_path) or csv_path)
+        data = _dataset_fingerprint(source, previous.get('data') if previous else None)
+    versions = _library_versions()
+    key_material = json.dumps({
+        "config": config,
+        "data": data['sha256'] if data else None,
+        "versions": versions
+    }, sort_keys=True, default=str)
+    return {
+        "key": hashlib.sha256(key_material.encode()).hexdigest(),
+        "config": config,
+        "data": data,
+        "versions": versions
+    }
+
+# Outcome of the most recent call per artifact: 'reused', 'rebuilt' or 'failed'
+_TRAINING_OUTCOMES = {}
+
+def _cached_training(trainer):
+    """
+    Wraps a train_* entry point with a content-addressed cache. Each artifact gets
+    a sidecar <artifact>.manifest.json holding a hash of the input CSV, the
+    trainer's configuration (its source and non-path arguments) and library
+    versions. If the manifest still matches, fitting is skipped and the metrics
+    recorded at training time are returned. Pass force=True, use --force on the
+    command line, or set ML_FORCE_RETRAIN=1 to always refit.
+    """
+    signature = inspect.signature(trainer)
+
+    @functools.wraps(trainer)
+    def wrapper(*args, force=False, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        params = dict(bound.arguments)
+        output_path = params['model_output_path']
+        force = force or os.environ.get('ML_FORCE_RETRAIN') == '1'
+
+        previous = _read_manifest(output_path)
+        try:
+            manifest = _build_training_manifest(trainer, params, previous)
+        except FileNotFoundError:
+            # Missing input: let the trainer report it in its usual way
+            manifest = None
+
+        if (not force and manifest and previous and os.path.exists(output_path)
+                and previous.get('key') == manifest['key']):
+            print(f"Reusing {output_path}: data, configuration and library versions unchanged since {previous.get('trained_at')}.")
+            _TRAINING_OUTCOMES[output_path] = 'reused'
+            return previous.get('metrics')
+
+        metrics = trainer(*args, **kwargs)
+        if isinstance(metrics, dict) and manifest and os.path.exists(output_path):
+            manifest['trained_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+            manifest['metrics'] = metrics
+            with open(_manifest_path(output_path), 'w') as f:
+                json.dump(manifest, f, indent=2, default=str)
+            _TRAINING_OUTCOMES[output_path] = 'rebuilt'
+            _invalidate_shared_results(output_path)
+        else:
+            _TRAINING_OUTCOMES[output_path] = 'failed'
+        return metrics
+
+    return wrapper
+
+FEATURE_CACHE_DIR = 'feature_cache'
+# Entries kept per dataset (same columns, target and split), least recently used evicted first;
+# two lets a trainer alternate between estimator backends without rebuilding
+FEATURE_CACHE_ENTRIES_PER_DATASET = 2
+
+def _feature_cache_key(preprocessor, X, y, split_kwargs):
+    """
+    Returns "<dataset>-<entry>": the dataset part hashes only the column names,
+    target name(s) and split, so it is the same for every version of a
+    trainer's data and preprocessor and groups that trainer's entries.
+    """
+    import sklearn
+    split_config = {k: (v is not None) if k == 'stratify' else v for k, v in split_kwargs.items()}
+    # y is a DataFrame for multi-target trainers
+    y = y if isinstance(y, pd.DataFrame) else pd.Series(y)
+    targets = list(map(str, y.columns)) if isinstance(y, pd.DataFrame) else str(y.name)
+    dataset = hashlib.sha256(json.dumps([list(map(str, X.columns)), targets, split_config],
+                                        sort_keys=True, default=str).encode()).hexdigest()[:16]
+    digest = hashlib.sha256()
+    digest.update(json.dumps(list(map(str, X.columns))).encode())
+    digest.update(pd.util.hash_pandas_object(X, index=False).to_numpy().tobytes())
+    digest.update(pd.util.hash_pandas_object(y, index=False).to_numpy().tobytes())
+    digest.update(joblib.hash(preprocessor).encode())
+    digest.update(json.dumps(split_config, sort_keys=True, default=str).encode())
+    digest.update(sklearn.__version__.encode())
+    return f"{dataset}-{digest.hexdigest()}"
+
+def _prune_feature_cache(key):
+    # Keeps this dataset's most recently used entries and drops the rest, along
+    # with entries from before keys carried a dataset part, which nothing reads
+    dataset = key.split('-', 1)[0]
+    entries = []
+    for name in os.listdir(FEATURE_CACHE_DIR):
+        path = os.path.join(FEATURE_CACHE_DIR, name)
+        try:
+            if re.fullmatch(r'[0-9a-f]{64}\.joblib', name):
+                os.remove(path)
+            elif name.startswith(f"{dataset}-") and name.endswith('.joblib'):
+                entries.append((os.path.getmtime(path), path))
+        except OSError:
+            continue
+    for _, path in sorted(entries, reverse=True)[FEATURE_CACHE_ENTRIES_PER_DATASET:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def build_feature_matrices(preprocessor, X, y, **split_kwargs):
+    """
+    Splits X/y, fits the preprocessor on the training split and returns the
+    fitted preprocessor with the transformed train/test design matrices and
+    labels. Results are persisted under FEATURE_CACHE_DIR, keyed by a hash of
+    the data, the (unfitted) preprocessor configuration and the split, so
+    retrains with another estimator, repeated experiments or cross-validation
+    on X_train reuse the matrices instead of re-running the ColumnTransformer.
+    Only the FEATURE_CACHE_ENTRIES_PER_DATASET most recently used entries per
+    dataset are kept, so stale data or preprocessor versions do not pile up.
+    """
+    split_kwargs = split_kwargs or {'test_size': 0.2, 'random_state': 42}
+    key = _feature_cache_key(preprocessor, X, y, split_kwargs)
+    cache_path = os.path.join(FEATURE_CACHE_DIR, f"{key}.joblib")
+    if os.path.exists(cache_path):
+        try:
+            matrices = joblib.load(cache_path)
+            # Marks the entry as recently used for pruning
+            os.utime(cache_path)
+            return matrices
+        except Exception:
+            # A truncated or incompatible entry is simply rebuilt
+            pass
+
+    X_train, X_test, y_train, y_test = train_test_split(X, y, **split_kwargs)
+    fitted = clone(preprocessor)
+    # fit_transform (not fit + transform) so TargetEncoder cross-fits the training rows
+    X_train_t = fitted.fit_transform(X_train, y_train)
+    matrices = {
+        "preprocessor": fitted,
+        "X_train": X_train_t,
+        "X_test": fitted.transform(X_test),
+        "y_train": np.asarray(y_train),
+        "y_test": np.asarray(y_test)
+    }
+    os.makedirs(FEATURE_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    joblib.dump(matrices, tmp_path)
+    os.replace(tmp_path, cache_path)
+    _prune_feature_cache(key)
+    return matrices
+
+def _fit_with_feature_cache(preprocessor, estimator, step_name, X, y, **split_kwargs):
+    # Fits only the estimator on the (possibly cached) design matrix and returns
+    # a regular Pipeline plus the transformed test split for evaluation.
+    matrices = build_feature_matrices(preprocessor, X, y, **split_kwargs)
+    estimator.fit(matrices["X_train"], matrices["y_train"])
+    model = Pipeline(steps=[
+        ('preprocessor', matrices["preprocessor"]),
+        (step_name, estimator)
+    ])
+    return model, matrices["X_test"], matrices["y_test"]
+
+ESTIMATOR_BACKENDS = ['random_forest', 'hist_gradient_boosting']
+
+def _estimator_for_backend(backend, task, preprocessor, random_forest):
+    """
+    Returns (preprocessor, estimator) for the selected backend. 'random_forest'
+    keeps the trainer's original estimator; 'hist_gradient_boosting' swaps in
+    HistGradientBoosting*, which bins features and trains on all cores. It needs
+    dense input, so the ColumnTransformer is told never to emit sparse output.
+    """
+    if backend == 'random_forest':
+        return preprocessor, random_forest
+    if backend == 'hist_gradient_boosting':
+        params = {'random_state': 42}
+        if task == 'classification':
+            params['class_weight'] = random_forest.get_params().get('class_weight')
+            model = HistGradientBoostingClassifier(**params)
+        else:
+            model = HistGradientBoostingRegressor(**params)
+        return clone(preprocessor).set_params(sparse_threshold=0), model
+    raise ValueError(f"Unknown estimator backend '{backend}'. Must be one of: {ESTIMATOR_BACKENDS}")
+
+ID_ENCODINGS = ['onehot', 'hash', 'frequency', 'target']
+
+def _id_column_transformer(encoding, fill_value=0, n_hash_features=32):
+    """
+    Imputer + encoder pipeline for ID-like categorical columns. 'onehot' grows one
+    column per distinct ID; 'hash' (fixed width), 'frequency' and 'target'
+    (out-of-fold mean target, one column per ID column) keep the design matrix
+    width and per-request transform cost independent of the number of IDs.
+    """
+    if encoding == 'onehot':
+        encoder = OneHotEncoder(handle_unknown='ignore')
+    elif encoding == 'hash':
+        encoder = HashingEncoder(n_features=n_hash_features)
+    elif encoding == 'frequency':
+        encoder = FrequencyEncoder()
+    elif encoding == 'target':
+        import sklearn
+        # Seeded folds keep the out-of-fold encoding reproducible; scikit-learn 1.9
+        # moved shuffling from random_state to a splitter passed as cv.
+        if tuple(int(part) for part in sklearn.__version__.split('.')[:2]) >= (1, 9):
+            encoder = TargetEncoder(cv=KFold(n_splits=5, shuffle=True, random_state=42))
+        else:
+            encoder = TargetEncoder(random_state=42)
+    else:
+        raise ValueError(f"Unknown ID encoding '{encoding}'. Must be one of: {ID_ENCODINGS}")
+    return Pipeline(steps=[
+        ('imputer', SimpleImputer(strategy='constant', fill_value=fill_value)),
+        (encoding, encoder)
+    ])
+
+# ===============================================
+# === COLUMNAR DATASET FORMAT ===
+# ===============================================
+
+# Columns whose values are timestamps and are parsed once at conversion time
+DATE_COLUMNS = ['date', 'timestamp', 'timeStamp']
+# String columns with at most this fraction of distinct values are dictionary-encoded
+CATEGORICAL_MAX_RATIO = 0.5
+
+def _columnar_dataset_path(csv_path):
+    """
+    Returns the Parquet or .npz copy of csv_path if one exists and is at least as
+    new as the CSV (so a re-exported CSV is never shadowed by a stale copy).
+    """
+    stem = os.path.splitext(csv_path)[0]
+    csv_mtime = os.path.getmtime(csv_path) if os.path.exists(csv_path) else None
+    for candidate in (f"{stem}.parquet", f"{stem}.npz"):
+        if not os.path.exists(candidate):
+            continue
+        if candidate.endswith('.parquet') and not _HAS_PYARROW:
+            continue
+        if csv_mtime is None or os.path.getmtime(candidate) >= csv_mtime:
+            return candidate
+    return None
+
+def _optimize_dtypes(df):
+    for col in df.columns:
+        series = df[col]
+        if col in DATE_COLUMNS:
+            parsed = pd.to_datetime(series, errors='coerce')
+            if parsed.notna().sum() == series.notna().sum():
+                df[col] = parsed
+                continue
+        if pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            if series.nunique(dropna=True) <= max(1, len(series) * CATEGORICAL_MAX_RATIO):
+                df[col] = series.astype('category')
+    return df
+
+def _write_npz_dataset(df, npz_path):
+    # Every string column is stored as int32 codes plus a dictionary, timestamps as int64 nanoseconds
+    arrays = {}
+    schema = {"columns": []}
+    for i, col in enumerate(df.columns):
+        series = df[col]
+        key = f"c{i}"
+        if isinstance(series.dtype, pd.CategoricalDtype) or not (
+                pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_any_dtype(series)):
+            categorical = series if isinstance(series.dtype, pd.CategoricalDtype) else series.astype('category')
+            arrays[key] = categorical.cat.codes.to_numpy(dtype=np.int32)
+            arrays[f"{key}_dict"] = np.asarray(categorical.cat.categories.astype(str), dtype=str)
+            kind = "category" if isinstance(series.dtype, pd.CategoricalDtype) else "string"
+        elif pd.api.types.is_datetime64_any_dtype(series):
+            arrays[key] = series.astype('datetime64[ns]').to_numpy().view('int64')
+            kind = "datetime"
+        else:
+            arrays[key] = series.to_numpy()
+            kind = "numeric"
+        schema["columns"].append({"name": col, "key": key, "kind": kind})
+    np.savez(npz_path, **arrays)
+    with open(f"{os.path.splitext(npz_path)[0]}.schema.json", 'w') as f:
+        json.dump(schema, f, indent=2)
+
+def _read_npz_dataset(npz_path):
+    with open(f"{os.path.splitext(npz_path)[0]}.schema.json") as f:
+        schema = json.load(f)
+    data = {}
+    with np.load(npz_path, allow_pickle=False) as arrays:
+        for column in schema["columns"]:
+            values = arrays[column["key"]]
+            if column["kind"] in ("category", "string"):
+                categorical = pd.Categorical.from_codes(values, categories=arrays[f"{column['key']}_dict"])
+                data[column["name"]] = categorical if column["kind"] == "category" else np.asarray(categorical, dtype=object)
+            elif column["kind"] == "datetime":
+                data[column["name"]] = values.view('datetime64[ns]')
+            else:
+                data[column["name"]] = values
+    return pd.DataFrame(data)
+
+def _read_columnar_dataset(csv_path):
+    path = _columnar_dataset_path(csv_path)
+    if path is None:
+        return None
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return _read_npz_dataset(path)
+
+def convert_datasets(csv_paths=None, fmt='auto'):
+    """
+    Converts training CSVs to a typed columnar format: Parquet when pyarrow is
+    installed, otherwise NumPy .npz with a .schema.json next to it. Timestamps
+    are parsed and low-cardinality strings dictionary-encoded once, here,
+    instead of on every training run. _load_dataset picks the copy up
+    automatically while it is newer than its CSV.
+    """
+    if fmt == 'auto':
+        fmt = 'parquet' if _HAS_PYARROW else 'npz'
+    if fmt == 'parquet' and not _HAS_PYARROW:
+        print("Error: Parquet output requires pyarrow. Please run 'pip install pyarrow' or use the npz format.")
+        return
+    if csv_paths is None:
+        csv_paths = sorted(f for f in os.listdir('.') if f.endswith('.csv'))
+
+    results = []
+    for csv_path in csv_paths:
+        try:
+            start = time.perf_counter()
+            df = pd.read_csv(csv_path)
+            csv_load = time.perf_counter() - start
+            csv_mb = df.memory_usage(deep=True).sum() / (1024 * 1024)
+
+            df = _optimize_dtypes(df)
+            output_path = f"{os.path.splitext(csv_path)[0]}.{fmt}"
+            if fmt == 'parquet':
+                df.to_parquet(output_path, index=False)
+            else:
+                _write_npz_dataset(df, output_path)
+
+            start = time.perf_counter()
+            converted = _read_columnar_dataset(csv_path)
+            columnar_load = time.perf_counter() - start
+            columnar_mb = converted.memory_usage(deep=True).sum() / (1024 * 1024)
+
+            print(f"✓ {csv_path} → {output_path}: load {csv_load:.3f}s → {columnar_load:.3f}s, "
+                  f"memory {csv_mb:.1f} MB → {columnar_mb:.1f} MB")
+            results.append({"dataset": csv_path, "output": output_path,
+                            "csv_load_s": round(csv_load, 4), "columnar_load_s": round(columnar_load, 4),
+                            "csv_memory_mb": round(csv_mb, 2), "columnar_memory_mb": round(columnar_mb, 2)})
+        except Exception as e:
+            print(f"✗ Error converting {csv_path}: {e}")
+    return results
+
+# ===============================================
+# === PREDICTION CACHE ===
+# ===============================================
+
+class PredictionCache:
+    """
+    In-process LRU cache for prediction results, keyed by command, canonical
+    JSON input and model version. Entries expire after a per-command TTL, and
+    concurrent identical requests are coalesced: the first caller computes the
+    result while the others wait on it. Error results are never stored.
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {"hits": 0, "misses": 0, "coalesced": 0})
+        self.evictions = 0
+        self.expirations = 0
+
+    def get_or_compute(self, key, ttl, compute):
+        command = key[0]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, result = entry
+                if time.monotonic() < expires_at:
+                    self._entries.move_to_end(key)
+                    self._stats[command]["hits"] += 1
+                    return result
+                del self._entries[key]
+                self.expirations += 1
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[key] = future
+                self._stats[command]["misses"] += 1
+            else:
+                self._stats[command]["coalesced"] += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            result = compute()
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._in_flight[key]
+            if not (isinstance(result, dict) and "error" in result):
+                self._entries[key] = (time.monotonic() + ttl, result)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        future.set_result(result)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            commands = {command: dict(counts) for command, counts in self._stats.items()}
+            size = len(self._entries)
+        hits = sum(c["hits"] + c["coalesced"] for c in commands.values())
+        lookups = hits + sum(c["misses"] for c in commands.values())
+        for counts in commands.values():
+            served = counts["hits"] + counts["coalesced"]
+            total = served + counts["misses"]
+            counts["hit_ratio"] = round(served / total, 4) if total else 0.0
+        return {
+            "entries": size,
+            "max_entries": self.max_entries,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "commands": commands
+        }
+
+PREDICTION_CACHE = PredictionCache(max_entries=int(os.environ.get('ML_PREDICTION_CACHE_SIZE', 4096)))
+
+def _canonical_input(input_data):
+    return json.dumps(input_data, sort_keys=True, separators=(',', ':'), default=str)
+
+def _model_version(model_path):
+    # A stat call is cheap enough to make per request and changes whenever a model is retrained
+    try:
+        stat = os.stat(model_path)
+        return (stat.st_size, stat.st_mtime_ns)
+    except (OSError, TypeError):
+        return None
+
+class SharedResultCache:
+    """
+    Prediction results shared by every process on the host through a SQLite
+    database in WAL mode, so concurrent readers never block each other or the
+    writer. Keys combine the command, a hash of the canonical input and the
+    SHA-256 of the model artifact; artifact hashes are themselves stored by
+    (path, size, mtime) so each model file is hashed once per host, not once per
+    process. Retraining an artifact deletes its rows.
+    """
+
+    def __init__(self, db_path, prune_every=256):
+        self.db_path = db_path
+        self.prune_every = prune_every
+        self._local = threading.local()
+        self._artifact_hashes = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, command TEXT, model_path TEXT, "
+                         "value TEXT, expires_at REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS results_model_path ON results (model_path)")
+            conn.execute("CREATE TABLE IF NOT EXISTS artifacts (path TEXT PRIMARY KEY, size INTEGER, "
+                         "mtime_ns INTEGER, sha256 TEXT)")
+            self._local.conn = conn
+        return conn
+
+    def artifact_sha256(self, model_path):
+        version = _model_version(model_path)
+        if version is None:
+            return None
+        path = os.path.abspath(model_path)
+        memo_key = (path,) + version
+        digest = self._artifact_hashes.get(memo_key)
+        if digest is not None:
+            return digest
+        conn = self._connection()
+        row = conn.execute("SELECT size, mtime_ns, sha256 FROM artifacts WHERE path = ?", (path,)).fetchone()
+        if row is not None and tuple(row[:2]) == version:
+            digest = row[2]
+        else:
+            digest = _file_sha256(model_path)
+            conn.execute("INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?)", (path,) + version + (digest,))
+        self._artifact_hashes[memo_key] = digest
+        return digest
+
+    def key(self, command, canonical_input, model_path):
+        artifact = self.artifact_sha256(model_path) if model_path else ''
+        if artifact is None:
+            return None
+        input_hash = hashlib.sha256(canonical_input.encode()).hexdigest()
+        return f"{command}:{input_hash}:{artifact}"
+
+    def get(self, key):
+        row = self._connection().execute("SELECT value FROM results WHERE key = ? AND expires_at > ?",
+                                         (key, time.time())).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, command, model_path, result, ttl):
+        try:
+            value = json.dumps(result)
+        except (TypeError, ValueError):
+            return
+        conn = self._connection()
+        conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                     (key, command, os.path.abspath(model_path) if model_path else None, value, time.time() + ttl))
+        with self._lock:
+            self.writes += 1
+            prune = self.writes % self.prune_every == 0
+        if prune:
+            conn.execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),))
+
+    def invalidate(self, model_path):
+        path = os.path.abspath(model_path)
+        conn = self._connection()
+        conn.execute("DELETE FROM results WHERE model_path = ?", (path,))
+        conn.execute("DELETE FROM artifacts WHERE path = ?", (path,))
+
+    def stats(self):
+        row = self._connection().execute("SELECT COUNT(*) FROM results WHERE expires_at > ?", (time.time(),)).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "path": self.db_path,
+            "entries": row[0],
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+# Opt-in: point ML_SHARED_CACHE at a database file (e.g. prediction_cache.sqlite) to share results across processes
+SHARED_RESULT_CACHE = SharedResultCache(os.environ['ML_SHARED_CACHE']) if os.environ.get('ML_SHARED_CACHE') else None
+
+def _invalidate_shared_results(model_output_path):
+    if SHARED_RESULT_CACHE is None:
+        return
+    try:
+        SHARED_RESULT_CACHE.invalidate(model_output_path)
+    except sqlite3.Error as e:
+        print(f"Warning: could not invalidate shared results for {model_output_path}: {e}")
+
+def _shared_compute(command, canonical_input, model_path, ttl, compute):
+    # Falls back to computing locally whenever the shared store is unavailable
+    try:
+        key = SHARED_RESULT_CACHE.key(command, canonical_input, model_path)
+        result = SHARED_RESULT_CACHE.get(key) if key else None
+    except sqlite3.Error:
+        return compute()
+    if result is not None:
+        return result
+    result = compute()
+    if key and not (isinstance(result, dict) and "error" in result):
+        try:
+            SHARED_RESULT_CACHE.put(key, command, model_path, result, ttl)
+        except sqlite3.Error:
+            pass
+    return result
+
+# Resident models keyed by path: (size/mtime version, model)
+_MODEL_CACHE = {}
+
+# Set by ml_server.py's ModelReloader, which loads, validates and swaps in
+# retrained artifacts off the request path. Until it does, the resident model
+# keeps answering.
+MODEL_HOT_RELOAD = False
+
+def _load_model(model_path):
+    """
+    joblib.load with a process-wide cache. A model stays resident until its
+    file's size or mtime changes, so long-lived processes (ml_server.py) load
+    each artifact once while a retrain is still picked up on the next call.
+    """
+    version = _model_version(model_path)
+    cached = _MODEL_CACHE.get(model_path)
+    if cached is not None and (cached[0] == version or MODEL_HOT_RELOAD):
+        return cached[1]
+    model = joblib.load(model_path)
+    _MODEL_CACHE[model_path] = (version, model)
+    return model
+
+def _serving_version(model_path, file_version):
+    # The version of the model that will actually answer, which lags the file during a hot reload
+    if MODEL_HOT_RELOAD:
+        cached = _MODEL_CACHE.get(model_path)
+        if cached is not None:
+            return cached[0]
+    return file_version
+
+def _save_model(obj, model_path):
+    # Write-then-rename, so a process loading the artifact never sees a half-written file
+    tmp_path = f"{model_path}.{os.getpid()}.tmp"
+    joblib.dump(obj, tmp_path)
+    os.replace(tmp_path, model_path)
+
+def _cached_prediction(ttl):
+    """
+    Serves repeated calls to a predict_* entry point from PREDICTION_CACHE for
+    ttl seconds. The model file's size and mtime are part of the key, so a
+    retrained model is picked up on the next call. Cached results are shared
+    between callers and must not be mutated. Set ML_PREDICTION_CACHE=0 to bypass.
+    In-process misses consult SHARED_RESULT_CACHE when it is enabled.
+    """
+    def decorator(predictor):
+        signature = inspect.signature(predictor)
+
+        @functools.wraps(predictor)
+        def wrapper(*args, **kwargs):
+            if os.environ.get('ML_PREDICTION_CACHE') == '0':
+                return predictor(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            params = dict(bound.arguments)
+            model_path = params.pop('model_path', None)
+            try:
+                canonical_input = _canonical_input(params)
+            except (TypeError, ValueError):
+                return predictor(*args, **kwargs)
+            file_version = _model_version(model_path)
+            serving_version = _serving_version(model_path, file_version)
+            key = (predictor.__name__, canonical_input, model_path, serving_version)
+            compute = lambda: predictor(*args, **kwargs)
+            # While a hot reload is pending the shared key (the new artifact's hash) would not match the model answering
+            if SHARED_RESULT_CACHE is not None and serving_version == file_version:
+                local_compute = compute
+                compute = lambda: _shared_compute(predictor.__name__, canonical_input, model_path, ttl, local_compute)
+            return PREDICTION_CACHE.get_or_compute(key, ttl, compute)
+
+        return wrapper
+    return decorator
+
+def prediction_cache_stats():
+    stats = PREDICTION_CACHE.stats()
+    if SHARED_RESULT_CACHE is not None:
+        try:
+            stats["shared"] = SHARED_RESULT_CACHE.stats()
+        except sqlite3.Error as e:
+            stats["shared"] = {"error": str(e)}
+    return stats
+
 # ===============================================
 # === MEDICAL REPORT ANALYZER ===
 # ===============================================
@@ -86,21 +919,30 @@ def analyze_medical_report(text):
 # === EMERGENCY ALERT CLASSIFIER ===
 # ===============================================
 
+EMERGENCY_CATEGORIES = ['accident', 'cardiac_issue', 'fire', 'medical_emergency']
+
+def _map_call_categories(titles):
+    # Vectorized labelling of 911 call titles. Conditions are checked in order,
+    # so 'fire:' wins over 'traffic:', which wins over the EMS sub-categories.
+    titles_lower = titles.str.lower()
+    is_ems = titles_lower.str.contains('ems:', regex=False)
+    conditions = [
+        titles_lower.str.contains('fire:', regex=False),
+        titles_lower.str.contains('traffic:', regex=False),
+        is_ems & titles_lower.str.contains('cardiac|chest pain|heart|cpr'),
+        is_ems & titles_lower.str.contains('accident|mva|vehicle'),
+        is_ems
+    ]
+    choices = ['fire', 'accident', 'cardiac_issue', 'accident', 'medical_emergency']
+    return pd.Series(np.select(conditions, choices, default='other'), index=titles.index)
+
+@_cached_training
 def train_and_save_model(csv_path='911_calls.csv', model_output_path='emergency_classifier.joblib'):
     print(f"Starting model training with data from {csv_path}...")
     try:
-        df = pd.read_csv(csv_path)
+        df = _load_dataset(csv_path)
         df = df.dropna(subset=['title'])
-        def map_category(title):
-            title_lower = title.lower()
-            if 'fire:' in title_lower: return 'fire'
-            if 'traffic:' in title_lower: return 'accident'
-            if 'ems:' in title_lower:
-                if any(keyword in title_lower for keyword in ['cardiac', 'chest pain', 'heart', 'cpr']): return 'cardiac_issue'
-                if any(keyword in title_lower for keyword in ['accident', 'mva', 'vehicle']): return 'accident'
-                return 'medical_emergency'
-            return 'other'
-        df['category'] = df['title'].apply(map_category)
+        df['category'] = _map_call_categories(df['title'])
         df_model = df[df['category'] != 'other'][['title', 'category']]
         if df_model.empty:
             print("Error: No data to train on after filtering.")
@@ -118,18 +960,94 @@ def train_and_save_model(csv_path='911_calls.csv', model_output_path='emergency_
         
         y_pred = pipeline.predict(X_test)
         print("\n--- Model: Multinomial Naive Bayes (Alert Classifier) ---")
-        print(f"Accuracy: {accuracy_score(y_test, y_pred):.4f}")
+        accuracy = accuracy_score(y_test, y_pred)
+        print(f"Accuracy: {accuracy:.4f}")
         print("Classification Report:\n", classification_report(y_test, y_pred))
         print("Confusion Matrix:\n", confusion_matrix(y_test, y_pred))
         print("-" * 50 + "\n")
         
-        joblib.dump(pipeline, model_output_path)
+        _save_model(pipeline, model_output_path)
         print(f"Model successfully saved to {model_output_path}")
+        return {"accuracy": round(float(accuracy), 4)}
     except FileNotFoundError:
         print(f"Error: The file {csv_path} was not found.")
     except Exception as e:
         print(f"An error occurred during training: {e}")
 
+@_cached_training
+def train_emergency_model_out_of_core(csv_path='911_calls.csv', model_output_path='emergency_classifier.joblib',
+                                      chunksize=100000, n_features=2**20, test_every=5, max_test_rows=200000):
+    """
+    Out-of-core variant of train_and_save_model for the full 911 dataset.
+    Reads the CSV in chunks, hashes titles with a stateless HashingVectorizer and
+    updates the Naive Bayes model with partial_fit, so memory stays bounded by
+    chunksize (plus at most max_test_rows held-out titles) instead of file size.
+    Every test_every-th row is held out for evaluation.
+    """
+    print(f"Starting out-of-core model training with data from {csv_path} (chunksize={chunksize})...")
+    try:
+        vectorizer = HashingVectorizer(stop_words='english', n_features=n_features, alternate_sign=False)
+        nb = MultinomialNB()
+        test_titles, test_labels = [], []
+        rows_read = 0
+        rows_trained = 0
+        start = time.perf_counter()
+
+        # Chunk indices continue across chunks, so the index doubles as a global row id
+        for chunk in pd.read_csv(csv_path, usecols=['title'], chunksize=chunksize):
+            rows_read += len(chunk)
+            chunk = chunk.dropna(subset=['title'])
+            categories = _map_call_categories(chunk['title'])
+            keep = (categories != 'other').to_numpy()
+            titles = chunk['title'].to_numpy()[keep]
+            labels = categories.to_numpy()[keep]
+            is_test = (chunk.index.to_numpy()[keep] % test_every) == 0
+
+            if len(test_labels) < max_test_rows:
+                room = max_test_rows - len(test_labels)
+                test_titles.extend(titles[is_test][:room])
+                test_labels.extend(labels[is_test][:room])
+
+            if (~is_test).any():
+                nb.partial_fit(vectorizer.transform(titles[~is_test]), labels[~is_test], classes=EMERGENCY_CATEGORIES)
+                rows_trained += int((~is_test).sum())
+
+            elapsed = time.perf_counter() - start
+            print(f"  {rows_read} rows read, {rows_trained} trained ({rows_read / max(elapsed, 1e-9):,.0f} rows/s)")
+
+        if rows_trained == 0:
+            print("Error: No data to train on after filtering.")
+            return
+
+        elapsed = time.perf_counter() - start
+        pipeline = Pipeline([
+            ('hashing', vectorizer),
+            ('nb', nb)
+        ])
+
+        print("\n--- Model: Multinomial Naive Bayes (Alert Classifier, out-of-core) ---")
+        accuracy = None
+        if test_labels:
+            y_pred = pipeline.predict(test_titles)
+            accuracy = accuracy_score(test_labels, y_pred)
+            print(f"Accuracy: {accuracy:.4f}")
+            print("Classification Report:\n", classification_report(test_labels, y_pred))
+            print("Confusion Matrix:\n", confusion_matrix(test_labels, y_pred))
+        print(f"Rows read: {rows_read} | Rows trained: {rows_trained} | Held out: {len(test_labels)}")
+        print(f"Throughput: {rows_read / max(elapsed, 1e-9):,.0f} rows/s over {elapsed:.2f}s")
+        peak_mb = _peak_memory_mb()
+        if peak_mb is not None:
+            print(f"Peak memory (RSS): {peak_mb} MB")
+        print("-" * 50 + "\n")
+
+        _save_model(pipeline, model_output_path)
+        print(f"Model successfully saved to {model_output_path}")
+        return {"accuracy": None if accuracy is None else round(float(accuracy), 4), "rows_read": rows_read, "rows_per_second": round(rows_read / max(elapsed, 1e-9), 1)}
+    except FileNotFoundError:
+        print(f"Error: The file {csv_path} was not found.")
+    except Exception as e:
+        print(f"An error occurred during out-of-core training: {e}")
+
 def get_priority(category):
     if category in ['cardiac_issue', 'accident', 'fire']: return 'High'
     if category == 'medical_emergency': return 'Medium'
@@ -137,7 +1055,7 @@ def get_priority(category):
 
 def predict_emergency(text_input, model_path='emergency_classifier.joblib'):
     try:
-        model = joblib.load(model_path)
+        model = _load_model(model_path)
         predicted_category = model.predict([text_input])[0]
         priority = get_priority(predicted_category)
         return {
@@ -154,10 +1072,11 @@ def predict_emergency(text_input, model_path='emergency_classifier.joblib'):
 # === DONOR COMPATIBILITY ===
 # ===============================================
 
+@_cached_training
 def train_compatibility_model(csv_path='compatibility_data.csv', model_output_path='compatibility_model.joblib'):
     print(f"Starting compatibility model training with data from {csv_path}...")
     try:
-        df = pd.read_csv(csv_path)
+        df = _load_dataset(csv_path)
         df = df.dropna()
         if 'is_compatible' not in df.columns:
             print(f"Error: Target column 'is_compatible' not found in {csv_path}.")
@@ -180,23 +1099,22 @@ def train_compatibility_model(csv_path='compatibility_data.csv', model_output_pa
                 ('cat', categorical_transformer, categorical_features)
             ])
         
-        clf = Pipeline(steps=[('preprocessor', preprocessor),
-                            ('classifier', LogisticRegression(random_state=42, class_weight='balanced'))])
-            
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
         print("Fitting compatibility pipeline...")
-        clf.fit(X_train, y_train)
+        clf, X_test_t, y_test = _fit_with_feature_cache(
+            preprocessor, LogisticRegression(random_state=42, class_weight='balanced'), 'classifier', X, y, test_size=0.2, random_state=42, stratify=y)
         
-        y_pred = clf.predict(X_test)
+        y_pred = clf.named_steps['classifier'].predict(X_test_t)
         target_names = ['Not Compatible (0)', 'Compatible (1)']
         print("\n--- Model: Logistic Regression (Donor Compatibility) ---")
-        print(f"Accuracy: {accuracy_score(y_test, y_pred):.4f}")
+        accuracy = accuracy_score(y_test, y_pred)
+        print(f"Accuracy: {accuracy:.4f}")
         print("Classification Report:\n", classification_report(y_test, y_pred, target_names=target_names))
         print("Confusion Matrix:\n", confusion_matrix(y_test, y_pred))
         print("-" * 50 + "\n")
 
-        joblib.dump(clf, model_output_path)
+        _save_model(clf, model_output_path)
         print(f"Model successfully saved to {model_output_path}")
+        return {"accuracy": round(float(accuracy), 4)}
     except FileNotFoundError:
         print(f"Error: The file {csv_path} was not found. Please create it first.")
     except Exception as e:
@@ -204,7 +1122,7 @@ def train_compatibility_model(csv_path='compatibility_data.csv', model_output_pa
 
 def predict_compatibility(input_data_dict, model_path='compatibility_model.joblib'):
     try:
-        model = joblib.load(model_path)
+        model = _load_model(model_path)
         input_df = pd.DataFrame([input_data_dict])
         probability = model.predict_proba(input_df)[0][1]
         return {
@@ -215,15 +1133,190 @@ def predict_compatibility(input_data_dict, model_path='compatibility_model.jobli
     except Exception as e:
         return {"error": f"An error occurred during compatibility prediction: {e}"}
 
+# Red-cell compatibility: receiver blood type -> donor blood types it can accept
+ABO_COMPATIBLE_DONORS = {
+    'O-': ['O-'],
+    'O+': ['O-', 'O+'],
+    'A-': ['O-', 'A-'],
+    'A+': ['O-', 'O+', 'A-', 'A+'],
+    'B-': ['O-', 'B-'],
+    'B+': ['O-', 'O+', 'B-', 'B+'],
+    'AB-': ['O-', 'A-', 'B-', 'AB-'],
+    'AB+': ['O-', 'O+', 'A-', 'A+', 'B-', 'B+', 'AB-', 'AB+'],
+}
+COMPATIBILITY_FEATURES = ['receiver_blood_type', 'receiver_age', 'receiver_gender', 'donor_blood_type',
+                          'donor_age', 'donor_gender', 'organ_type', 'location_distance']
+# Donor pool files must live in this directory, since API clients name them
+DONOR_POOL_DIR = os.environ.get('ML_DONOR_POOL_DIR', os.path.dirname(os.path.abspath(__file__)))
+# Donor pool indexes keyed by resolved path: ((size, mtime_ns), index)
+_DONOR_INDEX_CACHE = {}
+
+def _build_donor_index(donors):
+    """
+    Returns (index, columns): index maps (donor_blood_type, organ_type) to row
+    positions so candidates are found without scanning the pool; columns holds
+    the pool as plain NumPy arrays so candidate rows are gathered with fancy
+    indexing instead of DataFrame row selection.
+    """
+    index = {key: np.asarray(rows) for key, rows in donors.groupby(['donor_blood_type', 'organ_type'], sort=False).indices.items()}
+    columns = {column: donors[column].to_numpy(dtype=object) for column in ['donor_blood_type', 'donor_gender', 'organ_type']}
+    for column in ['donor_age', 'location_distance', 'latitude', 'longitude']:
+        if column in donors.columns:
+            columns[column] = pd.to_numeric(donors[column], errors='coerce').to_numpy(dtype=float)
+    ids = donors['donor_id'] if 'donor_id' in donors.columns else donors['id'] if 'id' in donors.columns else pd.Series(donors.index)
+    columns['donor_id'] = ids.tolist()
+    return index, columns
+
+def _load_donor_pool(donor_pool):
+    """Returns (index, columns) for a donor list or file; files are cached per process until they change."""
+    if not isinstance(donor_pool, str):
+        return _build_donor_index(pd.DataFrame(donor_pool).reset_index(drop=True))
+    pool_dir = os.path.realpath(DONOR_POOL_DIR)
+    path = os.path.realpath(os.path.join(pool_dir, donor_pool))
+    if os.path.commonpath([pool_dir, path]) != pool_dir:
+        raise ValueError("donor_pool must name a file in the donor pool directory")
+    version = _model_version(path)
+    if version is None:
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), donor_pool)
+    cached = _DONOR_INDEX_CACHE.get(path)
+    if cached is None or cached[0] != version:
+        cached = (version, _build_donor_index(_load_dataset(path).reset_index(drop=True)))
+        _DONOR_INDEX_CACHE[path] = cached
+    return cached[1]
+
+def _haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 6371.0 * 2 * np.arcsin(np.sqrt(a))
+
+def match_donors(input_data_dict, model_path='compatibility_model.joblib', max_pairs_per_batch=500000):
+    """
+    Ranks a donor pool for one or more receivers.
+    input_data_dict: {"receiver": {...} or "receivers": [{...}],
+                      "donors": [{...}] or "donor_pool": "donor_pool.csv",
+                      "top_k": 10, "abo_prefilter": true}
+    Receivers carry receiver_blood_type/age/gender and the organ_type they need;
+    donors carry donor_blood_type/age/gender and the organ_type offered. With
+    latitude/longitude on both sides the distance is computed, otherwise a
+    donor's location_distance is used (missing values are imputed by the model).
+    Candidates come from the (blood type, organ) index and all receiver/donor
+    pairs of a batch are scored in a single predict_proba call.
+    """
+    try:
+        receivers = input_data_dict.get('receivers') or [input_data_dict.get('receiver') or {}]
+        donor_pool = input_data_dict.get('donors', input_data_dict.get('donor_pool'))
+        top_k = input_data_dict.get('top_k', 10)
+        try:
+            # int() alone would silently truncate 2.5 and accept True
+            if isinstance(top_k, bool) or (isinstance(top_k, float) and not top_k.is_integer()):
+                raise ValueError(top_k)
+            top_k = max(0, int(top_k))
+        except (TypeError, ValueError):
+            return {"error": f"top_k must be an integer, got {top_k!r}"}
+        abo_prefilter = bool(input_data_dict.get('abo_prefilter', True))
+        if donor_pool is None:
+            return {"error": "Provide a 'donors' list or a 'donor_pool' file path."}
+        if not isinstance(donor_pool, str) and len(donor_pool) == 0:
+            return {"error": "The donor pool is empty."}
+
+        model = _load_model(model_path)
+        index, donors = _load_donor_pool(donor_pool)
+        has_coordinates = 'latitude' in donors and 'longitude' in donors
+
+        candidates = []
+        for receiver in receivers:
+            organ = receiver.get('organ_type')
+            if abo_prefilter:
+                blood_types = ABO_COMPATIBLE_DONORS.get(receiver.get('receiver_blood_type'), [])
+                groups = [index[(blood, organ)] for blood in blood_types if (blood, organ) in index]
+            else:
+                groups = [rows for (_, donor_organ), rows in index.items() if donor_organ == organ]
+            candidates.append(np.concatenate(groups) if groups else np.empty(0, dtype=int))
+
+        matches = []
+        batch = []
+        batch_pairs = 0
+
+        def score_batch():
+            pair_rows = np.concatenate([candidate_rows for _, candidate_rows in batch])
+            sizes = [len(candidate_rows) for _, candidate_rows in batch]
+
+            def receiver_column(feature):
+                return np.repeat(np.array([receiver.get(feature) for receiver, _ in batch], dtype=object), sizes)
+
+            distances = []
+            for receiver, candidate_rows in batch:
+                if has_coordinates and receiver.get('latitude') is not None and receiver.get('longitude') is not None:
+                    distances.append(_haversine_km(float(receiver['latitude']), float(receiver['longitude']),
+                                                   donors['latitude'][candidate_rows], donors['longitude'][candidate_rows]))
+                elif 'location_distance' in donors:
+                    distances.append(donors['location_distance'][candidate_rows])
+                else:
+                    distances.append(np.full(len(candidate_rows), np.nan))
+
+            # Object-dtype Series keep the text columns as NumPy arrays all the way into the encoder
+            pairs = pd.DataFrame({
+                'receiver_blood_type': pd.Series(receiver_column('receiver_blood_type'), dtype=object),
+                'receiver_age': pd.to_numeric(pd.Series(receiver_column('receiver_age')), errors='coerce'),
+                'receiver_gender': pd.Series(receiver_column('receiver_gender'), dtype=object),
+                'donor_blood_type': pd.Series(donors['donor_blood_type'][pair_rows], dtype=object),
+                'donor_age': donors['donor_age'][pair_rows] if 'donor_age' in donors else np.nan,
+                'donor_gender': pd.Series(donors['donor_gender'][pair_rows], dtype=object),
+                'organ_type': pd.Series(donors['organ_type'][pair_rows], dtype=object),
+                'location_distance': np.concatenate(distances)
+            })
+            probabilities = model.predict_proba(pairs[COMPATIBILITY_FEATURES])[:, 1]
+
+            offset = 0
+            for receiver, rows in batch:
+                scores = probabilities[offset:offset + len(rows)]
+                offset += len(rows)
+                k = min(top_k, len(rows))
+                best = np.argpartition(-scores, k - 1)[:k] if k else np.empty(0, dtype=int)
+                best = best[np.argsort(-scores[best], kind='stable')]
+                matches.append({
+                    "receiver_id": receiver.get('id'),
+                    "candidates_scored": int(len(rows)),
+                    "donors": [{"donor_id": donors['donor_id'][rows[i]],
+                                "donor_blood_type": donors['donor_blood_type'][rows[i]],
+                                "probability": round(float(scores[i]), 4)} for i in best]
+                })
+
+        for receiver, rows in zip(receivers, candidates):
+            if len(rows) == 0:
+                if batch:
+                    score_batch()
+                    batch, batch_pairs = [], 0
+                matches.append({"receiver_id": receiver.get('id'), "candidates_scored": 0, "donors": []})
+                continue
+            # Receivers are batched so one predict_proba covers many of them without unbounded memory
+            if batch and batch_pairs + len(rows) > max_pairs_per_batch:
+                score_batch()
+                batch, batch_pairs = [], 0
+            batch.append((receiver, rows))
+            batch_pairs += len(rows)
+        if batch:
+            score_batch()
+
+        return {
+            "matches": matches
+        }
+
+    except FileNotFoundError as e:
+        return {"error": f"File not found: {e.filename}. Train the compatibility model and check the donor pool path."}
+    except Exception as e:
+        return {"error": f"An error occurred during donor matching: {e}"}
+
 # ===============================================
 # === HOSPITAL RECOMMENDATION ===
 # ===============================================
 
-def train_recommendation_model(csv_path='hospital_data.csv', model_output_path='hospital_recommendation_model.joblib'):
+@_cached_training
+def train_recommendation_model(csv_path='hospital_data.csv', model_output_path='hospital_recommendation_model.joblib', estimator='random_forest'):
     print(f"Starting recommendation model training with data from {csv_path}...")
     
     try:
-        df = pd.read_csv(csv_path)
+        df = _load_dataset(csv_path)
         df = df.dropna()
         
         if 'is_best_choice' not in df.columns:
@@ -252,24 +1345,23 @@ def train_recommendation_model(csv_path='hospital_data.csv', model_output_path='
                 ('cat', categorical_transformer, categorical_features)
             ])
         
-        clf = Pipeline(steps=[('preprocessor', preprocessor),
-                            ('classifier', RandomForestClassifier(random_state=42))])
-        
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-        
         print("Fitting recommendation pipeline...")
-        clf.fit(X_train, y_train)
+        preprocessor, model = _estimator_for_backend(estimator, 'classification', preprocessor, RandomForestClassifier(random_state=42))
+        clf, X_test_t, y_test = _fit_with_feature_cache(
+            preprocessor, model, 'classifier', X, y, test_size=0.2, random_state=42)
         
-        y_pred = clf.predict(X_test)
+        y_pred = clf.named_steps['classifier'].predict(X_test_t)
         target_names = ['Not Best (0)', 'Best Choice (1)']
-        print("\n--- Model: RandomForestClassifier (Hospital Recommendation) ---")
-        print(f"Accuracy: {accuracy_score(y_test, y_pred):.4f}")
+        print(f"\n--- Model: {type(clf.named_steps['classifier']).__name__} (Hospital Recommendation) ---")
+        accuracy = accuracy_score(y_test, y_pred)
+        print(f"Accuracy: {accuracy:.4f}")
         print("Classification Report:\n", classification_report(y_test, y_pred, target_names=target_names))
         print("Confusion Matrix:\n", confusion_matrix(y_test, y_pred))
         print("-" * 50 + "\n")
         
-        joblib.dump(clf, model_output_path)
+        _save_model(clf, model_output_path)
         print(f"Model successfully saved to {model_output_path}")
+        return {"accuracy": round(float(accuracy), 4)}
         
     except FileNotFoundError:
         print(f"Error: The file {csv_path} was not found. Please create it first.")
@@ -278,7 +1370,7 @@ def train_recommendation_model(csv_path='hospital_data.csv', model_output_path='
 
 def predict_hospital_recommendation(input_data_json, model_path='hospital_recommendation_model.joblib'):
     try:
-        model = joblib.load(model_path)
+        model = _load_model(model_path)
         
         input_data = json.loads(input_data_json)
         if not isinstance(input_data, list) or len(input_data) == 0:
@@ -307,11 +1399,12 @@ def predict_hospital_recommendation(input_data_json, model_path='hospital_recomm
 # === HEALTH RISK PREDICTION ===
 # ===============================================
 
+@_cached_training
 def train_health_risk_model(csv_path='health_risk_data.csv', model_output_path='health_risk_model.joblib'):
     print(f"Starting health risk model training with data from {csv_path}...")
     
     try:
-        df = pd.read_csv(csv_path)
+        df = _load_dataset(csv_path)
         processed_df = pd.DataFrame()
         processed_df['age'] = df['Age']
         processed_df['bmi'] = df['BMI']
@@ -361,24 +1454,22 @@ def train_health_risk_model(csv_path='health_risk_data.csv', model_output_path='
                 ('cat', categorical_transformer, categorical_features)
             ])
         
-        clf = Pipeline(steps=[('preprocessor', preprocessor),
-                            ('classifier', LogisticRegression(random_state=42, multi_class='auto', class_weight='balanced'))])
-        
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-        
         print("Fitting health risk pipeline...")
-        clf.fit(X_train, y_train)
+        clf, X_test_t, y_test = _fit_with_feature_cache(
+            preprocessor, LogisticRegression(random_state=42, multi_class='auto', class_weight='balanced'), 'classifier', X, y, test_size=0.2, random_state=42)
         
-        y_pred = clf.predict(X_test)
+        y_pred = clf.named_steps['classifier'].predict(X_test_t)
         target_names = ['Low Risk (0)', 'High Risk (1)']
         print("\n--- Model: Logistic Regression (Health Risk) ---")
-        print(f"Accuracy: {accuracy_score(y_test, y_pred):.4f}")
+        accuracy = accuracy_score(y_test, y_pred)
+        print(f"Accuracy: {accuracy:.4f}")
         print("Classification Report:\n", classification_report(y_test, y_pred, target_names=target_names))
         print("Confusion Matrix:\n", confusion_matrix(y_test, y_pred))
         print("-" * 50 + "\n")
         
-        joblib.dump(clf, model_output_path)
+        _save_model(clf, model_output_path)
         print(f"Model successfully saved to {model_output_path}")
+        return {"accuracy": round(float(accuracy), 4)}
         
     except FileNotFoundError:
         print(f"Error: The file {csv_path} was not found. Please download it and name it 'health_risk_data.csv'.")
@@ -389,7 +1480,7 @@ def train_health_risk_model(csv_path='health_risk_data.csv', model_output_path='
 
 def predict_health_risk(input_data_dict, model_path='health_risk_model.joblib'):
     try:
-        model = joblib.load(model_path)
+        model = _load_model(model_path)
         input_df = pd.DataFrame([input_data_dict])
         prediction = model.predict(input_df)[0]
         risk_map = {0: 'Low', 1: 'High'}
@@ -407,10 +1498,11 @@ def predict_health_risk(input_data_dict, model_path='health_risk_model.joblib'):
 # === USER ACTIVITY CLUSTERING ===
 # ===============================================
 
+@_cached_training
 def train_activity_cluster_model(csv_path='user_activity_data.csv', model_output_path='activity_cluster_model.joblib'):
     print(f"Starting activity cluster model training with data from {csv_path}...")
     try:
-        df = pd.read_csv(csv_path)
+        df = _load_dataset(csv_path)
         features = ['sos_usage', 'donations_made', 'health_logs']
         if not all(col in df.columns for col in features):
             print(f"Error: CSV must contain all of these columns: {features}")
@@ -430,8 +1522,9 @@ def train_activity_cluster_model(csv_path='user_activity_data.csv', model_output
         print(f"Cluster Centers (Scaled):\n{centers}")
         print("-" * 50 + "\n")
         
-        joblib.dump(pipeline, model_output_path)
+        _save_model(pipeline, model_output_path)
         print(f"Activity cluster model successfully saved to {model_output_path}")
+        return {"inertia": round(float(inertia), 4)}
     except FileNotFoundError:
         print(f"Error: The file {csv_path} was not found. Please create it first.")
     except Exception as e:
@@ -439,7 +1532,7 @@ def train_activity_cluster_model(csv_path='user_activity_data.csv', model_output
 
 def predict_activity_cluster(input_data_dict, model_path='activity_cluster_model.joblib'):
     try:
-        model = joblib.load(model_path)
+        model = _load_model(model_path)
         cluster_map = {0: "Inactive", 1: "Active", 2: "Moderate"}
         input_df = pd.DataFrame([input_data_dict])
         features = ['sos_usage', 'donations_made', 'health_logs']
@@ -459,10 +1552,11 @@ def predict_activity_cluster(input_data_dict, model_path='activity_cluster_model
 # === BEHAVIOR FORECAST ===
 # ===============================================
 
+@_cached_training
 def train_behavior_forecast_model(csv_path='user_forecast_data.csv', model_output_path='behavior_forecast_model.joblib'):
     print(f"Starting behavior forecast model training with data from {csv_path}...")
     try:
-        df = pd.read_csv(csv_path)
+        df = _load_dataset(csv_path)
         features = ['past_donations']
         target = 'future_donations'
         if not all(col in df.columns for col in features + [target]):
@@ -480,13 +1574,17 @@ def train_behavior_forecast_model(csv_path='user_forecast_data.csv', model_outpu
         
         y_pred = model.predict(X_test)
         print("\n--- Model: Linear Regression (Behavior Forecast) ---")
-        print(f"R-squared (R2): {r2_score(y_test, y_pred):.4f}")
-        print(f"Mean Absolute Error (MAE): {mean_absolute_error(y_test, y_pred):.4f}")
-        print(f"Root Mean Squared Error (RMSE): {np.sqrt(mean_squared_error(y_test, y_pred)):.4f}")
+        r2 = r2_score(y_test, y_pred)
+        mae = mean_absolute_error(y_test, y_pred)
+        rmse = np.sqrt(mean_squared_error(y_test, y_pred))
+        print(f"R-squared (R2): {r2:.4f}")
+        print(f"Mean Absolute Error (MAE): {mae:.4f}")
+        print(f"Root Mean Squared Error (RMSE): {rmse:.4f}")
         print("-" * 50 + "\n")
         
-        joblib.dump(model, model_output_path)
+        _save_model(model, model_output_path)
         print(f"Behavior forecast model successfully saved to {model_output_path}")
+        return {"r2": round(float(r2), 4), "mae": round(float(mae), 4), "rmse": round(float(rmse), 4)}
     except FileNotFoundError:
         print(f"Error: The file {csv_path} was not found. Please create it first.")
     except Exception as e:
@@ -494,7 +1592,7 @@ def train_behavior_forecast_model(csv_path='user_forecast_data.csv', model_outpu
 
 def predict_behavior_forecast(input_data_dict, model_path='behavior_forecast_model.joblib'):
     try:
-        model = joblib.load(model_path)
+        model = _load_model(model_path)
         input_df = pd.DataFrame([input_data_dict])
         features = ['past_donations']
         input_df = input_df[features]
@@ -512,10 +1610,11 @@ def predict_behavior_forecast(input_data_dict, model_path='behavior_forecast_mod
 # === EMERGENCY HOTSPOT CLUSTERING ===
 # ===============================================
 
+@_cached_training
 def train_emergency_hotspot_model(csv_path='emergency_hotspot_data.csv', model_output_path='emergency_hotspot_model.joblib'):
     print(f"Starting emergency hotspot model training with data from {csv_path}...")
     try:
-        df = pd.read_csv(csv_path)
+        df = _load_dataset(csv_path)
         
         try:
             df['timestamp'] = pd.to_datetime(df['timestamp'])
@@ -563,17 +1662,19 @@ def train_emergency_hotspot_model(csv_path='emergency_hotspot_data.csv', model_o
         print(f"Inertia (Sum of squared distances): {inertia:.4f}")
         print("-" * 50 + "\n")
         
-        joblib.dump(pipeline, model_output_path)
+        _save_model(pipeline, model_output_path)
         print(f"Emergency hotspot model successfully saved to {model_output_path}")
+        return {"inertia": round(float(inertia), 4)}
 
     except FileNotFoundError:
         print(f"Error: The file {csv_path} was not found. Please create it first.")
     except Exception as e:
         print(f"An error occurred during hotspot training: {e}")
 
+@_cached_prediction(ttl=3600)
 def predict_emergency_hotspots(input_data_json, model_path='emergency_hotspot_model.joblib'):
     try:
-        model = joblib.load(model_path)
+        model = _load_model(model_path)
         input_data = json.loads(input_data_json)
         
         if not isinstance(input_data, list) or len(input_data) == 0:
@@ -607,10 +1708,11 @@ def predict_emergency_hotspots(input_data_json, model_path='emergency_hotspot_mo
 # ===============================================
 # === DISEASE OUTBREAK FORECAST ===
 # ===============================================
+@_cached_training
 def train_outbreak_forecast_model(csv_path='outbreak_data.csv', model_output_path='outbreak_forecast_models.joblib'):
     print(f"Starting outbreak forecast model training with data from {csv_path}...")
     try:
-        df = pd.read_csv(csv_path)
+        df = _load_dataset(csv_path)
         
         required_cols = ['date', 'disease_name', 'region', 'cases']
         if not all(col in df.columns for col in required_cols):
@@ -645,17 +1747,19 @@ def train_outbreak_forecast_model(csv_path='outbreak_data.csv', model_output_pat
             print(f"- {key[0]} in {key[1]}")
         print("-" * 50 + "\n")
 
-        joblib.dump(models, model_output_path)
+        _save_model(models, model_output_path)
         print(f"Outbreak forecast models dictionary successfully saved to {model_output_path}")
+        return {"models_trained": len(models)}
 
     except FileNotFoundError:
         print(f"Error: The file {csv_path} was not found. Please create it first.")
     except Exception as e:
         print(f"An error occurred during outbreak forecast training: {e}")
 
+@_cached_prediction(ttl=3600)
 def predict_outbreak_forecast(input_data_dict, model_path='outbreak_forecast_models.joblib'):
     try:
-        models = joblib.load(model_path)
+        models = _load_model(model_path)
         
         disease = input_data_dict.get('disease_name')
         region = input_data_dict.get('region')
@@ -696,10 +1800,11 @@ def predict_outbreak_forecast(input_data_dict, model_path='outbreak_forecast_mod
 # === EMERGENCY SEVERITY PREDICTION ===
 # ===============================================
 
-def train_severity_model(csv_path='emergency_severity_data.csv', model_output_path='emergency_severity_model.joblib'):
+@_cached_training
+def train_severity_model(csv_path='emergency_severity_data.csv', model_output_path='emergency_severity_model.joblib', estimator='random_forest'):
     print(f"Starting emergency severity model training with data from {csv_path}...")
     try:
-        df = pd.read_csv(csv_path)
+        df = _load_dataset(csv_path)
         
         target = 'severity'
         numerical_features = ['population_density', 'avg_response_time_min']
@@ -734,25 +1839,22 @@ def train_severity_model(csv_path='emergency_severity_data.csv', model_output_pa
                 ('cat', categorical_transformer, categorical_features)
             ])
         
-        clf = Pipeline(steps=[
-            ('preprocessor', preprocessor),
-            ('classifier', RandomForestClassifier(random_state=42, class_weight='balanced'))
-        ])
-        
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-        
         print("Fitting severity prediction pipeline...")
-        clf.fit(X_train, y_train)
-        
-        y_pred = clf.predict(X_test)
-        print("\n--- Model: RandomForestClassifier (Severity) ---")
-        print(f"Accuracy: {accuracy_score(y_test, y_pred):.4f}")
+        preprocessor, model = _estimator_for_backend(estimator, 'classification', preprocessor, RandomForestClassifier(random_state=42, class_weight='balanced'))
+        clf, X_test_t, y_test = _fit_with_feature_cache(
+            preprocessor, model, 'classifier', X, y, test_size=0.2, random_state=42)
+        
+        y_pred = clf.named_steps['classifier'].predict(X_test_t)
+        print(f"\n--- Model: {type(clf.named_steps['classifier']).__name__} (Severity) ---")
+        accuracy = accuracy_score(y_test, y_pred)
+        print(f"Accuracy: {accuracy:.4f}")
         print("Classification Report:\n", classification_report(y_test, y_pred))
         print("Confusion Matrix:\n", confusion_matrix(y_test, y_pred))
         print("-" * 50 + "\n")
         
-        joblib.dump(clf, model_output_path)
+        _save_model(clf, model_output_path)
         print(f"Emergency severity model successfully saved to {model_output_path}")
+        return {"accuracy": round(float(accuracy), 4)}
 
     except FileNotFoundError:
         print(f"Error: The file {csv_path} was not found. Please create it first.")
@@ -761,7 +1863,7 @@ def train_severity_model(csv_path='emergency_severity_data.csv', model_output_pa
 
 def predict_severity(input_data_dict, model_path='emergency_severity_model.joblib'):
     try:
-        model = joblib.load(model_path)
+        model = _load_model(model_path)
         
         input_df = pd.DataFrame([input_data_dict])
         
@@ -780,10 +1882,11 @@ def predict_severity(input_data_dict, model_path='emergency_severity_model.jobli
 # === DONOR/ORGAN AVAILABILITY ===
 # ===============================================
 
-def train_availability_model(csv_path='donor_availability_data.csv', model_output_path='donor_availability_model.joblib'):
+@_cached_training
+def train_availability_model(csv_path='donor_availability_data.csv', model_output_path='donor_availability_model.joblib', estimator='random_forest'):
     print(f"Starting donor availability model training with data from {csv_path}...")
     try:
-        df = pd.read_csv(csv_path)
+        df = _load_dataset(csv_path)
         
         target = 'future_availability_score'
         numerical_features = ['month', 'donation_frequency', 'hospital_stock_level']
@@ -818,25 +1921,24 @@ def train_availability_model(csv_path='donor_availability_data.csv', model_outpu
                 ('cat', categorical_transformer, categorical_features)
             ])
         
-        reg = Pipeline(steps=[
-            ('preprocessor', preprocessor),
-            ('regressor', RandomForestRegressor(random_state=42, n_estimators=100))
-        ])
-        
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-        
         print("Fitting availability prediction pipeline...")
-        reg.fit(X_train, y_train)
-        
-        y_pred = reg.predict(X_test)
-        print("\n--- Model: RandomForestRegressor (Availability) ---")
-        print(f"R-squared (R2): {r2_score(y_test, y_pred):.4f}")
-        print(f"Mean Absolute Error (MAE): {mean_absolute_error(y_test, y_pred):.4f}")
-        print(f"Root Mean Squared Error (RMSE): {np.sqrt(mean_squared_error(y_test, y_pred)):.4f}")
+        preprocessor, model = _estimator_for_backend(estimator, 'regression', preprocessor, RandomForestRegressor(random_state=42, n_estimators=100))
+        reg, X_test_t, y_test = _fit_with_feature_cache(
+            preprocessor, model, 'regressor', X, y, test_size=0.2, random_state=42)
+        
+        y_pred = reg.named_steps['regressor'].predict(X_test_t)
+        print(f"\n--- Model: {type(reg.named_steps['regressor']).__name__} (Availability) ---")
+        r2 = r2_score(y_test, y_pred)
+        mae = mean_absolute_error(y_test, y_pred)
+        rmse = np.sqrt(mean_squared_error(y_test, y_pred))
+        print(f"R-squared (R2): {r2:.4f}")
+        print(f"Mean Absolute Error (MAE): {mae:.4f}")
+        print(f"Root Mean Squared Error (RMSE): {rmse:.4f}")
         print("-" * 50 + "\n")
         
-        joblib.dump(reg, model_output_path)
+        _save_model(reg, model_output_path)
         print(f"Donor availability model successfully saved to {model_output_path}")
+        return {"r2": round(float(r2), 4), "mae": round(float(mae), 4), "rmse": round(float(rmse), 4)}
 
     except FileNotFoundError:
         print(f"Error: The file {csv_path} was not found. Please create it first.")
@@ -845,7 +1947,7 @@ def train_availability_model(csv_path='donor_availability_data.csv', model_outpu
 
 def predict_availability(input_data_dict, model_path='donor_availability_model.joblib'):
     try:
-        model = joblib.load(model_path)
+        model = _load_model(model_path)
         
         input_df = pd.DataFrame([input_data_dict])
         
@@ -883,94 +1985,125 @@ def _get_discretized_state(emergency_count, capacity_percent):
         
     return (emerg_level, cap_level)
 
-def _get_reward(state, action):
-    emerg_level, cap_level = state
-    
-    if emerg_level == "Low":
-        if action == 0: return 20
-        if action == 1: return -10
-        if action == 2: return -20
-    elif emerg_level == "Medium":
-        if action == 0: return -30
-        if action == 1: return 20
-        if action == 2: return -10
-    elif emerg_level == "High":
-        if action == 0: return -50
-        if action == 1: return -30
-        if action == 2: return 20
-    
-    return -1
+ALLOCATION_ACTIONS = {0: "Send 1 Ambulance", 1: "Send 2 Ambulances", 2: "Send 3 Ambulances"}
 
-def train_allocation_model(model_output_path='allocation_q_table.joblib'):
+def _allocation_reward_table(n_emergency_bins, n_actions):
+    """
+    Reward for each (emergency bin, action). The ideal action scales with the
+    emergency bin; over-allocating costs 10 per extra ambulance, under-allocating
+    10 + 20 per missing one. With the default 3 bins this reproduces the original
+    hand-written rewards (e.g. High/Send 1 -> -50).
+    """
+    ideal = (np.arange(n_emergency_bins) * n_actions) // n_emergency_bins
+    distance = np.arange(n_actions)[None, :] - ideal[:, None]
+    return np.where(distance == 0, 20, np.where(distance > 0, -10 * distance, -(10 + 20 * -distance)))
+
+def _allocation_state_index(emergency_count, capacity_percent, region, emergency_edges, capacity_edges):
+    # Bins are right-inclusive like _get_discretized_state: <=3 Low, <=7 Medium, else High
+    emergency_bin = np.searchsorted(emergency_edges, emergency_count, side='left')
+    capacity_bin = np.searchsorted(capacity_edges, capacity_percent, side='left')
+    return region, emergency_bin, capacity_bin
+
+@_cached_training
+def train_allocation_model(model_output_path='allocation_q_table.joblib', n_episodes=1000000, n_envs=4096,
+                           emergency_edges=(3, 7), capacity_edges=(30, 70), n_regions=1,
+                           max_emergency_count=10, seed=42):
     print("Starting resource allocation model training (Q-Learning)...")
-    
-    states_emerg = ["Low", "Medium", "High"]
-    states_cap = ["Low", "Medium", "High"]
-    actions = [0, 1, 2]
-    
-    q_table = defaultdict(lambda: np.zeros(len(actions)))
-    
+
+    emergency_edges = np.asarray(emergency_edges)
+    capacity_edges = np.asarray(capacity_edges)
+    n_actions = len(ALLOCATION_ACTIONS)
+    shape = (n_regions, len(emergency_edges) + 1, len(capacity_edges) + 1)
+    n_states = int(np.prod(shape))
+
+    # Dense Q-table over integer-encoded states; rewards depend on the emergency bin only
+    q_table = np.zeros((n_states, n_actions))
+    emergency_of_state = np.unravel_index(np.arange(n_states), shape)[1]
+    rewards = _allocation_reward_table(shape[1], n_actions)[emergency_of_state]
+
     alpha = 0.1
     gamma = 0.9
     epsilon = 0.1
-    n_episodes = 10000
-    
-    print(f"Running {n_episodes} training simulations...")
-
-    for i in range(n_episodes):
-        emerg_count = random.randint(0, 10)
-        cap_percent = random.randint(0, 100)
-        state = _get_discretized_state(emerg_count, cap_percent)
-        
-        if random.uniform(0, 1) < epsilon:
-            action = random.choice(actions)
-        else:
-            action = np.argmax(q_table[state])
-            
-        reward = _get_reward(state, action)
-        
-        next_emerg_count = random.randint(0, 10)
-        next_cap_percent = random.randint(0, 100)
-        next_state = _get_discretized_state(next_emerg_count, next_cap_percent)
-        
-        old_value = q_table[state][action]
-        next_max = np.max(q_table[next_state])
-        
-        new_value = (1 - alpha) * old_value + alpha * (reward + gamma * next_max)
-        q_table[state][action] = new_value
+    rng = np.random.default_rng(seed)
+
+    def sample_states(n):
+        region = rng.integers(0, n_regions, n)
+        emergency_count = rng.integers(0, max_emergency_count + 1, n)
+        capacity_percent = rng.integers(0, 101, n)
+        return np.ravel_multi_index(
+            _allocation_state_index(emergency_count, capacity_percent, region, emergency_edges, capacity_edges), shape)
+
+    print(f"Running {n_episodes} training simulations across {n_envs} parallel environments...")
+    start = time.perf_counter()
+    states = sample_states(min(n_envs, n_episodes))
+    done = 0
+    while done < n_episodes:
+        n = min(n_envs, n_episodes - done)
+        states = states[:n]
+
+        explore = rng.random(n) < epsilon
+        actions = np.where(explore, rng.integers(0, n_actions, n), np.argmax(q_table[states], axis=1))
+        next_states = sample_states(n)
+        targets = rewards[states, actions] + gamma * np.max(q_table[next_states], axis=1)
+
+        # Environments that hit the same (state, action) in one step share a single averaged update
+        flat = states * n_actions + actions
+        counts = np.bincount(flat, minlength=q_table.size)
+        sums = np.bincount(flat, weights=targets, minlength=q_table.size)
+        visited = counts > 0
+        q_flat = q_table.reshape(-1)
+        q_flat[visited] = (1 - alpha) * q_flat[visited] + alpha * sums[visited] / counts[visited]
+
+        states = next_states
+        done += n
+    elapsed = time.perf_counter() - start
 
     print("Q-Learning training complete.")
-    
+
+    q_table = q_table.reshape(shape + (n_actions,))
     print("\n--- Model: Q-Learning (Allocation) ---")
-    print(f"Trained Q-Table with {len(q_table)} states.")
-    print("Sample of Learned Q-Table (State: [Action 0, Action 1, Action 2]):")
-    for i, (state, actions) in enumerate(q_table.items()):
-        if i >= 5: 
-            break
-        print(f"  {state}: {actions}")
+    print(f"Trained Q-Table with {n_states} states in {elapsed:.2f}s ({n_episodes / max(elapsed, 1e-9):,.0f} episodes/s).")
+    print("Sample of Learned Q-Table ((region, emergency bin, capacity bin): [Action 0, Action 1, Action 2]):")
+    for index in range(min(5, n_states)):
+        state = np.unravel_index(index, shape)
+        print(f"  {tuple(int(v) for v in state)}: {q_table[state]}")
     print("-" * 50 + "\n")
-    
-    joblib.dump(dict(q_table), model_output_path)
+
+    _save_model({
+        "q_table": q_table,
+        "emergency_edges": emergency_edges.tolist(),
+        "capacity_edges": capacity_edges.tolist(),
+        "actions": ALLOCATION_ACTIONS
+    }, model_output_path)
     print(f"Allocation Q-Table successfully saved to {model_output_path}")
+    return {"states": n_states, "episodes_per_second": round(n_episodes / max(elapsed, 1e-9))}
 
+@_cached_prediction(ttl=3600)
 def predict_allocation(input_data_dict, model_path='allocation_q_table.joblib'):
     try:
-        q_table = joblib.load(model_path)
+        model = _load_model(model_path)
         
         emerg_count = int(input_data_dict.get('emergency_count'))
         cap_percent = int(input_data_dict.get('hospital_capacity_percent'))
         
-        state = _get_discretized_state(emerg_count, cap_percent)
-        
-        if state not in q_table:
-            action_id = 0
-        else:
+        if "q_table" in model:
+            q_table = model["q_table"]
+            region = int(input_data_dict.get('region_id', 0))
+            if not 0 <= region < q_table.shape[0]:
+                return {"error": f"Unknown region_id {region}. The model was trained with {q_table.shape[0]} region(s)."}
+            state = _allocation_state_index(emerg_count, cap_percent, region,
+                                            model["emergency_edges"], model["capacity_edges"])
             action_id = np.argmax(q_table[state])
+        else:
+            # Q-tables saved before the dense format: dict keyed by (emergency, capacity) level names
+            state = _get_discretized_state(emerg_count, cap_percent)
+            if state not in model:
+                action_id = 0
+            else:
+                action_id = np.argmax(model[state])
             
-        action_map = {0: "Send 1 Ambulance", 1: "Send 2 Ambulances", 2: "Send 3 Ambulances"}
-        
         return {
-            "optimal_action": action_map.get(action_id, "Unknown Action"),
+            "optimal_action": ALLOCATION_ACTIONS.get(int(action_id), "Unknown Action"),
             "action_id": int(action_id)
         }
         
@@ -983,10 +2116,11 @@ def predict_allocation(input_data_dict, model_path='allocation_q_table.joblib'):
 # === POLICY & PERFORMANCE ===
 # ===============================================
 
+@_cached_training
 def train_policy_segmentation_model(csv_path='policy_data.csv', model_output_path='policy_segmentation_model.joblib'):
     print(f"Starting policy segmentation model training with data from {csv_path}...")
     try:
-        df = pd.read_csv(csv_path)
+        df = _load_dataset(csv_path)
         
         features = ['emergency_rate', 'avg_response_time', 'hospital_bed_occupancy']
         if not all(col in df.columns for col in features):
@@ -1013,17 +2147,19 @@ def train_policy_segmentation_model(csv_path='policy_data.csv', model_output_pat
         print(f"Cluster Centers (Scaled):\n{centers}")
         print("-" * 50 + "\n")
         
-        joblib.dump(pipeline, model_output_path)
+        _save_model(pipeline, model_output_path)
         print(f"Policy segmentation model successfully saved to {model_output_path}")
+        return {"inertia": round(float(inertia), 4)}
 
     except FileNotFoundError:
         print(f"Error: The file {csv_path} was not found. Please create it first.")
     except Exception as e:
         print(f"An error occurred during segmentation training: {e}")
 
+@_cached_prediction(ttl=600)
 def predict_policy_segmentation(input_data_dict, model_path='policy_segmentation_model.joblib'):
     try:
-        model = joblib.load(model_path)
+        model = _load_model(model_path)
         
         cluster_map = {0: "Well-Served Region", 1: "Critical-Priority Region", 2: "Stressed Region"}
         
@@ -1044,10 +2180,11 @@ def predict_policy_segmentation(input_data_dict, model_path='policy_segmentation
     except Exception as e:
         return {"error": f"An error occurred during segmentation prediction: {e}"}
 
+@_cached_training
 def train_healthcare_performance_model(csv_path='policy_data.csv', model_output_path='healthcare_performance_model.joblib'):
     print(f"Starting healthcare performance score model training with data from {csv_path}...")
     try:
-        df = pd.read_csv(csv_path)
+        df = _load_dataset(csv_path)
         
         target = 'health_outcome_score'
         features = ['emergency_rate', 'avg_response_time', 'hospital_bed_occupancy']
@@ -1077,22 +2214,27 @@ def train_healthcare_performance_model(csv_path='policy_data.csv', model_output_
         
         y_pred = pipeline.predict(X_test)
         print("\n--- Model: Linear Regression (Performance Score) ---")
-        print(f"R-squared (R2): {r2_score(y_test, y_pred):.4f}")
-        print(f"Mean Absolute Error (MAE): {mean_absolute_error(y_test, y_pred):.4f}")
-        print(f"Root Mean Squared Error (RMSE): {np.sqrt(mean_squared_error(y_test, y_pred)):.4f}")
+        r2 = r2_score(y_test, y_pred)
+        mae = mean_absolute_error(y_test, y_pred)
+        rmse = np.sqrt(mean_squared_error(y_test, y_pred))
+        print(f"R-squared (R2): {r2:.4f}")
+        print(f"Mean Absolute Error (MAE): {mae:.4f}")
+        print(f"Root Mean Squared Error (RMSE): {rmse:.4f}")
         print("-" * 50 + "\n")
         
-        joblib.dump(pipeline, model_output_path)
+        _save_model(pipeline, model_output_path)
         print(f"Healthcare performance model successfully saved to {model_output_path}")
+        return {"r2": round(float(r2), 4), "mae": round(float(mae), 4), "rmse": round(float(rmse), 4)}
 
     except FileNotFoundError:
         print(f"Error: The file {csv_path} was not found. Please create it first.")
     except Exception as e:
         print(f"An error occurred during performance model training: {e}")
 
+@_cached_prediction(ttl=600)
 def predict_healthcare_performance(input_data_dict, model_path='healthcare_performance_model.joblib'):
     try:
-        model = joblib.load(model_path)
+        model = _load_model(model_path)
         
         input_df = pd.DataFrame([input_data_dict])
         features = ['emergency_rate', 'avg_response_time', 'hospital_bed_occupancy']
@@ -1116,10 +2258,11 @@ def predict_healthcare_performance(input_data_dict, model_path='healthcare_perfo
 # === ANOMALY DETECTION ===
 # ===============================================
 
+@_cached_training
 def train_anomaly_detection_model(csv_path='anomaly_data.csv', model_output_path='anomaly_detection_model.joblib'):
     print(f"Starting anomaly detection model training with data from {csv_path}...")
     try:
-        df = pd.read_csv(csv_path)
+        df = _load_dataset(csv_path)
         
         numerical_features = ['daily_emergency_count', 'hospital_admissions', 'disease_reports']
         categorical_features = ['region']
@@ -1167,8 +2310,9 @@ def train_anomaly_detection_model(csv_path='anomaly_data.csv', model_output_path
         print(f"Detected anomalies in training data: {anomalies}")
         print("-" * 50 + "\n")
         
-        joblib.dump(pipeline, model_output_path)
+        _save_model(pipeline, model_output_path)
         print(f"Anomaly detection model successfully saved to {model_output_path}")
+        return {"rows": len(X), "anomalies": int(anomalies)}
 
     except FileNotFoundError:
         print(f"Error: The file {csv_path} was not found. Please create it first.")
@@ -1177,7 +2321,7 @@ def train_anomaly_detection_model(csv_path='anomaly_data.csv', model_output_path
 
 def predict_anomaly(input_data_dict, model_path='anomaly_detection_model.joblib'):
     try:
-        model = joblib.load(model_path)
+        model = _load_model(model_path)
         
         input_df = pd.DataFrame([input_data_dict])
         
@@ -1199,10 +2343,11 @@ def predict_anomaly(input_data_dict, model_path='anomaly_detection_model.joblib'
 # === HOSPITAL SEVERITY PREDICTION ===
 # ===============================================
 
-def train_hospital_severity_model(csv_path='hospital_severity_data.csv', model_output_path='hospital_severity_model.joblib'):
+@_cached_training
+def train_hospital_severity_model(csv_path='hospital_severity_data.csv', model_output_path='hospital_severity_model.joblib', estimator='random_forest'):
     print(f"Starting hospital severity model training with data from {csv_path}...")
     try:
-        df = pd.read_csv(csv_path)
+        df = _load_dataset(csv_path)
         
         target = 'severity'
         numerical_features = ['age', 'heart_rate', 'blood_pressure_systolic', 'distance_km']
@@ -1237,25 +2382,22 @@ def train_hospital_severity_model(csv_path='hospital_severity_data.csv', model_o
                 ('cat', categorical_transformer, categorical_features)
             ])
         
-        clf = Pipeline(steps=[
-            ('preprocessor', preprocessor),
-            ('classifier', RandomForestClassifier(random_state=42, class_weight='balanced'))
-        ])
-        
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-        
         print("Fitting hospital severity prediction pipeline...")
-        clf.fit(X_train, y_train)
-        
-        y_pred = clf.predict(X_test)
-        print("\n--- Model: RandomForestClassifier (Hospital Severity) ---")
-        print(f"Accuracy: {accuracy_score(y_test, y_pred):.4f}")
+        preprocessor, model = _estimator_for_backend(estimator, 'classification', preprocessor, RandomForestClassifier(random_state=42, class_weight='balanced'))
+        clf, X_test_t, y_test = _fit_with_feature_cache(
+            preprocessor, model, 'classifier', X, y, test_size=0.2, random_state=42)
+        
+        y_pred = clf.named_steps['classifier'].predict(X_test_t)
+        print(f"\n--- Model: {type(clf.named_steps['classifier']).__name__} (Hospital Severity) ---")
+        accuracy = accuracy_score(y_test, y_pred)
+        print(f"Accuracy: {accuracy:.4f}")
         print("Classification Report:\n", classification_report(y_test, y_pred))
         print("Confusion Matrix:\n", confusion_matrix(y_test, y_pred))
         print("-" * 50 + "\n")
         
-        joblib.dump(clf, model_output_path)
+        _save_model(clf, model_output_path)
         print(f"Hospital severity model successfully saved to {model_output_path}")
+        return {"accuracy": round(float(accuracy), 4)}
 
     except FileNotFoundError:
         print(f"Error: The file {csv_path} was not found. Please create it first.")
@@ -1264,7 +2406,7 @@ def train_hospital_severity_model(csv_path='hospital_severity_data.csv', model_o
 
 def predict_hospital_severity(input_data_dict, model_path='hospital_severity_model.joblib'):
     try:
-        model = joblib.load(model_path)
+        model = _load_model(model_path)
         
         input_df = pd.DataFrame([input_data_dict])
         
@@ -1301,10 +2443,11 @@ def _get_city_graph():
     G.add_weighted_edges_from(edges)
     return G
 
-def train_eta_model(csv_path='eta_data.csv', model_output_path='eta_model.joblib'):
+@_cached_training
+def train_eta_model(csv_path='eta_data.csv', model_output_path='eta_model.joblib', estimator='random_forest', id_encoding='onehot'):
     print(f"Starting ETA model training with data from {csv_path}...")
     try:
-        df = pd.read_csv(csv_path)
+        df = _load_dataset(csv_path)
         
         target = 'traffic_multiplier'
         numerical_features = ['hour']
@@ -1327,10 +2470,7 @@ def train_eta_model(csv_path='eta_data.csv', model_output_path='eta_model.joblib
             ('imputer', SimpleImputer(strategy='median'))
         ])
         
-        categorical_transformer = Pipeline(steps=[
-            ('imputer', SimpleImputer(strategy='constant', fill_value='missing')),
-            ('onehot', OneHotEncoder(handle_unknown='ignore'))
-        ])
+        categorical_transformer = _id_column_transformer(id_encoding, fill_value='missing')
         
         preprocessor = ColumnTransformer(
             transformers=[
@@ -1338,34 +2478,34 @@ def train_eta_model(csv_path='eta_data.csv', model_output_path='eta_model.joblib
                 ('cat', categorical_transformer, categorical_features)
             ])
         
-        reg = Pipeline(steps=[
-            ('preprocessor', preprocessor),
-            ('regressor', RandomForestRegressor(random_state=42, n_estimators=100))
-        ])
-        
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-        
-        print("Fitting ETA prediction pipeline...")
-        reg.fit(X_train, y_train)
-        
-        y_pred = reg.predict(X_test)
-        print("\n--- Model: RandomForestRegressor (ETA Traffic) ---")
-        print(f"R-squared (R2): {r2_score(y_test, y_pred):.4f}")
-        print(f"Mean Absolute Error (MAE): {mean_absolute_error(y_test, y_pred):.4f}")
-        print(f"Root Mean Squared Error (RMSE): {np.sqrt(mean_squared_error(y_test, y_pred)):.4f}")
+        print(f"Fitting ETA prediction pipeline (region encoding: {id_encoding})...")
+        preprocessor, model = _estimator_for_backend(estimator, 'regression', preprocessor, RandomForestRegressor(random_state=42, n_estimators=100))
+        reg, X_test_t, y_test = _fit_with_feature_cache(
+            preprocessor, model, 'regressor', X, y, test_size=0.2, random_state=42)
+        
+        y_pred = reg.named_steps['regressor'].predict(X_test_t)
+        print(f"\n--- Model: {type(reg.named_steps['regressor']).__name__} (ETA Traffic) ---")
+        r2 = r2_score(y_test, y_pred)
+        mae = mean_absolute_error(y_test, y_pred)
+        rmse = np.sqrt(mean_squared_error(y_test, y_pred))
+        print(f"R-squared (R2): {r2:.4f}")
+        print(f"Mean Absolute Error (MAE): {mae:.4f}")
+        print(f"Root Mean Squared Error (RMSE): {rmse:.4f}")
         print("-" * 50 + "\n")
         
-        joblib.dump(reg, model_output_path)
+        _save_model(reg, model_output_path)
         print(f"ETA model successfully saved to {model_output_path}")
+        return {"r2": round(float(r2), 4), "mae": round(float(mae), 4), "rmse": round(float(rmse), 4)}
 
     except FileNotFoundError:
         print(f"Error: The file {csv_path} was not found. Please create it first.")
     except Exception as e:
         print(f"An error occurred during ETA model training: {e}")
 
+@_cached_prediction(ttl=300)
 def predict_eta_route(input_data_dict, model_path='eta_model.joblib'):
     try:
-        model = joblib.load(model_path)
+        model = _load_model(model_path)
         G = _get_city_graph()
         
         start_node = input_data_dict.get('start_node')
@@ -1397,14 +2537,118 @@ def predict_eta_route(input_data_dict, model_path='eta_model.joblib'):
     except Exception as e:
         return {"error": f"An error occurred during ETA prediction: {e}"}
 
+# ===============================================
+# === MULTI-INCIDENT DISPATCH ===
+# ===============================================
+
+SEVERITY_WEIGHTS = {"Low": 1.0, "Medium": 2.0, "High": 4.0, "Critical": 8.0}
+
+def _severity_weight(severity):
+    # Accepts the Low/Medium/High/Critical labels used by the severity models or a numeric weight
+    if isinstance(severity, str) and severity in SEVERITY_WEIGHTS:
+        return SEVERITY_WEIGHTS[severity]
+    return float(severity if severity is not None else SEVERITY_WEIGHTS["Medium"])
+
+def optimize_dispatch(input_data_dict, model_path='eta_model.joblib'):
+    """
+    Jointly assigns available ambulances to open incidents.
+    input_data_dict: {"incidents": [{"id", "location", "severity", "units" (optional, default 1)}],
+                      "ambulances": [{"id", "location"}], "hour": 12}
+    Locations are city graph nodes. The cost of sending ambulance a to incident
+    slot i is its ETA (shortest path x predicted traffic multiplier) times the
+    incident's severity weight; extra units for the same incident get halved
+    weights so every incident is covered before any gets a second unit. One
+    dummy column per slot prices leaving it unserved above any travel cost, so
+    when ambulances run short the lowest-severity slots are the ones dropped.
+    """
+    try:
+        incidents = input_data_dict.get('incidents') or []
+        ambulances = input_data_dict.get('ambulances') or []
+        hour = int(input_data_dict.get('hour', 12))
+        if not incidents or not ambulances:
+            return {"error": "Provide non-empty 'incidents' and 'ambulances' lists."}
+
+        start = time.perf_counter()
+        G = _get_city_graph()
+        nodes = list(G.nodes())
+        node_index = {node: i for i, node in enumerate(nodes)}
+        unknown = sorted({str(item.get('location')) for item in incidents + ambulances} - set(node_index))
+        if unknown:
+            return {"error": f"Invalid location(s) {unknown}. Must be one of: {nodes}"}
+
+        # All-pairs shortest travel times once for the (small) city graph; inf where unreachable
+        base_minutes = nx.floyd_warshall_numpy(G, nodelist=nodes, weight='weight')
+
+        amb_nodes = np.array([node_index[a['location']] for a in ambulances])
+        slots = [(i, unit) for i, incident in enumerate(incidents) for unit in range(max(1, int(incident.get('units', 1))))]
+        slot_incident = np.array([i for i, _ in slots])
+        slot_nodes = np.array([node_index[incidents[i]['location']] for i in slot_incident])
+        slot_weights = np.array([_severity_weight(incidents[i].get('severity')) * 0.5 ** unit for i, unit in slots])
+
+        # One batched traffic prediction for every distinct (ambulance node, incident node) pair
+        start_nodes, end_nodes = np.unique(amb_nodes), np.unique(slot_nodes)
+        pairs = np.stack([np.repeat(start_nodes, len(end_nodes)), np.tile(end_nodes, len(start_nodes))], axis=1)
+        model = _load_model(model_path)
+        traffic = model.predict(pd.DataFrame({
+            'hour': hour,
+            'start_region': [nodes[a] for a in pairs[:, 0]],
+            'end_region': [nodes[b] for b in pairs[:, 1]]
+        }))
+        multiplier = np.ones((len(nodes), len(nodes)))
+        multiplier[pairs[:, 0], pairs[:, 1]] = traffic
+
+        eta = (base_minutes * multiplier)[np.ix_(amb_nodes, slot_nodes)].T   # slots x ambulances
+        cost = eta * slot_weights[:, None]
+
+        finite_eta = eta[np.isfinite(eta)]
+        unserved_cost = (finite_eta.max() if finite_eta.size else 1.0) * len(slots) + 1.0
+        dummy = np.full((len(slots), len(slots)), np.inf)
+        np.fill_diagonal(dummy, unserved_cost * slot_weights)
+        rows, cols = linear_sum_assignment(np.hstack([cost, dummy]))
+
+        assignments = []
+        served_units = np.zeros(len(incidents), dtype=int)
+        used_ambulances = set()
+        for slot, col in zip(rows, cols):
+            if col >= len(ambulances):
+                continue
+            incident = incidents[slot_incident[slot]]
+            served_units[slot_incident[slot]] += 1
+            used_ambulances.add(col)
+            assignments.append({
+                "incident_id": incident.get('id'),
+                "ambulance_id": ambulances[col].get('id'),
+                "severity": incident.get('severity'),
+                "eta_minutes": round(float(eta[slot, col]), 2)
+            })
+        assignments.sort(key=lambda a: (-_severity_weight(a["severity"]), a["eta_minutes"]))
+
+        return {
+            "assignments": assignments,
+            "unassigned_incidents": [
+                {"incident_id": incident.get('id'), "missing_units": max(1, int(incident.get('units', 1))) - int(served)}
+                for incident, served in zip(incidents, served_units)
+                if served < max(1, int(incident.get('units', 1)))
+            ],
+            "idle_ambulances": [a.get('id') for i, a in enumerate(ambulances) if i not in used_ambulances],
+            "total_weighted_eta": round(float(sum(cost[r, c] for r, c in zip(rows, cols) if c < len(ambulances))), 2),
+            "solve_ms": round((time.perf_counter() - start) * 1000, 1)
+        }
+
+    except FileNotFoundError:
+        return {"error": "Model file (eta_model.joblib) not found. Please train the model first."}
+    except Exception as e:
+        return {"error": f"An error occurred during dispatch optimization: {e}"}
+
 # ===============================================
 # === HOSPITAL BED FORECAST ===
 # ===============================================
 
-def train_bed_forecast_model(csv_path='hospital_resource_data.csv', model_output_path='bed_forecast_model.joblib'):
+@_cached_training
+def train_bed_forecast_model(csv_path='hospital_resource_data.csv', model_output_path='bed_forecast_model.joblib', id_encoding='onehot'):
     print(f"Starting bed forecast model training with data from {csv_path}...")
     try:
-        df = pd.read_csv(csv_path)
+        df = _load_dataset(csv_path)
         
         target = 'next_week_bed_demand'
         numerical_features = ['emergency_count', 'disease_case_count', 'current_bed_occupancy']
@@ -1428,10 +2672,7 @@ def train_bed_forecast_model(csv_path='hospital_resource_data.csv', model_output
             ('scaler', StandardScaler())
         ])
         
-        categorical_transformer = Pipeline(steps=[
-            ('imputer', SimpleImputer(strategy='constant', fill_value=0)), 
-            ('onehot', OneHotEncoder(handle_unknown='ignore'))
-        ])
+        categorical_transformer = _id_column_transformer(id_encoding, fill_value=0)
         
         preprocessor = ColumnTransformer(
             transformers=[
@@ -1439,25 +2680,23 @@ def train_bed_forecast_model(csv_path='hospital_resource_data.csv', model_output
                 ('cat', categorical_transformer, categorical_features)
             ])
         
-        reg = Pipeline(steps=[
-            ('preprocessor', preprocessor),
-            ('regressor', LinearRegression())
-        ])
-        
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-        
-        print("Fitting bed forecast pipeline...")
-        reg.fit(X_train, y_train)
+        print(f"Fitting bed forecast pipeline (hospital_id encoding: {id_encoding})...")
+        reg, X_test_t, y_test = _fit_with_feature_cache(
+            preprocessor, LinearRegression(), 'regressor', X, y, test_size=0.2, random_state=42)
         
-        y_pred = reg.predict(X_test)
+        y_pred = reg.named_steps['regressor'].predict(X_test_t)
         print("\n--- Model: Linear Regression (Bed Forecast) ---")
-        print(f"R-squared (R2): {r2_score(y_test, y_pred):.4f}")
-        print(f"Mean Absolute Error (MAE): {mean_absolute_error(y_test, y_pred):.4f}")
-        print(f"Root Mean Squared Error (RMSE): {np.sqrt(mean_squared_error(y_test, y_pred)):.4f}")
+        r2 = r2_score(y_test, y_pred)
+        mae = mean_absolute_error(y_test, y_pred)
+        rmse = np.sqrt(mean_squared_error(y_test, y_pred))
+        print(f"R-squared (R2): {r2:.4f}")
+        print(f"Mean Absolute Error (MAE): {mae:.4f}")
+        print(f"Root Mean Squared Error (RMSE): {rmse:.4f}")
         print("-" * 50 + "\n")
         
-        joblib.dump(reg, model_output_path)
+        _save_model(reg, model_output_path)
         print(f"Bed forecast model successfully saved to {model_output_path}")
+        return {"r2": round(float(r2), 4), "mae": round(float(mae), 4), "rmse": round(float(rmse), 4)}
 
     except FileNotFoundError:
         print(f"Error: The file {csv_path} was not found. Please create it first.")
@@ -1466,7 +2705,7 @@ def train_bed_forecast_model(csv_path='hospital_resource_data.csv', model_output
 
 def predict_bed_forecast(input_data_dict, model_path='bed_forecast_model.joblib'):
     try:
-        model = joblib.load(model_path)
+        model = _load_model(model_path)
         
         input_df = pd.DataFrame([input_data_dict])
         
@@ -1487,10 +2726,11 @@ def predict_bed_forecast(input_data_dict, model_path='bed_forecast_model.joblib'
 # === STAFF ALLOCATION ===
 # ===============================================
 
+@_cached_training
 def train_staff_allocation_model(csv_path='staff_allocation_data.csv', model_output_path='staff_allocation_model.joblib'):
     print(f"Starting staff allocation model training with data from {csv_path}...")
     try:
-        df = pd.read_csv(csv_path)
+        df = _load_dataset(csv_path)
         
         target = 'allocation_decision'
         categorical_features = ['patient_load', 'department', 'shift']
@@ -1518,34 +2758,107 @@ def train_staff_allocation_model(csv_path='staff_allocation_data.csv', model_out
                 ('cat', categorical_transformer, categorical_features)
             ])
         
-        clf = Pipeline(steps=[
-            ('preprocessor', preprocessor),
-            ('classifier', DecisionTreeClassifier(random_state=42, class_weight='balanced'))
-        ])
-        
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-        
         print("Fitting staff allocation pipeline...")
-        clf.fit(X_train, y_train)
+        clf, X_test_t, y_test = _fit_with_feature_cache(
+            preprocessor, DecisionTreeClassifier(random_state=42, class_weight='balanced'), 'classifier', X, y, test_size=0.2, random_state=42)
         
-        y_pred = clf.predict(X_test)
+        y_pred = clf.named_steps['classifier'].predict(X_test_t)
         print("\n--- Model: DecisionTreeClassifier (Staff Allocation) ---")
-        print(f"Accuracy: {accuracy_score(y_test, y_pred):.4f}")
+        accuracy = accuracy_score(y_test, y_pred)
+        print(f"Accuracy: {accuracy:.4f}")
         print("Classification Report:\n", classification_report(y_test, y_pred))
         print("Confusion Matrix:\n", confusion_matrix(y_test, y_pred))
         print("-" * 50 + "\n")
         
-        joblib.dump(clf, model_output_path)
+        _save_model(clf, model_output_path)
         print(f"Staff allocation model successfully saved to {model_output_path}")
+        entries = compile_staff_allocation_lookup(model_output_path)
+        return {"accuracy": round(float(accuracy), 4), "lookup_entries": entries}
 
     except FileNotFoundError:
         print(f"Error: The file {csv_path} was not found. Please create it first.")
     except Exception as e:
         print(f"An error occurred during staff allocation model training: {e}")
 
-def predict_staff_allocation(input_data_dict, model_path='staff_allocation_model.joblib'):
+STAFF_ALLOCATION_FEATURES = ['patient_load', 'department', 'shift']
+
+def _staff_lookup_path(model_path):
+    return os.path.splitext(model_path)[0] + '.lookup.json'
+
+def _staff_lookup_key(values):
+    return "|".join(str(value) for value in values)
+
+def compile_staff_allocation_lookup(model_path='staff_allocation_model.joblib', lookup_path=None):
+    """
+    Every input of the staff allocation tree is categorical, so the model is a
+    finite function: enumerate the cartesian product of the categories seen in
+    training, predict it in one batch and store the decisions as a JSON hash
+    table next to the model. Returns the number of entries written.
+    """
+    lookup_path = lookup_path or _staff_lookup_path(model_path)
     try:
         model = joblib.load(model_path)
+        onehot = model.named_steps['preprocessor'].named_transformers_['cat'].named_steps['onehot']
+        categories = [[str(value) for value in feature_categories] for feature_categories in onehot.categories_]
+
+        combinations = list(itertools.product(*categories))
+        decisions = model.predict(pd.DataFrame(combinations, columns=STAFF_ALLOCATION_FEATURES))
+    except FileNotFoundError:
+        print(f"Error: The model file {model_path} was not found. Please train the model first.")
+        return
+    except Exception as e:
+        print(f"An error occurred while compiling the staff allocation lookup: {e}")
+        return
+
+    lookup = {
+        "features": STAFF_ALLOCATION_FEATURES,
+        "categories": dict(zip(STAFF_ALLOCATION_FEATURES, categories)),
+        # Ties the table to the exact model file it was compiled from
+        "model_sha256": _file_sha256(model_path),
+        "decisions": {_staff_lookup_key(combo): str(decision) for combo, decision in zip(combinations, decisions)}
+    }
+    # Write-then-rename, so a predictor reading the table never sees half of it
+    tmp_path = f"{lookup_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(lookup, f)
+    os.replace(tmp_path, lookup_path)
+    print(f"Staff allocation lookup ({len(combinations)} entries) saved to {lookup_path}")
+    return len(combinations)
+
+# Parsed lookup tables keyed by model path: ((model version, table version), table or None)
+_STAFF_LOOKUP_CACHE = {}
+
+def _load_staff_lookup(model_path):
+    # Returns None when the table is missing or was compiled from another model file.
+    # Reading and hashing happen only when the model or the table file changes.
+    lookup_path = _staff_lookup_path(model_path)
+    version = (_model_version(model_path), _model_version(lookup_path))
+    cached = _STAFF_LOOKUP_CACHE.get(model_path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    try:
+        with open(lookup_path) as f:
+            lookup = json.load(f)
+        if lookup.get("model_sha256") != _file_sha256(model_path):
+            lookup = None
+    except (OSError, ValueError):
+        lookup = None
+    _STAFF_LOOKUP_CACHE[model_path] = (version, lookup)
+    return lookup
+
+@_cached_prediction(ttl=600)
+def predict_staff_allocation(input_data_dict, model_path='staff_allocation_model.joblib'):
+    try:
+        lookup = _load_staff_lookup(model_path)
+        if lookup is not None:
+            key = _staff_lookup_key(input_data_dict.get(feature) for feature in STAFF_ALLOCATION_FEATURES)
+            if key in lookup["decisions"]:
+                return {
+                    "allocation_decision": lookup["decisions"][key]
+                }
+
+        # Unseen categories (or no compiled table) fall back to the tree
+        model = _load_model(model_path)
         
         input_df = pd.DataFrame([input_data_dict])
         
@@ -1560,14 +2873,62 @@ def predict_staff_allocation(input_data_dict, model_path='staff_allocation_model
     except Exception as e:
         return {"error": f"An error occurred during staff allocation prediction: {e}"}
 
+def predict_staff_rota(input_data_dict, model_path='staff_allocation_model.joblib'):
+    """
+    Allocation decisions for every department x shift in one call.
+    input_data_dict: {"patient_load": "High" or {"ER": "High", ...},
+                      "departments": [...], "shifts": [...]}  (lists default to all known values)
+    """
+    try:
+        lookup = _load_staff_lookup(model_path)
+        known = lookup["categories"] if lookup is not None else {}
+        patient_load = input_data_dict.get('patient_load')
+        if patient_load is None:
+            return {"error": "Missing 'patient_load' (a value, or an object keyed by department)."}
+
+        default_departments = list(patient_load) if isinstance(patient_load, dict) else known.get('department')
+        departments = input_data_dict.get('departments') or default_departments
+        shifts = input_data_dict.get('shifts') or known.get('shift')
+        if not departments or not shifts:
+            return {"error": "Provide 'departments' and 'shifts' (or compile the staff allocation lookup first)."}
+
+        rota = []
+        for department in departments:
+            load = patient_load.get(department) if isinstance(patient_load, dict) else patient_load
+            for shift in shifts:
+                rota.append({"department": department, "shift": shift, "patient_load": load})
+
+        decisions = lookup["decisions"] if lookup is not None else {}
+        missing = [entry for entry in rota
+                   if _staff_lookup_key(entry[feature] for feature in STAFF_ALLOCATION_FEATURES) not in decisions]
+        fallback = []
+        if missing:
+            model = _load_model(model_path)
+            fallback = model.predict(pd.DataFrame(missing, columns=STAFF_ALLOCATION_FEATURES))
+        for entry, decision in zip(missing, fallback):
+            entry["allocation_decision"] = str(decision)
+        for entry in rota:
+            if "allocation_decision" not in entry:
+                entry["allocation_decision"] = decisions[_staff_lookup_key(entry[feature] for feature in STAFF_ALLOCATION_FEATURES)]
+
+        return {
+            "rota": rota
+        }
+
+    except FileNotFoundError:
+        return {"error": "Model file (staff_allocation_model.joblib) not found. Please train the model first."}
+    except Exception as e:
+        return {"error": f"An error occurred during staff rota prediction: {e}"}
+
 # ===============================================
 # === HOSPITAL PERFORMANCE ===
 # ===============================================
 
+@_cached_training
 def train_hospital_performance_model(csv_path='hospital_performance_data.csv', model_output_path='hospital_performance_model.joblib'):
     print(f"Starting hospital performance model training with data from {csv_path}...")
     try:
-        df = pd.read_csv(csv_path)
+        df = _load_dataset(csv_path)
         
         features = ['avg_response_time', 'treatment_success_rate', 'patient_satisfaction', 'resource_utilization']
         
@@ -1600,8 +2961,9 @@ def train_hospital_performance_model(csv_path='hospital_performance_data.csv', m
         print("Note: Review centers to map clusters. e.g., low response_time + high success_rate = 'High-performing'")
         print("-" * 50 + "\n")
         
-        joblib.dump(pipeline, model_output_path)
+        _save_model(pipeline, model_output_path)
         print(f"Hospital performance model successfully saved to {model_output_path}")
+        return {"inertia": round(float(inertia), 4)}
 
     except FileNotFoundError:
         print(f"Error: The file {csv_path} was not found. Please create it first.")
@@ -1610,7 +2972,7 @@ def train_hospital_performance_model(csv_path='hospital_performance_data.csv', m
 
 def predict_hospital_performance(input_data_dict, model_path='hospital_performance_model.joblib'):
     try:
-        model = joblib.load(model_path)
+        model = _load_model(model_path)
         
         cluster_map = {0: "Needs Improvement", 1: "High-performing", 2: "Average"}
         
@@ -1635,10 +2997,11 @@ def predict_hospital_performance(input_data_dict, model_path='hospital_performan
 # === PATIENT OUTCOME PREDICTION ===
 # ===============================================
 
+@_cached_training
 def train_recovery_model(csv_path='patient_outcome_data.csv', model_output_path='recovery_model.joblib'):
     print(f"Starting recovery probability model training with data from {csv_path}...")
     try:
-        df = pd.read_csv(csv_path)
+        df = _load_dataset(csv_path)
         
         target = 'recovered'
         numerical_features = ['age', 'bmi', 'heart_rate', 'blood_pressure']
@@ -1673,25 +3036,21 @@ def train_recovery_model(csv_path='patient_outcome_data.csv', model_output_path=
                 ('cat', categorical_transformer, categorical_features)
             ])
         
-        clf = Pipeline(steps=[
-            ('preprocessor', preprocessor),
-            ('classifier', LogisticRegression(random_state=42, class_weight='balanced'))
-        ])
-        
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-        
         print("Fitting recovery probability pipeline...")
-        clf.fit(X_train, y_train)
+        clf, X_test_t, y_test = _fit_with_feature_cache(
+            preprocessor, LogisticRegression(random_state=42, class_weight='balanced'), 'classifier', X, y, test_size=0.2, random_state=42)
         
-        y_pred = clf.predict(X_test)
+        y_pred = clf.named_steps['classifier'].predict(X_test_t)
         print("\n--- Model: Logistic Regression (Recovery Probability) ---")
-        print(f"Accuracy: {accuracy_score(y_test, y_pred):.4f}")
+        accuracy = accuracy_score(y_test, y_pred)
+        print(f"Accuracy: {accuracy:.4f}")
         print("Classification Report:\n", classification_report(y_test, y_pred))
         print("Confusion Matrix:\n", confusion_matrix(y_test, y_pred))
         print("-" * 50 + "\n")
         
-        joblib.dump(clf, model_output_path)
+        _save_model(clf, model_output_path)
         print(f"Recovery probability model successfully saved to {model_output_path}")
+        return {"accuracy": round(float(accuracy), 4)}
 
     except FileNotFoundError:
         print(f"Error: The file {csv_path} was not found. Please create it first.")
@@ -1700,7 +3059,7 @@ def train_recovery_model(csv_path='patient_outcome_data.csv', model_output_path=
 
 def predict_recovery(input_data_dict, model_path='recovery_model.joblib'):
     try:
-        model = joblib.load(model_path)
+        model = _load_model(model_path)
         
         input_df = pd.DataFrame([input_data_dict])
         
@@ -1715,10 +3074,11 @@ def predict_recovery(input_data_dict, model_path='recovery_model.joblib'):
     except Exception as e:
         return {"error": f"An error occurred during recovery prediction: {e}"}
 
-def train_stay_duration_model(csv_path='patient_outcome_data.csv', model_output_path='stay_duration_model.joblib'):
+@_cached_training
+def train_stay_duration_model(csv_path='patient_outcome_data.csv', model_output_path='stay_duration_model.joblib', estimator='random_forest'):
     print(f"Starting stay duration model training with data from {csv_path}...")
     try:
-        df = pd.read_csv(csv_path)
+        df = _load_dataset(csv_path)
         
         target = 'stay_duration_days'
         numerical_features = ['age', 'bmi', 'heart_rate', 'blood_pressure']
@@ -1753,25 +3113,24 @@ def train_stay_duration_model(csv_path='patient_outcome_data.csv', model_output_
                 ('cat', categorical_transformer, categorical_features)
             ])
         
-        reg = Pipeline(steps=[
-            ('preprocessor', preprocessor),
-            ('regressor', RandomForestRegressor(random_state=42, n_estimators=100))
-        ])
-        
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-        
         print("Fitting stay duration pipeline...")
-        reg.fit(X_train, y_train)
-        
-        y_pred = reg.predict(X_test)
-        print("\n--- Model: RandomForestRegressor (Stay Duration) ---")
-        print(f"R-squared (R2): {r2_score(y_test, y_pred):.4f}")
-        print(f"Mean Absolute Error (MAE): {mean_absolute_error(y_test, y_pred):.4f}")
-        print(f"Root Mean Squared Error (RMSE): {np.sqrt(mean_squared_error(y_test, y_pred)):.4f}")
+        preprocessor, model = _estimator_for_backend(estimator, 'regression', preprocessor, RandomForestRegressor(random_state=42, n_estimators=100))
+        reg, X_test_t, y_test = _fit_with_feature_cache(
+            preprocessor, model, 'regressor', X, y, test_size=0.2, random_state=42)
+        
+        y_pred = reg.named_steps['regressor'].predict(X_test_t)
+        print(f"\n--- Model: {type(reg.named_steps['regressor']).__name__} (Stay Duration) ---")
+        r2 = r2_score(y_test, y_pred)
+        mae = mean_absolute_error(y_test, y_pred)
+        rmse = np.sqrt(mean_squared_error(y_test, y_pred))
+        print(f"R-squared (R2): {r2:.4f}")
+        print(f"Mean Absolute Error (MAE): {mae:.4f}")
+        print(f"Root Mean Squared Error (RMSE): {rmse:.4f}")
         print("-" * 50 + "\n")
         
-        joblib.dump(reg, model_output_path)
+        _save_model(reg, model_output_path)
         print(f"Stay duration model successfully saved to {model_output_path}")
+        return {"r2": round(float(r2), 4), "mae": round(float(mae), 4), "rmse": round(float(rmse), 4)}
 
     except FileNotFoundError:
         print(f"Error: The file {csv_path} was not found. Please create it first.")
@@ -1780,7 +3139,7 @@ def train_stay_duration_model(csv_path='patient_outcome_data.csv', model_output_
 
 def predict_stay_duration(input_data_dict, model_path='stay_duration_model.joblib'):
     try:
-        model = joblib.load(model_path)
+        model = _load_model(model_path)
         
         # Ensure all required columns are present in correct order
         required_columns = ['age', 'bmi', 'heart_rate', 'blood_pressure', 'diagnosis', 'treatment_type']
@@ -1802,14 +3161,172 @@ def predict_stay_duration(input_data_dict, model_path='stay_duration_model.jobli
     except Exception as e:
         return {"error": f"An error occurred during stay duration prediction: {e}"}
 
+PATIENT_OUTCOME_FEATURES = ['age', 'bmi', 'heart_rate', 'blood_pressure', 'diagnosis', 'treatment_type']
+
+@_cached_training
+def train_patient_outcome_model(csv_path='patient_outcome_data.csv', model_output_path='patient_outcome_model.joblib', estimator='random_forest'):
+    """
+    Recovery and stay-duration heads sharing one fitted preprocessor, so a
+    patient row is transformed once for both predictions.
+    """
+    print(f"Starting combined patient outcome model training with data from {csv_path}...")
+    try:
+        df = _load_dataset(csv_path)
+        
+        targets = ['recovered', 'stay_duration_days']
+        numerical_features = ['age', 'bmi', 'heart_rate', 'blood_pressure']
+        categorical_features = ['diagnosis', 'treatment_type']
+        
+        required_cols = numerical_features + categorical_features + targets
+        if not all(col in df.columns for col in required_cols):
+            print(f"Error: CSV must contain all of these columns: {required_cols}")
+            return
+            
+        df = df.dropna(subset=required_cols)
+        if df.empty:
+            print("Error: No data to train on after cleaning.")
+            return
+
+        X = df[numerical_features + categorical_features]
+        y = df[targets]
+        
+        numeric_transformer = Pipeline(steps=[
+            ('imputer', SimpleImputer(strategy='median')),
+            ('scaler', StandardScaler())
+        ])
+        
+        categorical_transformer = Pipeline(steps=[
+            ('imputer', SimpleImputer(strategy='constant', fill_value='missing')),
+            ('onehot', OneHotEncoder(handle_unknown='ignore'))
+        ])
+        
+        preprocessor = ColumnTransformer(
+            transformers=[
+                ('num', numeric_transformer, numerical_features),
+                ('cat', categorical_transformer, categorical_features)
+            ])
+        
+        print("Fitting shared patient outcome preprocessor...")
+        preprocessor, stay_model = _estimator_for_backend(estimator, 'regression', preprocessor, RandomForestRegressor(random_state=42, n_estimators=100))
+        matrices = build_feature_matrices(preprocessor, X, y, test_size=0.2, random_state=42)
+        X_train, X_test = matrices["X_train"], matrices["X_test"]
+        y_train, y_test = matrices["y_train"], matrices["y_test"]
+
+        recovery_model = LogisticRegression(random_state=42, class_weight='balanced').fit(X_train, y_train[:, 0])
+        stay_model.fit(X_train, y_train[:, 1])
+        
+        recovery_pred = recovery_model.predict(X_test)
+        print("\n--- Model: Logistic Regression (Recovery Head) ---")
+        accuracy = accuracy_score(y_test[:, 0], recovery_pred)
+        print(f"Accuracy: {accuracy:.4f}")
+        print("Classification Report:\n", classification_report(y_test[:, 0], recovery_pred))
+        
+        stay_pred = stay_model.predict(X_test)
+        print(f"\n--- Model: {type(stay_model).__name__} (Stay Duration Head) ---")
+        r2 = r2_score(y_test[:, 1], stay_pred)
+        mae = mean_absolute_error(y_test[:, 1], stay_pred)
+        rmse = np.sqrt(mean_squared_error(y_test[:, 1], stay_pred))
+        print(f"R-squared (R2): {r2:.4f}")
+        print(f"Mean Absolute Error (MAE): {mae:.4f}")
+        print(f"Root Mean Squared Error (RMSE): {rmse:.4f}")
+        print("-" * 50 + "\n")
+        
+        _save_model({
+            "preprocessor": matrices["preprocessor"],
+            "recovery": recovery_model,
+            "stay_duration": stay_model
+        }, model_output_path)
+        print(f"Patient outcome model successfully saved to {model_output_path}")
+        return {
+            "recovery_accuracy": round(float(accuracy), 4),
+            "stay_r2": round(float(r2), 4),
+            "stay_mae": round(float(mae), 4),
+            "stay_rmse": round(float(rmse), 4)
+        }
+
+    except FileNotFoundError:
+        print(f"Error: The file {csv_path} was not found. Please create it first.")
+    except Exception as e:
+        print(f"An error occurred during patient outcome model training: {e}")
+
+def predict_patient_outcome(input_data_dict, model_path='patient_outcome_model.joblib',
+                            recovery_model_path='recovery_model.joblib', stay_model_path='stay_duration_model.joblib'):
+    """
+    Recovery probability and predicted stay for one patient, or for
+    {"patients": [...]} in a single transform + two vectorized head calls.
+    Until the combined model is trained, the separate recovery and stay
+    pipelines are used instead (still one process, one batch); a head whose
+    model fails reports "recovery_error" or "stay_error" and the other head
+    still answers.
+    """
+    try:
+        patients = input_data_dict.get('patients')
+        rows = patients if patients is not None else [input_data_dict]
+        if not rows:
+            return {"patients": []}
+        input_df = pd.DataFrame([{col: row.get(col) for col in PATIENT_OUTCOME_FEATURES} for row in rows])
+        
+        # A cached entry counts too: the ML server smoke-tests a candidate under a scratch path
+        if model_path in _MODEL_CACHE or os.path.exists(model_path):
+            model = _load_model(model_path)
+            features = model["preprocessor"].transform(input_df)
+            heads = {
+                "recovery": model["recovery"].predict_proba(features)[:, 1],
+                "stay": model["stay_duration"].predict(features)
+            }
+            errors = {}
+        else:
+            heads, errors = {}, {}
+            for head, head_path, name in (("recovery", recovery_model_path, "recovery"),
+                                          ("stay", stay_model_path, "stay duration")):
+                try:
+                    head_model = _load_model(head_path)
+                    heads[head] = (head_model.predict_proba(input_df)[:, 1] if head == "recovery"
+                                   else head_model.predict(input_df))
+                except FileNotFoundError as e:
+                    errors[head] = f"Model file ({os.path.basename(e.filename or head_path)}) not found. Please train the model first."
+                except Exception as e:
+                    errors[head] = f"An error occurred during {name} prediction: {e}"
+            if not heads:
+                return {"error": errors["recovery"]}
+        
+        results = [{} for _ in rows]
+        if "recovery" in heads:
+            for result, probability in zip(results, heads["recovery"]):
+                result["recovery_probability"] = round(float(probability), 4)
+        else:
+            for result in results:
+                result["recovery_error"] = errors["recovery"]
+        if "stay" in heads:
+            predicted_days = np.maximum(1, np.round(heads["stay"])).astype(int)
+            for result, days in zip(results, predicted_days):
+                result["predicted_stay_days"] = int(days)
+        else:
+            for result in results:
+                result["stay_error"] = errors["stay"]
+        if patients is None:
+            return results[0]
+        for row, result in zip(rows, results):
+            if 'id' in row:
+                result["id"] = row['id']
+        return {
+            "patients": results
+        }
+        
+    except FileNotFoundError as e:
+        return {"error": f"Model file ({os.path.basename(e.filename or model_path)}) not found. Please train the model first."}
+    except Exception as e:
+        return {"error": f"An error occurred during patient outcome prediction: {e}"}
+
 # ===============================================
 # === HOSPITAL DISEASE FORECAST ===
 # ===============================================
 
+@_cached_training
 def train_hospital_disease_forecast_model(csv_path='hospital_disease_data.csv', model_output_path='hospital_disease_models.joblib'):
     print(f"Starting hospital disease forecast model training with data from {csv_path}...")
     try:
-        df = pd.read_csv(csv_path)
+        df = _load_dataset(csv_path)
         
         required_cols = ['date', 'disease_name', 'hospital_id', 'cases']
         if not all(col in df.columns for col in required_cols):
@@ -1844,17 +3361,19 @@ def train_hospital_disease_forecast_model(csv_path='hospital_disease_data.csv',
             print(f"- Hospital {key[0]} / Disease {key[1]}")
         print("-" * 50 + "\n")
 
-        joblib.dump(models, model_output_path)
+        _save_model(models, model_output_path)
         print(f"Hospital disease forecast models successfully saved to {model_output_path}")
+        return {"models_trained": len(models)}
 
     except FileNotFoundError:
         print(f"Error: The file {csv_path} was not found. Please create it first.")
     except Exception as e:
         print(f"An error occurred during hospital disease forecast training: {e}")
 
+@_cached_prediction(ttl=3600)
 def predict_hospital_disease_forecast(input_data_dict, model_path='hospital_disease_models.joblib'):
     try:
-        models = joblib.load(model_path)
+        models = _load_model(model_path)
         
         disease = input_data_dict.get('disease_name')
         hospital_id = int(input_data_dict.get('hospital_id'))
@@ -1893,10 +3412,11 @@ def predict_hospital_disease_forecast(input_data_dict, model_path='hospital_dise
 # === INVENTORY PREDICTION ===
 # ===============================================
 
-def train_inventory_model(csv_path='inventory_data.csv', model_output_path='inventory_prediction_model.joblib'):
+@_cached_training
+def train_inventory_model(csv_path='inventory_data.csv', model_output_path='inventory_prediction_model.joblib', estimator='random_forest'):
     print(f"Starting inventory prediction model training with data from {csv_path}...")
     try:
-        df = pd.read_csv(csv_path)
+        df = _load_dataset(csv_path)
         
         target = 'next_week_stock'
         numerical_features = ['quantity', 'minThreshold']
@@ -1931,128 +3451,200 @@ def train_inventory_model(csv_path='inventory_data.csv', model_output_path='inve
                 ('cat', categorical_transformer, categorical_features)
             ])
         
-        reg = Pipeline(steps=[
-            ('preprocessor', preprocessor),
-            ('regressor', RandomForestRegressor(random_state=42, n_estimators=100))
-        ])
-        
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-        
         print("Fitting inventory prediction pipeline...")
-        reg.fit(X_train, y_train)
-        
-        y_pred = reg.predict(X_test)
-        print("\n--- Model: RandomForestRegressor (Inventory Prediction) ---")
-        print(f"R-squared (R2): {r2_score(y_test, y_pred):.4f}")
-        print(f"Mean Absolute Error (MAE): {mean_absolute_error(y_test, y_pred):.4f}")
-        print(f"Root Mean Squared Error (RMSE): {np.sqrt(mean_squared_error(y_test, y_pred)):.4f}")
+        preprocessor, model = _estimator_for_backend(estimator, 'regression', preprocessor, RandomForestRegressor(random_state=42, n_estimators=100))
+        reg, X_test_t, y_test = _fit_with_feature_cache(
+            preprocessor, model, 'regressor', X, y, test_size=0.2, random_state=42)
+        
+        y_pred = reg.named_steps['regressor'].predict(X_test_t)
+        print(f"\n--- Model: {type(reg.named_steps['regressor']).__name__} (Inventory Prediction) ---")
+        r2 = r2_score(y_test, y_pred)
+        mae = mean_absolute_error(y_test, y_pred)
+        rmse = np.sqrt(mean_squared_error(y_test, y_pred))
+        print(f"R-squared (R2): {r2:.4f}")
+        print(f"Mean Absolute Error (MAE): {mae:.4f}")
+        print(f"Root Mean Squared Error (RMSE): {rmse:.4f}")
         print("-" * 50 + "\n")
         
-        joblib.dump(reg, model_output_path)
+        _save_model(reg, model_output_path)
         print(f"Inventory prediction model successfully saved to {model_output_path}")
+        return {"r2": round(float(r2), 4), "mae": round(float(mae), 4), "rmse": round(float(rmse), 4)}
 
     except FileNotFoundError:
         print(f"Error: The file {csv_path} was not found. Please create it first.")
     except Exception as e:
         print(f"An error occurred during inventory model training: {e}")
 
-def predict_inventory(input_data_dict, model_path='inventory_prediction_model.joblib'):
+INVENTORY_STATUS = {
+    "urgent_reorder": "Critical - Order Immediately",
+    "plan_reorder": "Low - Plan Reorder",
+    "maintain": "Adequate Supply"
+}
+
+def _inventory_forecast_arrays(current_qty, min_threshold):
+    """
+    Vectorized depletion heuristic over whole catalogues. Returns predicted
+    next-week stock, daily usage, days until stockout and the action code
+    (index into INVENTORY_STATUS) for every item.
+    """
+    # Items below minimum deplete faster (70%/week), low items 50%, adequate items 30%
+    depletion_rate = np.select([current_qty < min_threshold, current_qty < min_threshold * 2], [0.7, 0.5], 0.3)
+    predicted_stock = np.maximum(0, np.trunc(current_qty * (1 - depletion_rate))).astype(int)
+
+    items_used_per_week = current_qty - predicted_stock
+    usage_rate_per_day = np.maximum(0.1, np.round(items_used_per_week / 7, 2))
+    days_until_stockout = np.where(current_qty > 0, np.maximum(0, np.trunc(current_qty / usage_rate_per_day)), 999).astype(int)
+
+    # Critical at or below the minimum threshold, low up to 150% of it, otherwise adequate
+    # unless the predicted stockout is within 3 days
+    action = np.select([current_qty <= min_threshold, current_qty <= min_threshold * 1.5], [0, 1], 2)
+    action = np.where((action == 2) & (days_until_stockout <= 3), 1, action)
+    return predicted_stock, usage_rate_per_day, days_until_stockout, action
+
+def predict_inventory_bulk(input_data_dict, model_path='inventory_prediction_model.joblib'):
+    """
+    Stock status for a whole catalogue in one call, most urgent first.
+    input_data_dict: {"items": [{"name", "quantity", "minThreshold", "category", "hospital_id" (optional)}]}
+                     or {"hospitals": [{"hospital_id": ..., "items": [...]}]}
+    The random forest's next-week forecast is only computed (and the model only
+    loaded) when "include_model_forecast" is true; the status fields come from
+    the depletion heuristic.
+    """
     try:
-        model = joblib.load(model_path)
-        
-        # Ensure all required columns are present in correct order
-        required_columns = ['quantity', 'minThreshold', 'category']
-        
-        # Create DataFrame with all required columns
-        input_data = {col: input_data_dict.get(col) for col in required_columns}
-        input_df = pd.DataFrame([input_data])
-        
-        prediction = model.predict(input_df)[0]
-        
-        current_qty = int(input_data_dict.get('quantity', 0))
-        min_threshold = int(input_data_dict.get('minThreshold', 0))
-        category = input_data_dict.get('category', 'Consumables')
-        
-        # Model prediction gives us next week's stock (but we'll adjust based on current level)
-        model_predicted_stock = max(0, round(prediction))
-        
-        # Apply a more realistic depletion based on how far item is from minimum threshold
-        # Items below minimum will deplete faster
-        if current_qty < min_threshold:
-            # Item is already critical - assume faster depletion
-            depletion_rate = 0.7  # 70% depletion per week
-        elif current_qty < min_threshold * 2:
-            # Item is low - moderate depletion
-            depletion_rate = 0.5  # 50% depletion per week
-        else:
-            # Item is adequate - slower depletion
-            depletion_rate = 0.3  # 30% depletion per week
-        
-        # Calculate predicted next week stock based on current level and depletion rate
-        predicted_stock = max(0, int(current_qty * (1 - depletion_rate)))
-        
-        # Calculate usage rate based on the difference between current and predicted
-        items_used_per_week = current_qty - predicted_stock
-        usage_rate_per_day = max(0.1, round(items_used_per_week / 7, 2))
-        
-        # Calculate days until stockout (when inventory reaches 0)
-        if usage_rate_per_day > 0 and current_qty > 0:
-            days_until_stockout = max(0, int(current_qty / usage_rate_per_day))
-        else:
-            days_until_stockout = 999
-        
-        # Determine status based on current quantity vs minimum threshold and days left
-        qty_ratio = current_qty / min_threshold if min_threshold > 0 else 10
-        
-        # Primary status decision: based on how far below/above minimum threshold
-        if current_qty == 0:
-            status = "Critical - Order Immediately"
-            action = "urgent_reorder"
-        elif current_qty <= min_threshold * 0.2:
-            # Very low: 0-20% of minimum
-            status = "Critical - Order Immediately"
-            action = "urgent_reorder"
-        elif current_qty <= min_threshold:
-            # Below minimum: 20-100% of minimum
-            status = "Critical - Order Immediately"
-            action = "urgent_reorder"
-        elif current_qty <= min_threshold * 1.5:
-            # Low: 100-150% of minimum
-            status = "Low - Plan Reorder"
-            action = "plan_reorder"
-        else:
-            # Adequate: >150% of minimum
-            status = "Adequate Supply"
-            action = "maintain"
-        
-        # Secondary check: also consider predicted days
-        if days_until_stockout <= 3 and status == "Adequate Supply":
-            status = "Low - Plan Reorder"
-            action = "plan_reorder"
-        
+        items = list(input_data_dict.get('items') or [])
+        for hospital in input_data_dict.get('hospitals') or []:
+            items.extend(dict(item, hospital_id=hospital.get('hospital_id')) for item in hospital.get('items') or [])
+        if not items:
+            return {"items": [], "summary": {"total": 0, "critical": 0, "low": 0, "adequate": 0}}
+
+        catalogue = pd.DataFrame(items)
+        for column in ['quantity', 'minThreshold']:
+            if column not in catalogue.columns:
+                catalogue[column] = 0
+        if 'category' not in catalogue.columns:
+            catalogue['category'] = 'Consumables'
+        current_qty = pd.to_numeric(catalogue['quantity'], errors='coerce').fillna(0).to_numpy(dtype=float).astype(int)
+        min_threshold = pd.to_numeric(catalogue['minThreshold'], errors='coerce').fillna(0).to_numpy(dtype=float).astype(int)
+
+        predicted_stock, usage_rate_per_day, days_until_stockout, action = _inventory_forecast_arrays(current_qty, min_threshold)
+
+        model_forecast = None
+        if input_data_dict.get('include_model_forecast'):
+            model = _load_model(model_path)
+            model_forecast = np.maximum(0, np.round(model.predict(catalogue[['quantity', 'minThreshold', 'category']]))).astype(int)
+
+        actions = list(INVENTORY_STATUS)
+        names = catalogue['name'].fillna('Unknown').tolist() if 'name' in catalogue.columns else ['Unknown'] * len(items)
+        hospital_ids = catalogue['hospital_id'].tolist() if 'hospital_id' in catalogue.columns else None
+
+        results = []
+        # Most urgent first: critical before low before adequate, then fewest days left
+        for i in np.lexsort((days_until_stockout, action)):
+            status = INVENTORY_STATUS[actions[action[i]]]
+            usage = f"{usage_rate_per_day[i]:.1f}"
+            result = {
+                "item": names[i],
+                "item_name": names[i],
+                "current_quantity": int(current_qty[i]),
+                "predicted_next_week": int(predicted_stock[i]),
+                "minimum_threshold": int(min_threshold[i]),
+                "status": status,
+                "stock_status": status,
+                "action_required": actions[action[i]],
+                "days_left": int(days_until_stockout[i]),
+                "usage_rate_per_day": usage,
+                "recommendation": f"Current: {current_qty[i]}/{min_threshold[i]} units | Next week: ~{predicted_stock[i]} | Daily usage: {usage} units | {status} | Stockout in ~{days_until_stockout[i]} days."
+            }
+            if hospital_ids is not None:
+                result["hospital_id"] = hospital_ids[i]
+            if model_forecast is not None:
+                result["model_predicted_next_week"] = int(model_forecast[i])
+            results.append(result)
+
         return {
-            "item": input_data_dict.get('name', 'Unknown'),
-            "item_name": input_data_dict.get('name', 'Unknown'),
-            "current_quantity": current_qty,
-            "predicted_next_week": int(predicted_stock),
-            "minimum_threshold": min_threshold,
-            "status": status,
-            "stock_status": status,
-            "action_required": action,
-            "days_left": days_until_stockout,
-            "usage_rate_per_day": f"{usage_rate_per_day:.1f}",
-            "recommendation": f"Current: {current_qty}/{min_threshold} units | Next week: ~{int(predicted_stock)} | Daily usage: {usage_rate_per_day:.1f} units | {status} | Stockout in ~{days_until_stockout} days."
+            "items": results,
+            "summary": {
+                "total": len(results),
+                "critical": int(np.sum(action == 0)),
+                "low": int(np.sum(action == 1)),
+                "adequate": int(np.sum(action == 2))
+            }
         }
-        
+
     except FileNotFoundError:
         return {"error": "Model file (inventory_prediction_model.joblib) not found. Please train the model first."}
     except Exception as e:
         return {"error": f"An error occurred during inventory prediction: {e}"}
 
+def predict_inventory(input_data_dict, model_path='inventory_prediction_model.joblib'):
+    result = predict_inventory_bulk({
+        "items": [input_data_dict],
+        "include_model_forecast": input_data_dict.get('include_model_forecast', False)
+    }, model_path=model_path)
+    if "error" in result:
+        return result
+    return result["items"][0]
+
 # ===============================================
 # === SOS EMERGENCY SEVERITY PREDICTION ===
 # ===============================================
 
+# Keyword tiers checked in order; the first tier with a match decides the score
+SOS_KEYWORD_TIERS = [
+    # Critical keywords - life-threatening
+    ('Critical', 95, ['cardiac arrest', 'heart attack', 'stopped breathing', 'unresponsive',
+                      'severe hemorrhage', 'choking', 'unconscious', 'stroke', 'comatose',
+                      'anaphylaxis', 'poisoning', 'electrocution', 'critical']),
+    # High priority keywords - serious medical emergency
+    ('High', 75, ['chest pain', 'difficulty breathing', 'severe pain', 'heavy bleeding',
+                  'loss of consciousness', 'severe allergic', 'broken bone', 'serious injury',
+                  'emergency', 'urgent', 'danger', 'severe', 'collapsed']),
+    # Medium priority keywords - moderately urgent
+    ('Medium', 55, ['accident', 'trauma', 'injured', 'hurt', 'pain', 'bleeding',
+                    'fever', 'vomiting', 'dizzy', 'weakness', 'burns', 'fracture',
+                    'sprain', 'wound', 'fall']),
+    # Low priority keywords - minor issues
+    ('Low', 30, ['cut', 'bruise', 'headache', 'nausea', 'cold', 'cough', 'rash',
+                 'minor', 'slight', 'small']),
+]
+
+SOS_RESPONSE_PLANS = {
+    "Critical": ("1-5 minutes", "Advanced Life Support (ALS)", "Trauma Center"),
+    "High": ("5-10 minutes", "Basic Life Support (BLS)", "Emergency Department"),
+    "Medium": ("10-20 minutes", "Standard Ambulance", "Urgent Care / ED"),
+    "Low": ("20-30 minutes", "Non-Emergency Transport", "Clinic / Urgent Care"),
+}
+
+def _sos_keyword_score(message):
+    """Returns (severity_score, matched tier name or None) for a lower-cased message."""
+    for tier, score, keywords in SOS_KEYWORD_TIERS:
+        if any(keyword in message for keyword in keywords):
+            return score, tier
+    # Default severity if no keywords matched (based on message length/urgency)
+    return (40 if len(message) > 50 else 25), None
+
+def _sos_severity_level(severity_score):
+    if severity_score >= 85:
+        return "Critical"
+    if severity_score >= 70:
+        return "High"
+    if severity_score >= 50:
+        return "Medium"
+    return "Low"
+
+def _sos_response(message, severity_level, severity_score, confidence):
+    response_time, ambulance_type, hospital_priority = SOS_RESPONSE_PLANS[severity_level]
+    return {
+        "severity_level": severity_level,
+        "severity_score": severity_score,
+        "message": message[:100],  # First 100 chars
+        "response_time": response_time,
+        "ambulance_type": ambulance_type,
+        "hospital_type": hospital_priority,
+        "ai_confidence": confidence,
+        "recommendation": f"Emergency response: {ambulance_type} dispatched with {response_time} ETA to {hospital_priority}"
+    }
+
 def predict_sos_severity(input_data_dict):
     """
     Analyze emergency SOS message and predict severity level using keyword-based ML approach.
@@ -2061,84 +3653,10 @@ def predict_sos_severity(input_data_dict):
     try:
         message = input_data_dict.get('message', '').lower()
         
-        # Critical keywords - life-threatening
-        critical_keywords = ['cardiac arrest', 'heart attack', 'stopped breathing', 'unresponsive', 
-                           'severe hemorrhage', 'choking', 'unconscious', 'stroke', 'comatose',
-                           'anaphylaxis', 'poisoning', 'electrocution', 'critical']
-        
-        # High priority keywords - serious medical emergency
-        high_keywords = ['chest pain', 'difficulty breathing', 'severe pain', 'heavy bleeding',
-                        'loss of consciousness', 'severe allergic', 'broken bone', 'serious injury',
-                        'emergency', 'urgent', 'danger', 'severe', 'collapsed']
+        severity_score, _ = _sos_keyword_score(message)
+        severity_level = _sos_severity_level(severity_score)
         
-        # Medium priority keywords - moderately urgent
-        medium_keywords = ['accident', 'trauma', 'injured', 'hurt', 'pain', 'bleeding',
-                          'fever', 'vomiting', 'dizzy', 'weakness', 'burns', 'fracture',
-                          'sprain', 'wound', 'fall']
-        
-        # Low priority keywords - minor issues
-        low_keywords = ['cut', 'bruise', 'headache', 'nausea', 'cold', 'cough', 'rash',
-                       'minor', 'slight', 'small']
-        
-        # Calculate severity score
-        severity_score = 0
-        max_score = 100
-        
-        # Check for critical keywords (40 points)
-        if any(keyword in message for keyword in critical_keywords):
-            severity_score = max(severity_score, 95)
-        
-        # Check for high keywords (30 points)
-        elif any(keyword in message for keyword in high_keywords):
-            severity_score = max(severity_score, 75)
-        
-        # Check for medium keywords (20 points)
-        elif any(keyword in message for keyword in medium_keywords):
-            severity_score = max(severity_score, 55)
-        
-        # Check for low keywords (10 points)
-        elif any(keyword in message for keyword in low_keywords):
-            severity_score = max(severity_score, 30)
-        
-        # Default severity if no keywords matched (based on message length/urgency)
-        else:
-            if len(message) > 50:
-                severity_score = 40
-            else:
-                severity_score = 25
-        
-        # Determine severity level
-        if severity_score >= 85:
-            severity_level = "Critical"
-            response_time = "1-5 minutes"
-            ambulance_type = "Advanced Life Support (ALS)"
-            hospital_priority = "Trauma Center"
-        elif severity_score >= 70:
-            severity_level = "High"
-            response_time = "5-10 minutes"
-            ambulance_type = "Basic Life Support (BLS)"
-            hospital_priority = "Emergency Department"
-        elif severity_score >= 50:
-            severity_level = "Medium"
-            response_time = "10-20 minutes"
-            ambulance_type = "Standard Ambulance"
-            hospital_priority = "Urgent Care / ED"
-        else:
-            severity_level = "Low"
-            response_time = "20-30 minutes"
-            ambulance_type = "Non-Emergency Transport"
-            hospital_priority = "Clinic / Urgent Care"
-        
-        return {
-            "severity_level": severity_level,
-            "severity_score": severity_score,
-            "message": message[:100],  # First 100 chars
-            "response_time": response_time,
-            "ambulance_type": ambulance_type,
-            "hospital_type": hospital_priority,
-            "ai_confidence": round(min(100, severity_score + 15), 2),
-            "recommendation": f"Emergency response: {ambulance_type} dispatched with {response_time} ETA to {hospital_priority}"
-        }
+        return _sos_response(message, severity_level, severity_score, round(min(100, severity_score + 15), 2))
         
     except Exception as e:
         return {
@@ -2147,6 +3665,632 @@ def predict_sos_severity(input_data_dict):
             "severity_score": 50
         }
 
+# ===============================================
+# === TRIAGE CASCADE ===
+# ===============================================
+
+SEVERITY_LEVELS = ["Low", "Medium", "High", "Critical"]
+SEVERITY_LEVEL_SCORES = {"Low": 30, "Medium": 55, "High": 75, "Critical": 95}
+EMERGENCY_SEVERITY_FEATURES = ['population_density', 'avg_response_time_min', 'emergency_type', 'region']
+HOSPITAL_SEVERITY_FEATURES = ['age', 'heart_rate', 'blood_pressure_systolic', 'distance_km', 'emergency_type']
+
+def triage_sos(input_data_dict, early_exit_levels=('Critical', 'Low'), nb_confidence=0.8, forest_confidence=0.6,
+               classifier_path='emergency_classifier.joblib',
+               severity_model_path='emergency_severity_model.joblib',
+               hospital_severity_model_path='hospital_severity_model.joblib'):
+    """
+    Cascaded SOS triage for one message ({"message": ...}) or a batch
+    ({"messages": [...]}, each item a string or an SOS dict).
+      1. rules  - keyword scorer; a clear-cut Critical or Low tier match exits here.
+      2. nb     - TF-IDF Naive Bayes call classifier, one batched predict_proba;
+                  exits when its top class probability reaches nb_confidence.
+      3. forest - severity random forests for SOS items carrying the structured
+                  fields of either model (patient vitals or region context);
+                  exits when its top class probability reaches forest_confidence.
+    Neither model stage ever lowers the keyword level. Remaining items keep the
+    best earlier estimate. Models are loaded only when
+    a stage is reached, and per-stage hit rates and latencies are reported.
+    """
+    try:
+        items = input_data_dict.get('messages')
+        single = items is None
+        items = [input_data_dict] if single else [item if isinstance(item, dict) else {"message": item} for item in items]
+        messages = [str(item.get('message', '')).lower() for item in items]
+        results = [None] * len(items)
+        estimates = [None] * len(items)
+        stages = {}
+
+        def record(stage, start, evaluated, exits):
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            stages[stage] = {
+                "evaluated": evaluated,
+                "exits": exits,
+                "hit_rate": round(exits / len(items), 4) if items else 0.0,
+                "latency_ms": round(elapsed_ms, 3),
+                "latency_ms_per_item": round(elapsed_ms / evaluated, 4) if evaluated else 0.0
+            }
+
+        # Stage 1: keyword rules
+        start = time.perf_counter()
+        for i, message in enumerate(messages):
+            score, tier = _sos_keyword_score(message)
+            level = _sos_severity_level(score)
+            estimates[i] = (level, score, round(min(100, score + 15), 2))
+            if tier is not None and tier in early_exit_levels:
+                results[i] = dict(_sos_response(message, level, score, estimates[i][2]), stage="rules")
+        pending = [i for i in range(len(items)) if results[i] is None]
+        record("rules", start, len(items), len(items) - len(pending))
+
+        # Stage 2: Naive Bayes call classifier
+        if pending:
+            start = time.perf_counter()
+            evaluated = len(pending)
+            try:
+                classifier = _load_model(classifier_path)
+                probabilities = classifier.predict_proba([str(items[i].get('message', '')) for i in pending])
+                categories = classifier.classes_[np.argmax(probabilities, axis=1)]
+            except Exception as e:
+                # Any model failure (missing, unpicklable, incompatible) falls through to the next stage
+                probabilities, stage_error = None, e
+            if probabilities is not None:
+                still_pending = []
+                for i, row, category in zip(pending, probabilities, categories):
+                    level = get_priority(category) if row.max() >= nb_confidence else None
+                    if level not in SEVERITY_LEVELS:
+                        still_pending.append(i)
+                        continue
+                    # The classifier never lowers what the keywords already established
+                    level = max(estimates[i][0], level, key=SEVERITY_LEVELS.index)
+                    score = max(estimates[i][1], SEVERITY_LEVEL_SCORES[level])
+                    results[i] = dict(_sos_response(messages[i], level, score, round(float(row.max()) * 100, 2)),
+                                      stage="nb", emergency_category=str(category))
+                pending = still_pending
+            record("nb", start, evaluated, evaluated - len(pending))
+            if probabilities is None:
+                stages["nb"]["error"] = f"{type(stage_error).__name__}: {stage_error}"
+
+        # Stage 3: severity random forests, for items with the structured fields they need
+        if pending:
+            start = time.perf_counter()
+            evaluated = len(pending)
+            forest_errors = []
+            for model_path, features in [(hospital_severity_model_path, HOSPITAL_SEVERITY_FEATURES),
+                                         (severity_model_path, EMERGENCY_SEVERITY_FEATURES)]:
+                eligible = [i for i in pending if all(items[i].get(f) is not None for f in features)]
+                if not eligible:
+                    continue
+                try:
+                    model = _load_model(model_path)
+                    frame = pd.DataFrame([{f: items[i][f] for f in features} for i in eligible])
+                    probabilities = model.predict_proba(frame)
+                except Exception as e:
+                    # A failing model leaves its items to the keyword estimate
+                    forest_errors.append(f"{os.path.basename(model_path)}: {type(e).__name__}: {e}")
+                    continue
+                for i, row in zip(eligible, probabilities):
+                    level = str(model.classes_[np.argmax(row)])
+                    if level not in SEVERITY_LEVELS or row.max() < forest_confidence:
+                        continue
+                    # Like the classifier, the forest never lowers what the keywords already established
+                    level = max(estimates[i][0], level, key=SEVERITY_LEVELS.index)
+                    score = max(estimates[i][1], SEVERITY_LEVEL_SCORES[level])
+                    results[i] = dict(_sos_response(messages[i], level, score, round(float(row.max()) * 100, 2)),
+                                      stage="forest")
+                pending = [i for i in pending if results[i] is None]
+            record("forest", start, evaluated, evaluated - len(pending))
+            if forest_errors:
+                stages["forest"]["error"] = "; ".join(forest_errors)
+
+        # Nothing confident enough: keep the keyword estimate, flagged as low confidence
+        for i in pending:
+            level, score, confidence = estimates[i]
+            results[i] = dict(_sos_response(messages[i], level, score, confidence), stage="rules_fallback")
+
+        if single:
+            return dict(results[0], triage_stages=stages)
+        return {
+            "results": results,
+            "stages": stages
+        }
+
+    except Exception as e:
+        return {"error": f"An error occurred during SOS triage: {e}"}
+
+# ===============================================
+# === TRAIN ALL (PARALLEL ORCHESTRATOR) ===
+# ===============================================
+
+TRAINING_TASKS = {
+    'emergency_classifier': train_and_save_model,
+    'compatibility': train_compatibility_model,
+    'hospital_recommendation': train_recommendation_model,
+    'health_risk': train_health_risk_model,
+    'activity_cluster': train_activity_cluster_model,
+    'behavior_forecast': train_behavior_forecast_model,
+    'emergency_hotspot': train_emergency_hotspot_model,
+    'outbreak_forecast': train_outbreak_forecast_model,
+    'emergency_severity': train_severity_model,
+    'donor_availability': train_availability_model,
+    'resource_allocation': train_allocation_model,
+    'policy_segmentation': train_policy_segmentation_model,
+    'healthcare_performance': train_healthcare_performance_model,
+    'anomaly_detection': train_anomaly_detection_model,
+    'hospital_severity': train_hospital_severity_model,
+    'eta': train_eta_model,
+    'bed_forecast': train_bed_forecast_model,
+    'staff_allocation': train_staff_allocation_model,
+    'hospital_performance': train_hospital_performance_model,
+    'recovery': train_recovery_model,
+    'stay_duration': train_stay_duration_model,
+    'patient_outcome': train_patient_outcome_model,
+    'hospital_disease_forecast': train_hospital_disease_forecast_model,
+    'inventory': train_inventory_model
+}
+
+def _training_default(task_name, param_name):
+    # A trainer's dataset and artifact are the defaults of its csv_path and
+    # model_output_path arguments
+    param = inspect.signature(TRAINING_TASKS[task_name]).parameters.get(param_name)
+    return param.default if param is not None else None
+
+def _training_input(task_name):
+    return _training_default(task_name, 'csv_path')
+
+def _build_training_graph(task_names):
+    """
+    Groups trainers by the dataset they read. Each group is one node of the
+    task graph: the dataset is loaded once and shared by the trainers in it,
+    while different groups have no dependencies and can run in parallel.
+    Groups are ordered largest dataset first so long jobs start early.
+    """
+    groups = defaultdict(list)
+    for name in task_names:
+        groups[_training_input(name)].append(name)
+
+    def dataset_size(csv_path):
+        if csv_path is None or not os.path.exists(csv_path):
+            return 0
+        return os.path.getsize(csv_path)
+
+    return sorted(groups.items(), key=lambda item: dataset_size(item[0]), reverse=True)
+
+def _run_training_group(csv_path, task_names):
+    results = []
+    if csv_path is not None:
+        # Loaded lazily, so a group whose artifacts are all up to date never parses its CSV
+        _SHARED_DATASET_PATHS.add(os.path.abspath(csv_path))
+    try:
+        for name in task_names:
+            log = io.StringIO()
+            baseline_mb = _proc_memory_mb('VmRSS')
+            peak_resettable = _reset_peak_memory()
+            start = time.perf_counter()
+            try:
+                with contextlib.redirect_stdout(log):
+                    metrics = TRAINING_TASKS[name]()
+            except Exception as e:
+                log.write(f"Unhandled error: {e}\n")
+                metrics = None
+            wall_time = time.perf_counter() - start
+            # Without a resettable peak, ru_maxrss also covers earlier trainers in this group
+            peak_mb = _proc_memory_mb('VmHWM') if peak_resettable else _peak_memory_mb()
+            outcome = _TRAINING_OUTCOMES.get(_training_default(name, 'model_output_path'), 'failed')
+            results.append({
+                "model": name,
+                "dataset": csv_path,
+                "status": outcome if isinstance(metrics, dict) else "failed",
+                "wall_time_s": round(wall_time, 3),
+                "peak_memory_mb": peak_mb,
+                "memory_growth_mb": round(peak_mb - baseline_mb, 1) if peak_mb is not None and baseline_mb is not None else None,
+                "metrics": metrics if isinstance(metrics, dict) else None,
+                "log": log.getvalue()[-2000:]
+            })
+    finally:
+        if csv_path is not None:
+            _SHARED_DATASET_PATHS.discard(os.path.abspath(csv_path))
+            _DATASET_CACHE.pop(os.path.abspath(csv_path), None)
+    return results
+
+def train_all(task_names=None, max_workers=None, report_path='training_report.json'):
+    """
+    Trains every registered model. Trainers sharing a CSV run in the same worker
+    so the file is parsed once (one after another within the group);
+    independent groups run in a process pool, each in a fresh worker, so a full
+    retrain takes roughly as long as the slowest group.
+    Writes per-model wall time, metrics, the worker's peak RSS while that model
+    trained and its growth over the RSS before it started to report_path.
+    """
+    task_names = list(task_names or TRAINING_TASKS.keys())
+    unknown = [name for name in task_names if name not in TRAINING_TASKS]
+    if unknown:
+        print(f"Error: Unknown training task(s): {unknown}. Available: {list(TRAINING_TASKS.keys())}")
+        return
+
+    graph = _build_training_graph(task_names)
+    max_workers = max_workers or min(len(graph), os.cpu_count() or 1)
+    print(f"Training {len(task_names)} model(s) from {len(graph)} dataset group(s) on {max_workers} worker(s)...")
+
+    results = []
+    start = time.perf_counter()
+    # A fresh worker per group, so no group's memory counts towards another's. Workers
+    # fork from a server that has already imported this module, so each starts quickly.
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload(['ai_ml'])
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context, max_tasks_per_child=1) as pool:
+        futures = {pool.submit(_run_training_group, csv_path, names): (csv_path, names) for csv_path, names in graph}
+        for future in as_completed(futures):
+            csv_path, names = futures[future]
+            try:
+                group_results = future.result()
+            except Exception as e:
+                group_results = [{"model": name, "dataset": csv_path, "status": "failed", "wall_time_s": None,
+                                  "peak_memory_mb": None, "memory_growth_mb": None, "metrics": None, "log": f"Worker crashed: {e}"} for name in names]
+            for record in group_results:
+                print(f"  [{record['status']}] {record['model']} ({record['wall_time_s']}s, {record['peak_memory_mb']} MB, "
+                      f"+{record['memory_growth_mb']} MB)")
+            results.extend(group_results)
+    total_time = time.perf_counter() - start
+
+    results.sort(key=lambda record: task_names.index(record['model']))
+    report = {
+        "total_wall_time_s": round(total_time, 3),
+        "sum_model_time_s": round(sum(r['wall_time_s'] or 0 for r in results), 3),
+        "max_workers": max_workers,
+        "rebuilt": [r['model'] for r in results if r['status'] == 'rebuilt'],
+        "reused": [r['model'] for r in results if r['status'] == 'reused'],
+        "failed": [r['model'] for r in results if r['status'] == 'failed'],
+        "models": results
+    }
+
+    print("\n--- Train All Summary ---")
+    print(f"{'Model':<28}{'Status':<8}{'Time (s)':>10}{'Peak MB':>10}{'+MB':>8}  Metrics")
+    for r in results:
+        print(f"{r['model']:<28}{r['status']:<8}{str(r['wall_time_s']):>10}{str(r['peak_memory_mb']):>10}"
+              f"{str(r['memory_growth_mb']):>8}  {r['metrics']}")
+    print(f"Rebuilt: {len(report['rebuilt'])} | Reused: {len(report['reused'])} | Failed: {len(report['failed'])}")
+    print(f"Wall time: {report['total_wall_time_s']}s (sequential model time: {report['sum_model_time_s']}s)")
+    print("-" * 50 + "\n")
+
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"Training report saved to {report_path}")
+    return report
+
+# ===============================================
+# === TRAINING JOBS ===
+# ===============================================
+
+TRAINING_JOBS_DIR = os.environ.get('ML_TRAINING_JOBS_DIR', 'training_jobs')
+# At most this many training jobs run at once on the host; the rest wait queued
+TRAINING_JOB_WORKERS = int(os.environ.get('ML_TRAINING_WORKERS', 1))
+# Limits applied to each job process. CPU is in seconds of CPU time, memory in MB
+# of address space; 0 disables either. Jobs run at a lower scheduling priority so
+# live inference always wins the CPU.
+TRAINING_JOB_LIMITS = {
+    "cpu_seconds": int(os.environ.get('ML_TRAINING_CPU_SECONDS', 3600)),
+    "memory_mb": int(os.environ.get('ML_TRAINING_MEMORY_MB', 8192)),
+    "nice": int(os.environ.get('ML_TRAINING_NICE', 19)),
+    "threads": int(os.environ.get('ML_TRAINING_THREADS', 1))
+}
+
+_TRAINING_PROCESSES = []
+
+# Files some trainers write next to their artifact, published along with it
+TRAINING_SIDECARS = [_staff_lookup_path]
+
+# The ids submit_training_job generates; anything else could name a path outside TRAINING_JOBS_DIR
+TRAINING_JOB_ID_PATTERN = r'\d{8}-\d{6}-[a-z_]+-[0-9a-f]{6}'
+
+def _job_path(job_id):
+    if not isinstance(job_id, str) or not re.fullmatch(TRAINING_JOB_ID_PATTERN, job_id):
+        raise ValueError(f"Invalid training job id: {job_id!r}")
+    return os.path.join(TRAINING_JOBS_DIR, f"{job_id}.json")
+
+def _read_job(job_id):
+    try:
+        with open(_job_path(job_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_job(job):
+    # Write-then-rename, so a status reader never sees a partial record
+    tmp_path = f"{_job_path(job['id'])}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(job, f, indent=2, default=str)
+    os.replace(tmp_path, _job_path(job['id']))
+
+def _update_job(job_id, **fields):
+    job = _read_job(job_id) or {"id": job_id}
+    job.update(fields)
+    _write_job(job)
+    return job
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _reap_training_processes():
+    # Job processes are detached; poll them so a long-lived submitter leaves no zombies
+    _TRAINING_PROCESSES[:] = [process for process in _TRAINING_PROCESSES if process.poll() is None]
+
+def submit_training_job(input_data_dict):
+    """
+    Queues a training task ({"task": <TRAINING_TASKS name>, "force": bool}) and
+    returns its job record at once. The job runs in its own detached process
+    (ai_ml.py run_training_job <id>), so it outlives the caller.
+    """
+    task_name = input_data_dict.get('task')
+    if task_name not in TRAINING_TASKS:
+        return {"error": f"Unknown training task: {task_name}. Available: {list(TRAINING_TASKS.keys())}"}
+    os.makedirs(TRAINING_JOBS_DIR, exist_ok=True)
+    _reap_training_processes()
+
+    job_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{task_name}-{os.urandom(3).hex()}"
+    job = {
+        "id": job_id,
+        "task": task_name,
+        "force": bool(input_data_dict.get('force', False)),
+        "status": "queued",
+        "artifact": _training_default(task_name, 'model_output_path'),
+        "submitted_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "limits": TRAINING_JOB_LIMITS
+    }
+    _write_job(job)
+
+    env = dict(os.environ)
+    threads = str(TRAINING_JOB_LIMITS['threads'] or os.cpu_count() or 1)
+    for name in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+        env[name] = threads
+    with open(os.path.join(TRAINING_JOBS_DIR, f"{job_id}.log"), 'ab') as log:
+        process = subprocess.Popen([sys.executable, os.path.abspath(__file__), 'run_training_job', job_id],
+                                   stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                                   env=env, start_new_session=True)
+    # Lowered from here too, so the job's own start-up (importing this module) already yields to inference
+    _lower_priority(process.pid)
+    _TRAINING_PROCESSES.append(process)
+    return job
+
+def _acquire_training_slot():
+    # One lock file per slot; the kernel releases a slot when its holder exits, however it exits
+    import fcntl
+    while True:
+        for slot in range(max(1, TRAINING_JOB_WORKERS)):
+            handle = open(os.path.join(TRAINING_JOBS_DIR, f"slot-{slot}.lock"), 'w')
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return slot, handle
+            except OSError:
+                handle.close()
+        time.sleep(1)
+
+def _lower_priority(pid):
+    nice = TRAINING_JOB_LIMITS['nice']
+    try:
+        os.setpriority(os.PRIO_PROCESS, pid, max(os.getpriority(os.PRIO_PROCESS, pid), nice))
+    except (AttributeError, OSError):
+        pass
+    try:
+        # Each job is its own session and so, with Linux autogroup scheduling, its own
+        # scheduling group, which competes as an equal unless the group itself is niced
+        with open(f'/proc/{pid}/autogroup', 'w') as f:
+            f.write(str(nice))
+    except OSError:
+        pass
+
+def _limit_training_process():
+    _lower_priority(os.getpid())
+    try:
+        import resource
+    except ImportError:
+        return
+    if TRAINING_JOB_LIMITS['cpu_seconds']:
+        # RLIMIT_CPU counts from process start, which includes importing this module
+        limit = math.ceil(sum(os.times()[:2])) + TRAINING_JOB_LIMITS['cpu_seconds']
+        # SIGXCPU at the soft limit lets the job record why it stopped; SIGKILL follows at the hard one
+        resource.setrlimit(resource.RLIMIT_CPU, (limit, limit + 5))
+    if TRAINING_JOB_LIMITS['memory_mb']:
+        limit = TRAINING_JOB_LIMITS['memory_mb'] * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def _job_progress(job_id, started, stop):
+    # Heartbeat: resource usage and the trainer's latest output line, every 2 s
+    log_path = os.path.join(TRAINING_JOBS_DIR, f"{job_id}.log")
+    while not stop.wait(2):
+        try:
+            with open(log_path, 'rb') as f:
+                f.seek(max(0, os.path.getsize(log_path) - 4096))
+                lines = [line.strip() for line in f.read().decode('utf-8', 'replace').splitlines() if line.strip()]
+        except OSError:
+            lines = []
+        _update_job(job_id, elapsed_s=round(time.perf_counter() - started, 1),
+                    cpu_s=round(sum(os.times()[:2]), 1), peak_memory_mb=_peak_memory_mb(),
+                    progress=lines[-1][:200] if lines else None)
+
+def run_training_job(job_id):
+    """
+    Body of a training job process: waits for a worker slot, trains into a
+    staging directory under TRAINING_JOBS_DIR and, if a new model was built,
+    publishes it by renaming the artifact and then its manifest over the
+    serving ones. A failed or killed job never touches the serving artifact.
+    """
+    job = _read_job(job_id)
+    if job is None:
+        print(f"Error: no training job {job_id}")
+        return
+    slot, slot_handle = _acquire_training_slot()
+    _limit_training_process()
+
+    def cpu_limit_reached(signum, frame):
+        raise TimeoutError(f"CPU limit of {TRAINING_JOB_LIMITS['cpu_seconds']} s reached")
+    signal.signal(signal.SIGXCPU, cpu_limit_reached)
+
+    artifact = job['artifact']
+    staging_dir = os.path.join(TRAINING_JOBS_DIR, job_id)
+    staged = os.path.join(staging_dir, os.path.basename(artifact))
+    os.makedirs(staging_dir, exist_ok=True)
+    if not job.get('force') and os.path.exists(artifact) and os.path.exists(_manifest_path(artifact)):
+        # Seeded with the serving version so an unchanged dataset is reused rather than refit. The
+        # artifact may be hard-linked since trainers replace it by rename; the manifest is rewritten in place.
+        try:
+            os.link(artifact, staged)
+        except OSError:
+            shutil.copy2(artifact, staged)
+        shutil.copy2(_manifest_path(artifact), _manifest_path(staged))
+
+    started = time.perf_counter()
+    _update_job(job_id, status="running", pid=os.getpid(), slot=slot, started_at=time.strftime('%Y-%m-%dT%H:%M:%S'))
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_job_progress, args=(job_id, started, stop), daemon=True)
+    heartbeat.start()
+    try:
+        metrics = TRAINING_TASKS[job['task']](model_output_path=staged, force=job.get('force', False))
+        outcome = _TRAINING_OUTCOMES.get(staged, 'failed') if isinstance(metrics, dict) else 'failed'
+        result = {"status": outcome, "metrics": metrics if isinstance(metrics, dict) else None}
+        if outcome == 'rebuilt':
+            os.replace(staged, artifact)
+            for sidecar_path in TRAINING_SIDECARS:
+                if os.path.exists(sidecar_path(staged)):
+                    os.replace(sidecar_path(staged), sidecar_path(artifact))
+            os.replace(_manifest_path(staged), _manifest_path(artifact))
+            _invalidate_shared_results(artifact)
+            result.update(status="published", sha256=_file_sha256(artifact))
+        elif outcome == 'failed':
+            result["error"] = "Trainer did not produce a model; see the job log"
+    except (TimeoutError, MemoryError) as e:
+        result = {"status": "failed", "error": f"{type(e).__name__}: {e}" if str(e) else "Memory limit reached"}
+    except Exception as e:
+        result = {"status": "failed", "error": f"Unhandled error: {e}"}
+    finally:
+        stop.set()
+        heartbeat.join()
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        slot_handle.close()
+    print(f"Training job {job_id}: {result['status']}")
+    _update_job(job_id, **result, finished_at=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                wall_time_s=round(time.perf_counter() - started, 3), cpu_s=round(sum(os.times()[:2]), 1),
+                peak_memory_mb=_peak_memory_mb(), progress=None)
+
+def training_status(input_data_dict=None):
+    """
+    Returns one job ({"job_id": ...}) or the most recent jobs ({"limit": n},
+    default 20), newest first. A running job whose process has died (killed
+    for exceeding its hard limits) is reported as failed.
+    """
+    input_data_dict = input_data_dict or {}
+    _reap_training_processes()
+    if input_data_dict.get('job_id'):
+        job_ids = [input_data_dict['job_id']]
+        try:
+            _job_path(job_ids[0])
+        except ValueError as e:
+            return {"error": str(e)}
+    else:
+        try:
+            names = [name for name in os.listdir(TRAINING_JOBS_DIR) if name.endswith('.json')]
+        except OSError:
+            names = []
+        job_ids = sorted((name[:-len('.json')] for name in names), reverse=True)[:int(input_data_dict.get('limit', 20))]
+
+    jobs = []
+    for job_id in job_ids:
+        job = _read_job(job_id)
+        if job is None:
+            if input_data_dict.get('job_id'):
+                return {"error": f"No training job {job_id}"}
+            continue
+        if job.get('status') == 'running' and job.get('pid') and not _pid_alive(job['pid']):
+            job = _update_job(job_id, status="failed", error="Job process exited without finishing (killed at its CPU or memory limit?)")
+        jobs.append(job)
+    if input_data_dict.get('job_id'):
+        return jobs[0]
+    return {"jobs": jobs, "workers": TRAINING_JOB_WORKERS, "limits": TRAINING_JOB_LIMITS}
+
+# ===============================================
+# === ESTIMATOR BACKEND COMPARISON ===
+# ===============================================
+
+def compare_estimators(task_names=None, tolerance=0.01, report_path='estimator_comparison.json'):
+    """
+    Trains each model that supports an estimator backend once per backend, into
+    a scratch directory so production artifacts are untouched, and reports
+    training time, artifact size and accuracy (R2 for regressors) side by side.
+    The recommended backend is the fastest one whose score is within tolerance
+    of the best score for that model.
+    """
+    global FEATURE_CACHE_DIR
+    supported = [name for name, trainer in TRAINING_TASKS.items()
+                 if 'estimator' in inspect.signature(trainer).parameters]
+    task_names = task_names or supported
+    unsupported = [name for name in task_names if name not in supported]
+    if unsupported:
+        print(f"Error: {unsupported} do not support estimator backends. Supported: {supported}")
+        return
+
+    comparison = {}
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        for name in task_names:
+            rows = []
+            for backend in ESTIMATOR_BACKENDS:
+                output_path = os.path.join(scratch_dir, f"{name}_{backend}.joblib")
+                # An empty feature cache per run, so no backend is timed on matrices another run built
+                production_cache_dir = FEATURE_CACHE_DIR
+                FEATURE_CACHE_DIR = os.path.join(scratch_dir, f"feature_cache_{name}_{backend}")
+                start = time.perf_counter()
+                try:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        metrics = TRAINING_TASKS[name](model_output_path=output_path, estimator=backend, force=True)
+                finally:
+                    FEATURE_CACHE_DIR = production_cache_dir
+                train_time = time.perf_counter() - start
+                if not isinstance(metrics, dict):
+                    rows.append({"backend": backend, "status": "failed"})
+                    continue
+                # Backends only swap the tree model, so multi-head trainers are compared on that head
+                score_name = next(name for name in ("accuracy", "r2", "stay_r2") if name in metrics)
+                rows.append({
+                    "backend": backend,
+                    "status": "ok",
+                    "train_time_s": round(train_time, 3),
+                    "artifact_mb": round(os.path.getsize(output_path) / (1024 * 1024), 3),
+                    "score_name": score_name,
+                    "score": metrics[score_name],
+                    "metrics": metrics
+                })
+
+            ok_rows = [row for row in rows if row["status"] == "ok"]
+            recommended = None
+            if ok_rows:
+                best = max(row["score"] for row in ok_rows)
+                eligible = [row for row in ok_rows if row["score"] >= best - tolerance]
+                recommended = min(eligible, key=lambda row: row["train_time_s"])["backend"]
+            comparison[name] = {"backends": rows, "recommended": recommended}
+
+    print("\n--- Estimator Backend Comparison ---")
+    print(f"{'Model':<26}{'Backend':<26}{'Train (s)':>10}{'Size (MB)':>11}{'Score':>16}")
+    for name, result in comparison.items():
+        for row in result["backends"]:
+            if row["status"] != "ok":
+                print(f"{name:<26}{row['backend']:<26}{'failed':>10}")
+                continue
+            marker = " *" if row["backend"] == result["recommended"] else ""
+            score = f"{row['score_name']}={row['score']:.4f}"
+            print(f"{name:<26}{row['backend']:<26}{row['train_time_s']:>10}{row['artifact_mb']:>11}{score:>16}{marker}")
+    print("* fastest backend within tolerance of the best score")
+    print("-" * 50 + "\n")
+
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump(comparison, f, indent=2, default=str)
+        print(f"Comparison report saved to {report_path}")
+    return comparison
+
 # ===============================================
 # === MAIN EXECUTION BLOCK ===
 # ===============================================
@@ -2156,10 +4300,18 @@ if __name__ == "__main__":
         print(json.dumps({"error": "No command provided"}))
         sys.exit(1)
 
+    if '--force' in sys.argv:
+        # Bypass the training cache; the environment variable also reaches pool workers
+        sys.argv.remove('--force')
+        os.environ['ML_FORCE_RETRAIN'] = '1'
+
     command = sys.argv[1]
 
     input_data = {}
-    if len(sys.argv) > 2:
+    if len(sys.argv) > 2 and sys.argv[2] == '-':
+        # Payloads too large for the command line are piped in by pythonRunner.js
+        input_data = json.load(sys.stdin)
+    elif len(sys.argv) > 2:
         try:
             if sys.argv[2].strip().startswith('{') or sys.argv[2].strip().startswith('['):
                 input_data = json.loads(sys.argv[2])
@@ -2171,6 +4323,21 @@ if __name__ == "__main__":
     if command == "train":
         csv_file = sys.argv[2] if len(sys.argv) > 2 else '911_calls.csv'
         train_and_save_model(csv_path=csv_file)
+    elif command == "train_stream":
+        csv_file = sys.argv[2] if len(sys.argv) > 2 else '911_calls.csv'
+        chunk_rows = int(sys.argv[3]) if len(sys.argv) > 3 else 100000
+        train_emergency_model_out_of_core(csv_path=csv_file, chunksize=chunk_rows)
+    elif command == "train_all":
+        names = [name for name in sys.argv[2].split(',') if name] if len(sys.argv) > 2 else None
+        workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+        train_all(task_names=names, max_workers=workers)
+    elif command == "convert_datasets":
+        csv_files = [name for name in sys.argv[2].split(',') if name] if len(sys.argv) > 2 else None
+        output_format = sys.argv[3] if len(sys.argv) > 3 else 'auto'
+        convert_datasets(csv_paths=csv_files, fmt=output_format)
+    elif command == "compare_estimators":
+        names = [name for name in sys.argv[2].split(',') if name] if len(sys.argv) > 2 else None
+        compare_estimators(task_names=names)
     elif command == "predict":
         text = input_data.get('text', '')
         print(json.dumps(predict_emergency(text)))
@@ -2183,7 +4350,9 @@ if __name__ == "__main__":
         print(json.dumps(predict_eta_route(input_data)))
     elif command == "train_eta":
         csv_file = sys.argv[2] if len(sys.argv) > 2 else 'eta_data.csv'
-        train_eta_model(csv_path=csv_file)
+        backend = sys.argv[3] if len(sys.argv) > 3 else 'random_forest'
+        encoding = sys.argv[4] if len(sys.argv) > 4 else 'onehot'
+        train_eta_model(csv_path=csv_file, estimator=backend, id_encoding=encoding)
     elif command == "predict_bed_forecast":
         try:
             input_data['emergency_count'] = int(input_data.get('emergency_count', 0))
@@ -2194,9 +4363,14 @@ if __name__ == "__main__":
         print(json.dumps(predict_bed_forecast(input_data)))
     elif command == "train_bed_forecast":
         csv_file = sys.argv[2] if len(sys.argv) > 2 else 'hospital_resource_data.csv'
-        train_bed_forecast_model(csv_path=csv_file)
+        encoding = sys.argv[3] if len(sys.argv) > 3 else 'onehot'
+        train_bed_forecast_model(csv_path=csv_file, id_encoding=encoding)
     elif command == "predict_staff_alloc":
         print(json.dumps(predict_staff_allocation(input_data)))
+    elif command == "predict_staff_rota":
+        print(json.dumps(predict_staff_rota(input_data)))
+    elif command == "compile_staff_lookup":
+        compile_staff_allocation_lookup()
     elif command == "train_staff_alloc":
         csv_file = sys.argv[2] if len(sys.argv) > 2 else 'staff_allocation_data.csv'
         train_staff_allocation_model(csv_path=csv_file)
@@ -2212,7 +4386,8 @@ if __name__ == "__main__":
         print(json.dumps(predict_compatibility(input_data)))
     elif command == "train_recommend":
         csv_file = sys.argv[2] if len(sys.argv) > 2 else 'hospital_data.csv'
-        train_recommendation_model(csv_path=csv_file)
+        backend = sys.argv[3] if len(sys.argv) > 3 else 'random_forest'
+        train_recommendation_model(csv_path=csv_file, estimator=backend)
     elif command == "predict_recommend":
         print(json.dumps(predict_hospital_recommendation(sys.argv[2])))
     elif command == "train_risk":
@@ -2242,12 +4417,14 @@ if __name__ == "__main__":
         print(json.dumps(predict_outbreak_forecast(input_data)))
     elif command == "train_severity":
         csv_file = sys.argv[2] if len(sys.argv) > 2 else 'emergency_severity_data.csv'
-        train_severity_model(csv_path=csv_file)
+        backend = sys.argv[3] if len(sys.argv) > 3 else 'random_forest'
+        train_severity_model(csv_path=csv_file, estimator=backend)
     elif command == "predict_severity":
         print(json.dumps(predict_severity(input_data)))
     elif command == "train_availability":
         csv_file = sys.argv[2] if len(sys.argv) > 2 else 'donor_availability_data.csv'
-        train_availability_model(csv_path=csv_file)
+        backend = sys.argv[3] if len(sys.argv) > 3 else 'random_forest'
+        train_availability_model(csv_path=csv_file, estimator=backend)
     elif command == "predict_availability":
         print(json.dumps(predict_availability(input_data)))
     elif command == "train_allocation":
@@ -2272,7 +4449,8 @@ if __name__ == "__main__":
         print(json.dumps(predict_anomaly(input_data)))
     elif command == "train_hosp_severity":
         csv_file = sys.argv[2] if len(sys.argv) > 2 else 'hospital_severity_data.csv'
-        train_hospital_severity_model(csv_path=csv_file)
+        backend = sys.argv[3] if len(sys.argv) > 3 else 'random_forest'
+        train_hospital_severity_model(csv_path=csv_file, estimator=backend)
     elif command == "predict_hosp_severity":
         print(json.dumps(predict_hospital_severity(input_data)))
     elif command == "train_hosp_perf":
@@ -2287,13 +4465,37 @@ if __name__ == "__main__":
         print(json.dumps(predict_recovery(input_data)))
     elif command == "train_stay":
         csv_file = sys.argv[2] if len(sys.argv) > 2 else 'patient_outcome_data.csv'
-        train_stay_duration_model(csv_path=csv_file)
+        backend = sys.argv[3] if len(sys.argv) > 3 else 'random_forest'
+        train_stay_duration_model(csv_path=csv_file, estimator=backend)
     elif command == "predict_stay":
         print(json.dumps(predict_stay_duration(input_data)))
+    elif command == "train_patient_outcome":
+        csv_file = sys.argv[2] if len(sys.argv) > 2 else 'patient_outcome_data.csv'
+        backend = sys.argv[3] if len(sys.argv) > 3 else 'random_forest'
+        train_patient_outcome_model(csv_path=csv_file, estimator=backend)
+    elif command == "predict_patient_outcome":
+        print(json.dumps(predict_patient_outcome(input_data)))
     elif command == "train_inventory":
         csv_file = sys.argv[2] if len(sys.argv) > 2 else 'inventory_data.csv'
-        train_inventory_model(csv_path=csv_file)
+        backend = sys.argv[3] if len(sys.argv) > 3 else 'random_forest'
+        train_inventory_model(csv_path=csv_file, estimator=backend)
     elif command == "predict_inventory":
         print(json.dumps(predict_inventory(input_data)))
+    elif command == "optimize_dispatch":
+        print(json.dumps(optimize_dispatch(input_data)))
+    elif command == "match_donors":
+        print(json.dumps(match_donors(input_data)))
+    elif command == "predict_inventory_bulk":
+        print(json.dumps(predict_inventory_bulk(input_data)))
+    elif command == "triage_sos":
+        print(json.dumps(triage_sos(input_data)))
     elif command == "predict_sos_severity":
-        print(json.dumps(predict_sos_severity(input_data)))
\ No newline at end of file
+        print(json.dumps(predict_sos_severity(input_data)))
+    elif command == "prediction_cache_stats":
+        print(json.dumps(prediction_cache_stats()))
+    elif command == "submit_training":
+        print(json.dumps(submit_training_job(input_data)))
+    elif command == "run_training_job":
+        run_training_job(sys.argv[2])
+    elif command == "training_status":
+        print(json.dumps(training_status(input_data)))
\ No newline at end of file
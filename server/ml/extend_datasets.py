@@ -1,106 +1,141 @@
 import pandas as pd
 import numpy as np
 import os
-from datetime import datetime, timedelta
-import random
-
-# Set random seeds for reproducibility
-np.random.seed(42)
-random.seed(42)
+import sys
+import time
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Directory containing CSV files
 csv_dir = os.path.dirname(os.path.abspath(__file__))
 target_rows = 2000
+chunk_rows = 500000
+seed = 42
 
 # List of CSV files to exclude
 exclude_files = ['911_calls.csv']
 
 # Helper functions for generating synthetic data based on column types
-def generate_synthetic_row(df, header):
-    """Generate a synthetic row based on existing data patterns"""
-    row = {}
-    
-    for col in header:
-        if df.empty or col not in df.columns:
-            row[col] = ""
-            continue
-            
-        existing_values = df[col].dropna().unique()
-        col_type = df[col].dtype
-        
-        # For categorical/object columns, randomly select from existing values
-        if col_type == 'object' or len(existing_values) < 20:
-            if len(existing_values) > 0:
-                row[col] = random.choice(existing_values)
-            else:
-                row[col] = ""
-        # For numeric columns, generate values in the range of existing data
-        elif col_type in ['int64', 'float64']:
-            numeric_vals = df[col].dropna()
-            if len(numeric_vals) > 0:
-                min_val = numeric_vals.min()
-                max_val = numeric_vals.max()
-                if col_type == 'int64':
-                    row[col] = np.random.randint(int(min_val), int(max_val) + 1)
-                else:
-                    row[col] = round(np.random.uniform(min_val, max_val), 2)
-            else:
-                row[col] = 0
-        else:
-            row[col] = ""
-    
-    return row
-
-def extend_csv(file_path):
-    """Extend a CSV file to have target_rows entries"""
+def profile_column(series):
+    """Profile a column once so new values can be drawn without rescanning the data"""
+    values = series.dropna()
+    unique_values = values.unique()
+
+    # For categorical/text columns (or low-cardinality ones), sample from existing values
+    if not pd.api.types.is_numeric_dtype(series) or len(unique_values) < 20:
+        if len(unique_values) == 0:
+            return {'kind': 'constant', 'value': ""}
+        return {'kind': 'choice', 'values': np.asarray(unique_values, dtype=object)}
+    # For numeric columns, generate values in the range of existing data
+    if pd.api.types.is_integer_dtype(series):
+        return {'kind': 'int', 'low': int(values.min()), 'high': int(values.max())}
+    return {'kind': 'float', 'low': float(values.min()), 'high': float(values.max())}
+
+def draw_column(profile, rng, n):
+    """Draw n synthetic values for a profiled column in a single NumPy call"""
+    kind = profile['kind']
+    if kind == 'choice':
+        return profile['values'][rng.integers(0, len(profile['values']), n)]
+    if kind == 'int':
+        return rng.integers(profile['low'], profile['high'] + 1, n)
+    if kind == 'float':
+        return np.round(rng.uniform(profile['low'], profile['high'], n), 2)
+    return np.full(n, profile['value'], dtype=object)
+
+def generate_synthetic_chunk(profiles, header, rng, n):
+    """Generate n synthetic rows based on existing data patterns"""
+    return pd.DataFrame({col: draw_column(profiles[col], rng, n) for col in header}, columns=header)
+
+def _ensure_trailing_newline(file_path):
+    with open(file_path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b'\n':
+            f.write(b'\n')
+
+def extend_csv(file_path, target=target_rows, output_dir=None, chunk_size=chunk_rows, rng_seed=None):
+    """Extend a CSV file to have target rows, streaming new rows to disk in chunks"""
+    name = os.path.basename(file_path)
     try:
+        start = time.perf_counter()
         # Read the CSV file
         df = pd.read_csv(file_path)
         current_rows = len(df)
-        
-        if current_rows >= target_rows:
-            print(f"✓ {os.path.basename(file_path)}: Already has {current_rows} rows (target: {target_rows})")
-            return True
-        
-        rows_to_add = target_rows - current_rows
+
+        output_path = os.path.join(output_dir, name) if output_dir else file_path
+        if output_path != file_path:
+            shutil.copyfile(file_path, output_path)
+
+        if current_rows >= target:
+            return True, f"✓ {name}: Already has {current_rows} rows (target: {target})"
+
+        rows_to_add = target - current_rows
         header = list(df.columns)
-        
-        print(f"  Extending {os.path.basename(file_path)}: {current_rows} → {target_rows} rows (+{rows_to_add})")
-        
-        # Generate synthetic rows
-        new_rows = []
-        for _ in range(rows_to_add):
-            new_row = generate_synthetic_row(df, header)
-            new_rows.append(new_row)
-        
-        # Create DataFrame from new rows and append
-        new_df = pd.DataFrame(new_rows)
-        extended_df = pd.concat([df, new_df], ignore_index=True)
-        
-        # Save back to CSV
-        extended_df.to_csv(file_path, index=False)
-        print(f"✓ {os.path.basename(file_path)}: Successfully extended to {len(extended_df)} rows")
-        return True
-        
+        profiles = {col: profile_column(df[col]) for col in header}
+        del df
+
+        rng = np.random.default_rng(rng_seed)
+        _ensure_trailing_newline(output_path)
+
+        # Append new rows chunk by chunk so memory stays bounded by chunk_size
+        written = 0
+        while written < rows_to_add:
+            n = min(chunk_size, rows_to_add - written)
+            generate_synthetic_chunk(profiles, header, rng, n).to_csv(output_path, mode='a', header=False, index=False)
+            written += n
+
+        elapsed = time.perf_counter() - start
+        return True, (f"✓ {name}: Extended {current_rows} → {target} rows (+{rows_to_add}) "
+                      f"in {elapsed:.2f}s ({rows_to_add / max(elapsed, 1e-9):,.0f} rows/s)")
+
     except Exception as e:
-        print(f"✗ Error processing {os.path.basename(file_path)}: {str(e)}")
-        return False
-
-# Main execution
-print("="*60)
-print("CSV Dataset Extension Tool")
-print("="*60)
-print(f"Target: {target_rows} entries per dataset\n")
-
-csv_files = [f for f in os.listdir(csv_dir) if f.endswith('.csv') and f not in exclude_files]
-csv_files.sort()
-
-success_count = 0
-for csv_file in csv_files:
-    file_path = os.path.join(csv_dir, csv_file)
-    if extend_csv(file_path):
-        success_count += 1
-
-print("\n" + "="*60)
-print(f"Completed: {success_count}/{len(csv_files)} files extended successfully")
-print("="*60)
+        return False, f"✗ Error processing {name}: {str(e)}"
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Extend the ML CSV datasets with synthetic rows.")
+    parser.add_argument('--target-rows', type=int, default=target_rows, help="Rows per dataset after extension")
+    parser.add_argument('--chunk-size', type=int, default=chunk_rows, help="Rows generated and written per chunk")
+    parser.add_argument('--workers', type=int, default=None, help="Files processed in parallel (default: CPU count)")
+    parser.add_argument('--output-dir', default=None, help="Write extended copies here instead of in place")
+    parser.add_argument('--seed', type=int, default=seed, help="Random seed for reproducibility")
+    parser.add_argument('files', nargs='*', help="CSV files to extend (default: every CSV in this directory)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+
+    print("="*60)
+    print("CSV Dataset Extension Tool")
+    print("="*60)
+    print(f"Target: {args.target_rows} entries per dataset\n")
+
+    if args.files:
+        csv_files = [os.path.abspath(f) for f in args.files]
+    else:
+        csv_files = sorted(os.path.join(csv_dir, f) for f in os.listdir(csv_dir)
+                           if f.endswith('.csv') and f not in exclude_files)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    # One independent, reproducible random stream per file
+    seeds = np.random.SeedSequence(args.seed).spawn(len(csv_files))
+    workers = args.workers or min(len(csv_files), os.cpu_count() or 1) or 1
+
+    success_count = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(extend_csv, path, args.target_rows, args.output_dir, args.chunk_size, file_seed)
+                   for path, file_seed in zip(csv_files, seeds)]
+        for future in as_completed(futures):
+            ok, message = future.result()
+            print(message)
+            success_count += ok
+
+    print("\n" + "="*60)
+    print(f"Completed: {success_count}/{len(csv_files)} files extended successfully")
+    print("="*60)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Encoders for high-cardinality ID columns such as hospital_id.
+
+They live in their own module (not in ai_ml.py) so that fitted pipelines are
+pickled as `ml_encoders.<Class>` and load the same way whether the model was
+trained via `python ai_ml.py ...` or by importing ai_ml.
+"""
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.feature_extraction import FeatureHasher
+
+
+class HashingEncoder(BaseEstimator, TransformerMixin):
+    """Hashes each `column=value` pair into a fixed number of sparse features."""
+
+    def __init__(self, n_features=32):
+        self.n_features = n_features
+
+    def fit(self, X, y=None):
+        self.n_features_in_ = np.shape(X)[1]
+        return self
+
+    def transform(self, X):
+        df = pd.DataFrame(X)
+        # Prefix values with their column position so equal IDs in different columns hash apart
+        tokens = [f"{i}=" + df.iloc[:, i].astype(str) for i in range(df.shape[1])]
+        rows = [list(row) for row in zip(*tokens)]
+        return FeatureHasher(n_features=self.n_features, input_type='string').transform(rows)
+
+    def get_feature_names_out(self, input_features=None):
+        return np.array([f"hash_{i}" for i in range(self.n_features)], dtype=object)
+
+
+class FrequencyEncoder(BaseEstimator, TransformerMixin):
+    """Replaces each ID with its relative frequency in the training data (0 for unseen IDs)."""
+
+    def fit(self, X, y=None):
+        df = pd.DataFrame(X)
+        self.n_features_in_ = df.shape[1]
+        self.frequencies_ = [df.iloc[:, i].value_counts(normalize=True).to_dict() for i in range(df.shape[1])]
+        return self
+
+    def transform(self, X):
+        df = pd.DataFrame(X)
+        return np.column_stack([
+            df.iloc[:, i].map(frequencies).fillna(0.0).to_numpy(dtype=float)
+            for i, frequencies in enumerate(self.frequencies_)
+        ])
+
+    def get_feature_names_out(self, input_features=None):
+        names = input_features if input_features is not None else [f"x{i}" for i in range(self.n_features_in_)]
+        return np.array([f"{name}_frequency" for name in names], dtype=object)
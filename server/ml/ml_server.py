@@ -0,0 +1,1283 @@
+"""
+Long-lived ML serving process for the Node backend.
+
+Spawning `python ai_ml.py <command>` per request pays interpreter start-up and
+model loading every time. This server imports ai_ml once, keeps models
+resident and speaks newline-delimited JSON over TCP:
+
+    request:  {"id": 1, "command": "predict_hosp_severity", "input": {...}}
+    response: {"id": 1, "result": {...}}
+
+Responses may arrive out of order; clients match them up by id.
+Concurrent single-row predictions against the same model are micro-batched:
+requests are collected for up to ML_BATCH_WINDOW_MS (or ML_MAX_BATCH rows),
+scored with one vectorized predict/predict_proba call and fanned back out.
+
+Work is scheduled by priority tier (triage > operational > analytics) and,
+within a tier, earliest deadline first. A request may carry "deadline_ms", its
+latency budget; otherwise the tier default applies. Under overload the server
+answers from rule-based fallbacks and last known forecasts, flagged with
+"degraded": true, so emergency commands keep answering within a hard bound.
+Long-running commands run in killable worker processes under an execution
+budget and time out with a structured error instead of holding a worker.
+Commands are routed by cost class: trivial ones inline on the event loop,
+vectorized models on a thread lane and CPU-heavy ones on a process lane, each
+lane with its own worker count and warm model cache. With --prefork N a
+master loads every model once and forks N supervised server processes that
+share those pages copy-on-write. Retrained artifacts are loaded, smoke-tested
+and swapped in the background, so a retrain needs no restart.
+
+    cd server/ml
+    python ml_server.py --port 8765
+"""
+import argparse
+import asyncio
+import functools
+import gc
+import heapq
+import inspect
+import itertools
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import queue
+import signal
+import socket
+import time
+import traceback
+from collections import defaultdict, namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import joblib
+import pandas as pd
+
+import ai_ml
+
+# ===============================================
+# === COMMANDS ===
+# ===============================================
+
+def _predict_text(input_data):
+    text = input_data.get('text', '') if isinstance(input_data, dict) else str(input_data)
+    return ai_ml.predict_emergency(text)
+
+def _predict_eta(input_data):
+    input_data = dict(input_data)
+    if 'end_node' not in input_data and 'hospital_name' in input_data:
+        input_data['end_node'] = input_data['hospital_name']
+    if 'hour' not in input_data:
+        input_data['hour'] = datetime.now().hour
+    return ai_ml.predict_eta_route(input_data)
+
+def _bed_forecast_input(input_data):
+    input_data = dict(input_data)
+    try:
+        input_data['emergency_count'] = int(input_data.get('emergency_count', 0))
+        input_data['disease_case_count'] = int(input_data.get('disease_case_count', 0))
+        input_data['current_bed_occupancy'] = float(input_data.get('current_bed_occupancy', 0))
+    except (TypeError, ValueError):
+        pass
+    return input_data
+
+def _json_argument(predictor):
+    # A few predictors take the raw JSON string the CLI receives
+    return lambda input_data: predictor(input_data if isinstance(input_data, str) else json.dumps(input_data))
+
+# Prediction commands under the same names ai_ml.py accepts on the command line
+COMMANDS = {
+    "predict": _predict_text,
+    "predict_eta": _predict_eta,
+    "predict_bed_forecast": lambda input_data: ai_ml.predict_bed_forecast(_bed_forecast_input(input_data)),
+    "predict_staff_alloc": ai_ml.predict_staff_allocation,
+    "predict_staff_rota": ai_ml.predict_staff_rota,
+    "predict_hosp_disease": ai_ml.predict_hospital_disease_forecast,
+    "predict_compat": ai_ml.predict_compatibility,
+    "predict_recommend": _json_argument(ai_ml.predict_hospital_recommendation),
+    "predict_risk": ai_ml.predict_health_risk,
+    "predict_cluster": ai_ml.predict_activity_cluster,
+    "predict_forecast": ai_ml.predict_behavior_forecast,
+    "predict_hotspot": _json_argument(ai_ml.predict_emergency_hotspots),
+    "predict_forecast_outbreak": ai_ml.predict_outbreak_forecast,
+    "predict_severity": ai_ml.predict_severity,
+    "predict_availability": ai_ml.predict_availability,
+    "predict_allocation": ai_ml.predict_allocation,
+    "predict_policy_seg": ai_ml.predict_policy_segmentation,
+    "predict_perf_score": ai_ml.predict_healthcare_performance,
+    "predict_anomaly": ai_ml.predict_anomaly,
+    "predict_hosp_severity": ai_ml.predict_hospital_severity,
+    "predict_hosp_perf": ai_ml.predict_hospital_performance,
+    "predict_recovery": ai_ml.predict_recovery,
+    "predict_stay": ai_ml.predict_stay_duration,
+    "predict_patient_outcome": ai_ml.predict_patient_outcome,
+    "predict_inventory": ai_ml.predict_inventory,
+    "predict_inventory_bulk": ai_ml.predict_inventory_bulk,
+    "optimize_dispatch": ai_ml.optimize_dispatch,
+    "match_donors": ai_ml.match_donors,
+    "triage_sos": ai_ml.triage_sos,
+    "predict_sos_severity": ai_ml.predict_sos_severity,
+    "prediction_cache_stats": lambda input_data: ai_ml.prediction_cache_stats(),
+    # Training runs as detached, niced and resource-limited jobs; these only queue and report them
+    "submit_training": ai_ml.submit_training_job,
+    "training_status": ai_ml.training_status,
+}
+
+# ===============================================
+# === PRIORITY SCHEDULING ===
+# ===============================================
+
+TRIAGE, OPERATIONAL, ANALYTICS = 0, 1, 2
+TIER_NAMES = {TRIAGE: "triage", OPERATIONAL: "operational", ANALYTICS: "analytics"}
+
+# Commands not listed here are operational
+COMMAND_TIERS = {
+    "predict_sos_severity": TRIAGE,
+    "triage_sos": TRIAGE,
+    "predict_hosp_severity": TRIAGE,
+    "predict_severity": TRIAGE,
+    "predict": TRIAGE,
+    "predict_eta": TRIAGE,
+    "optimize_dispatch": TRIAGE,
+    "predict_forecast_outbreak": ANALYTICS,
+    "predict_hosp_disease": ANALYTICS,
+    "predict_hotspot": ANALYTICS,
+    "predict_forecast": ANALYTICS,
+    "predict_policy_seg": ANALYTICS,
+    "predict_perf_score": ANALYTICS,
+    "predict_anomaly": ANALYTICS,
+    "predict_cluster": ANALYTICS,
+    "predict_hosp_perf": ANALYTICS,
+    "prediction_cache_stats": ANALYTICS,
+}
+
+# Default latency budget per tier when a request carries no deadline_ms
+TIER_DEADLINE_MS = {TRIAGE: 500, OPERATIONAL: 5000, ANALYTICS: 60000}
+
+def command_tier(command):
+    if command.startswith('train'):
+        return ANALYTICS
+    return COMMAND_TIERS.get(command, OPERATIONAL)
+
+class DeadlineExceeded(Exception):
+    pass
+
+class AdmissionRejected(Exception):
+    pass
+
+# Cost classes: trivially cheap commands run inline on the event loop, vectorized
+# models on the thread lane and CPU-heavy commands on the process lane, so an
+# expensive command never takes a slot a cheap one is waiting for
+INLINE, THREAD, PROCESS = "inline", "thread", "process"
+
+INLINE_COMMANDS = {"predict_sos_severity"}
+
+def command_cost_class(command):
+    if command in INLINE_COMMANDS:
+        return INLINE
+    if command in EXECUTION_BUDGETS_S:
+        return PROCESS
+    return THREAD
+
+class PriorityScheduler:
+    """
+    Runs blocking work on per-cost-class lanes (a thread pool each, sized to
+    the lane's workers), always dispatching the most urgent queued job whose
+    lane has a free slot: lowest tier first, then earliest deadline. Process
+    lane threads only wait on worker processes, so the lane's capacity is the
+    number of worker processes. Jobs whose deadline passes while queued are
+    dropped rather than run late.
+
+    Analytics work may hold at most analytics_slots workers per lane, so a burst
+    of slow forecasts can never occupy a whole lane. It is also deferred (kept
+    queued) whenever triage is threatened: triage work is waiting, or recent
+    triage latency is above triage_pressure of its budget. While deferred, new
+    analytics requests beyond max_deferred are rejected outright. Deferred jobs
+    are re-dispatched when the pressure window closes or their deadline passes,
+    even if no other job starts or finishes in the meantime.
+    """
+
+    # How long a triage latency measurement counts as current load
+    PRESSURE_WINDOW_S = 5.0
+
+    def __init__(self, lanes=None, analytics_slots=1, max_deferred=32, triage_pressure=0.5):
+        self.lanes = dict(lanes or {THREAD: 4, PROCESS: 2})
+        self.analytics_slots = max(1, analytics_slots)
+        self.max_deferred = max_deferred
+        self.triage_pressure = triage_pressure
+        self._executors = {lane: ThreadPoolExecutor(max_workers=size, thread_name_prefix=f'ml-{lane}')
+                           for lane, size in self.lanes.items()}
+        self._heap = []
+        self._sequence = itertools.count()
+        self._running = defaultdict(int)
+        self._lane_running = defaultdict(int)
+        self._lane_analytics = defaultdict(int)
+        self._queued = defaultdict(int)
+        # Exponentially weighted triage latency as a fraction of its budget
+        self._triage_load = 0.0
+        self._triage_seen_at = 0.0
+        self._wake = None
+        self._wake_when = 0.0
+        self.completed = defaultdict(int)
+        self.rejected = defaultdict(int)
+        self.deadline_missed = defaultdict(int)
+
+    def queue_depth(self):
+        return sum(self._queued.values())
+
+    def triage_threatened(self):
+        if self._queued[TRIAGE]:
+            return True
+        # Stale measurements say nothing about current load
+        return (time.monotonic() - self._triage_seen_at < self.PRESSURE_WINDOW_S
+                and self._triage_load > self.triage_pressure)
+
+    async def run(self, tier, deadline, fn, *args, lane=THREAD):
+        """Queues fn(*args) on a lane and returns its result; deadline is a time.monotonic() value."""
+        if tier == ANALYTICS and self.triage_threatened() and self._queued[ANALYTICS] >= self.max_deferred:
+            self.rejected[tier] += 1
+            raise AdmissionRejected("Analytics request rejected: triage latency budget is under pressure, retry later")
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (tier, deadline, next(self._sequence), lane, fn, args, future, time.monotonic()))
+        self._queued[tier] += 1
+        self._dispatch()
+        return await future
+
+    def _eligible(self, tier, lane):
+        if self._lane_running[lane] >= self.lanes[lane]:
+            return False
+        if tier != ANALYTICS:
+            return True
+        return (self._lane_analytics[lane] < min(self.analytics_slots, self.lanes[lane])
+                and not self.triage_threatened())
+
+    def _dispatch(self):
+        now = time.monotonic()
+        deferred = []
+        while self._heap and any(self._lane_running[lane] < size for lane, size in self.lanes.items()):
+            job = heapq.heappop(self._heap)
+            tier, deadline, _, lane, fn, args, future, queued_at = job
+            if future.done():
+                self._queued[tier] -= 1
+                continue
+            if now > deadline:
+                self._queued[tier] -= 1
+                self.deadline_missed[tier] += 1
+                future.set_exception(DeadlineExceeded(f"Deadline exceeded after {round((now - queued_at) * 1000, 1)} ms in queue"))
+                continue
+            if not self._eligible(tier, lane):
+                deferred.append(job)
+                continue
+            self._queued[tier] -= 1
+            self._running[tier] += 1
+            self._lane_running[lane] += 1
+            if tier == ANALYTICS:
+                self._lane_analytics[lane] += 1
+            work = asyncio.get_running_loop().run_in_executor(self._executors[lane], fn, *args)
+            work.add_done_callback(functools.partial(self._finished, tier, lane, deadline, future, queued_at))
+        for job in deferred:
+            heapq.heappush(self._heap, job)
+        if deferred:
+            wake_at = min(job[1] for job in deferred)
+            if any(job[0] == ANALYTICS for job in deferred) and self.triage_threatened() and not self._queued[TRIAGE]:
+                wake_at = min(wake_at, self._triage_seen_at + self.PRESSURE_WINDOW_S)
+            self._wake_at(wake_at)
+
+    def _wake_at(self, when):
+        """Re-dispatches at time.monotonic() value when, unless an earlier wake-up is already set."""
+        if self._wake is not None:
+            if self._wake_when <= when:
+                return
+            self._wake.cancel()
+        self._wake = asyncio.get_running_loop().call_later(max(0.0, when - time.monotonic()), self._woken)
+        self._wake_when = when
+
+    def _woken(self):
+        self._wake = None
+        self._dispatch()
+
+    def _finished(self, tier, lane, deadline, future, queued_at, work):
+        self._running[tier] -= 1
+        self._lane_running[lane] -= 1
+        if tier == ANALYTICS:
+            self._lane_analytics[lane] -= 1
+        self.completed[tier] += 1
+        if tier == TRIAGE:
+            budget = max(deadline - queued_at, 1e-3)
+            self._triage_load = 0.8 * self._triage_load + 0.2 * ((time.monotonic() - queued_at) / budget)
+            self._triage_seen_at = time.monotonic()
+        if not future.done():
+            if work.exception() is not None:
+                future.set_exception(work.exception())
+            else:
+                future.set_result(work.result())
+        self._dispatch()
+
+    def stats(self):
+        return {
+            "lanes": {lane: {"workers": size, "running": self._lane_running[lane]} for lane, size in self.lanes.items()},
+            "analytics_slots": self.analytics_slots,
+            "triage_threatened": self.triage_threatened(),
+            "triage_latency_budget_used": round(self._triage_load, 3),
+            "tiers": {name: {"queued": self._queued[tier], "running": self._running[tier],
+                             "completed": self.completed[tier], "rejected": self.rejected[tier],
+                             "deadline_missed": self.deadline_missed[tier]}
+                      for tier, name in TIER_NAMES.items()}
+        }
+
+# ===============================================
+# === MICRO-BATCHING ===
+# ===============================================
+
+# frame builds the model input from the request dicts; format turns one row of
+# model output into the same response the single-row predictor returns
+BatchSpec = namedtuple('BatchSpec', ['model_path', 'method', 'frame', 'format', 'prepare'])
+BatchSpec.__new__.__defaults__ = (pd.DataFrame, None, None)
+
+def _selected_columns(columns, fill_missing=False):
+    if fill_missing:
+        return lambda items: pd.DataFrame([{col: item.get(col) for col in columns} for item in items])
+    return lambda items: pd.DataFrame(items)[columns]
+
+BATCHED_COMMANDS = {
+    "predict_hosp_severity": BatchSpec('hospital_severity_model.joblib', 'predict',
+                                       format=lambda p: {"predicted_severity": str(p)}),
+    "predict_severity": BatchSpec('emergency_severity_model.joblib', 'predict',
+                                  format=lambda p: {"predicted_severity": str(p)}),
+    "predict_availability": BatchSpec('donor_availability_model.joblib', 'predict',
+                                      format=lambda p: {"predicted_availability_score": max(0, min(100, round(p, 2)))}),
+    "predict_compat": BatchSpec('compatibility_model.joblib', 'predict_proba',
+                                format=lambda p: {"probability": round(p[1], 4)}),
+    "predict_recovery": BatchSpec('recovery_model.joblib', 'predict_proba',
+                                  format=lambda p: {"recovery_probability": round(p[1], 4)}),
+    "predict_stay": BatchSpec('stay_duration_model.joblib', 'predict',
+                              frame=_selected_columns(ai_ml.PATIENT_OUTCOME_FEATURES, fill_missing=True),
+                              format=lambda p: {"predicted_stay_days": int(max(1, round(p)))}),
+    "predict_risk": BatchSpec('health_risk_model.joblib', 'predict',
+                              format=lambda p: {"risk_level": {0: 'Low', 1: 'High'}.get(p, 'Unknown'), "risk_value": int(p)}),
+    "predict_anomaly": BatchSpec('anomaly_detection_model.joblib', 'predict',
+                                 format=lambda p: {"is_anomaly": bool(p == -1),
+                                                   "message": "Unusual pattern detected!" if p == -1 else "Data pattern appears normal."}),
+    "predict_bed_forecast": BatchSpec('bed_forecast_model.joblib', 'predict',
+                                      format=lambda p: {"predicted_bed_demand": int(max(0, round(p)))},
+                                      prepare=_bed_forecast_input),
+    "predict_hosp_perf": BatchSpec('hospital_performance_model.joblib', 'predict',
+                                   frame=_selected_columns(['avg_response_time', 'treatment_success_rate',
+                                                            'patient_satisfaction', 'resource_utilization']),
+                                   format=lambda p: {"performance_cluster": {0: "Needs Improvement", 1: "High-performing", 2: "Average"}.get(int(p), "Unknown Segment"),
+                                                     "cluster_id": int(p)}),
+    "predict_cluster": BatchSpec('activity_cluster_model.joblib', 'predict',
+                                 frame=_selected_columns(['sos_usage', 'donations_made', 'health_logs']),
+                                 format=lambda p: {"cluster_label": {0: "Inactive", 1: "Active", 2: "Moderate"}.get(p, "Unknown"),
+                                                   "cluster_id": int(p)}),
+}
+
+def run_batch(command, inputs):
+    """
+    Scores a list of single-row inputs with one vectorized call. Only rows with
+    the first row's keys share the frame: a row missing a feature would get NaN
+    there, which imputing pipelines score silently, so rows with other keys are
+    scored on their own and get the single-row path's answer or error.
+    """
+    spec = BATCHED_COMMANDS[command]
+    if spec.prepare is not None:
+        inputs = [spec.prepare(item) for item in inputs]
+    keys = set(inputs[0]) if isinstance(inputs[0], dict) else None
+    batched = [i for i, item in enumerate(inputs) if isinstance(item, dict) and set(item) == keys]
+    scored = {}
+    if batched:
+        try:
+            model = ai_ml._load_model(spec.model_path)
+            outputs = getattr(model, spec.method)(spec.frame([inputs[i] for i in batched]))
+            scored = {i: spec.format(output) for i, output in zip(batched, outputs)}
+        except Exception:
+            # One malformed row fails the whole vectorized call (as does a missing
+            # model); score row by row so each request gets its own answer or error
+            scored = {}
+    return [scored[i] if i in scored else COMMANDS[command](item) for i, item in enumerate(inputs)]
+
+class MicroBatcher:
+    """
+    Collects concurrent requests per batched command and scores them together.
+    A batch is flushed when max_batch requests are waiting or window_ms after
+    its first request arrived, whichever comes first, so batching adds at most
+    window_ms to any request's latency.
+    """
+
+    def __init__(self, scheduler, window_ms=5.0, max_batch=64):
+        self.scheduler = scheduler
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._pending = {}
+        self._timers = {}
+        self.batches = defaultdict(int)
+        self.rows = defaultdict(int)
+
+    async def submit(self, command, input_data, deadline):
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.setdefault(command, [])
+        pending.append((input_data, future, deadline))
+        if len(pending) >= self.max_batch:
+            self._flush(command)
+        elif command not in self._timers:
+            self._timers[command] = asyncio.get_running_loop().call_later(self.window, self._flush, command)
+        return await future
+
+    def _flush(self, command):
+        timer = self._timers.pop(command, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(command, [])
+        if batch:
+            asyncio.ensure_future(self._run(command, batch))
+
+    async def _run(self, command, batch):
+        self.batches[command] += 1
+        self.rows[command] += len(batch)
+        # The batch is as urgent as its most urgent request
+        deadline = min(item_deadline for _, _, item_deadline in batch)
+        try:
+            results = await self.scheduler.run(command_tier(command), deadline, run_batch, command, [item for item, _, _ in batch])
+        except (DeadlineExceeded, AdmissionRejected) as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        except Exception as e:
+            results = [{"error": f"Batch prediction failed: {e}"}] * len(batch)
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        return {command: {"batches": self.batches[command], "rows": self.rows[command],
+                          "mean_batch_size": round(self.rows[command] / self.batches[command], 2)}
+                for command in self.batches}
+
+# ===============================================
+# === LOAD SHEDDING ===
+# ===============================================
+
+SEVERITY_TEXT_FIELDS = ['message', 'symptoms', 'description', 'notes', 'text']
+
+def _severity_fallback(command, input_data):
+    # Keyword scoring of whatever free text the request carries
+    text = input_data if isinstance(input_data, str) else ' '.join(
+        str(input_data.get(field)) for field in SEVERITY_TEXT_FIELDS if input_data.get(field))
+    sos = ai_ml.predict_sos_severity({"message": text})
+    if command in ("predict_sos_severity", "triage_sos"):
+        return sos
+    # Without a keyword match, use Medium as predict_sos_severity does on failure rather than under-triage as Low
+    _, tier = ai_ml._sos_keyword_score(text.lower())
+    return {"predicted_severity": sos["severity_level"] if tier else "Medium"}
+
+def _eta_fallback(input_data):
+    # Shortest-path time on the city graph, without the traffic model
+    input_data = dict(input_data)
+    start_node = input_data.get('start_node')
+    end_node = input_data.get('end_node') or input_data.get('hospital_name')
+    G = ai_ml._get_city_graph()
+    if start_node not in G or end_node not in G:
+        return {"error": f"Invalid node. Must be one of: {list(G.nodes())}"}
+    try:
+        path = ai_ml.nx.dijkstra_path(G, source=start_node, target=end_node, weight='weight')
+        base_time = ai_ml.nx.dijkstra_path_length(G, source=start_node, target=end_node, weight='weight')
+    except ai_ml.nx.NetworkXNoPath:
+        return {"error": f"No path found between {start_node} and {end_node}."}
+    return {
+        "route": path,
+        "base_minutes": round(base_time, 2),
+        "traffic_multiplier": 1.0,
+        "eta_minutes": round(base_time, 2)
+    }
+
+# Cheap answers computed inline on the event loop, never queued behind model work
+FALLBACKS = {
+    "predict_sos_severity": lambda input_data: _severity_fallback("predict_sos_severity", input_data),
+    "triage_sos": lambda input_data: _severity_fallback("triage_sos", input_data),
+    "predict_hosp_severity": lambda input_data: _severity_fallback("predict_hosp_severity", input_data),
+    "predict_severity": lambda input_data: _severity_fallback("predict_severity", input_data),
+    "predict_eta": _eta_fallback,
+}
+
+# Forecasts served from their last successful result while degraded
+MATERIALIZED_COMMANDS = {"predict_forecast_outbreak", "predict_hosp_disease", "predict_forecast", "predict_hotspot"}
+
+def _degraded(result, reason, **extra):
+    return dict(result, degraded=True, degraded_reason=reason, **extra)
+
+class LoadShedder:
+    """
+    Tracks queue depth and recent non-analytics latency and switches the server
+    into a degraded mode when either crosses its threshold. It leaves degraded
+    mode once both are back under half their threshold, so it does not flap.
+    Emergency (triage) commands with a fallback are also held to
+    hard_limit_ms even in normal mode: if the model has not answered by then,
+    the rule-based answer is returned instead.
+    """
+
+    def __init__(self, max_queue_depth=64, max_latency_ms=1000, hard_limit_ms=250, materialized_entries=1024):
+        self.max_queue_depth = max_queue_depth
+        self.max_latency_ms = max_latency_ms
+        self.hard_limit = hard_limit_ms / 1000
+        self.materialized_entries = materialized_entries
+        self.latency_ms = 0.0
+        self.reason = None
+        self.degraded_responses = defaultdict(int)
+        self._materialized = OrderedDict()
+
+    def observe(self, tier, latency_ms):
+        if tier != ANALYTICS:
+            self.latency_ms = 0.9 * self.latency_ms + 0.1 * latency_ms
+
+    def check(self, scheduler):
+        depth = scheduler.queue_depth()
+        if self.reason is None:
+            if depth >= self.max_queue_depth:
+                self.reason = f"queue depth {depth} >= {self.max_queue_depth}"
+            elif self.latency_ms >= self.max_latency_ms:
+                self.reason = f"latency {round(self.latency_ms)} ms >= {self.max_latency_ms} ms"
+        elif depth < self.max_queue_depth / 2 and self.latency_ms < self.max_latency_ms / 2:
+            self.reason = None
+        return self.reason
+
+    def materialize(self, command, input_data, result):
+        if isinstance(result, dict) and "error" in result:
+            return
+        key = (command, ai_ml._canonical_input(input_data))
+        self._materialized[key] = (time.time(), result)
+        self._materialized.move_to_end(key)
+        while len(self._materialized) > self.materialized_entries:
+            self._materialized.popitem(last=False)
+
+    def materialized(self, command, input_data):
+        return self._materialized.get((command, ai_ml._canonical_input(input_data)))
+
+    def stats(self):
+        return {
+            "degraded": self.reason is not None,
+            "reason": self.reason,
+            "latency_ms_ewma": round(self.latency_ms, 2),
+            "degraded_responses": dict(self.degraded_responses),
+            "materialized_results": len(self._materialized)
+        }
+
+# ===============================================
+# === BOUNDED EXECUTION ===
+# ===============================================
+
+# Execution budgets (seconds) for commands that can run for seconds. These run in
+# killable worker processes; a request's remaining deadline can shorten its budget.
+EXECUTION_BUDGETS_S = {
+    "predict_forecast_outbreak": 20,
+    "predict_hosp_disease": 20,
+    "predict_forecast": 20,
+    "predict_hotspot": 20,
+    "match_donors": 30,
+    "predict_inventory_bulk": 30,
+}
+
+class ExecutionTimeout(Exception):
+
+    def __init__(self, command, budget_s, elapsed_s, cpu_s):
+        super().__init__(f"{command} exceeded its {round(budget_s, 3)} s execution budget and was cancelled")
+        self.budget_s = budget_s
+        self.elapsed_s = elapsed_s
+        self.cpu_s = cpu_s
+
+    def to_result(self):
+        return {
+            "error": str(self),
+            "timed_out": True,
+            "budget_ms": round(self.budget_s * 1000, 1),
+            "elapsed_ms": round(self.elapsed_s * 1000, 1),
+            # CPU time burnt before the worker was killed (None where /proc is unavailable)
+            "cpu_ms": round(self.cpu_s * 1000, 1) if self.cpu_s is not None else None
+        }
+
+def _process_cpu_seconds(pid):
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, IndexError, ValueError):
+        return None
+
+# Models the process lane needs, loaded by each worker as soon as it starts
+PROCESS_WARM_MODELS = ['outbreak_forecast_models.joblib', 'hospital_disease_models.joblib', 'behavior_forecast_model.joblib',
+                       'emergency_hotspot_model.joblib', 'compatibility_model.joblib']
+
+# Models the thread lane needs, loaded once before the server starts listening
+THREAD_WARM_MODELS = sorted({spec.model_path for spec in BATCHED_COMMANDS.values()} |
+                            {'emergency_classifier.joblib', 'eta_model.joblib', 'allocation_q_table.joblib',
+                             'staff_allocation_model.joblib', 'patient_outcome_model.joblib'})
+
+def _warm_models(model_paths):
+    loaded = []
+    for model_path in model_paths:
+        try:
+            ai_ml._load_model(model_path)
+            loaded.append(model_path)
+        except Exception:
+            # Missing or unloadable models report their error when first requested
+            pass
+    return loaded
+
+def _worker_main(conn):
+    # Child process loop: runs commands until the parent closes its end of the pipe
+    _warm_models(PROCESS_WARM_MODELS)
+    while True:
+        try:
+            command, input_data = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            result = COMMANDS[command](input_data)
+        except Exception as e:
+            result = {"error": f"An error occurred while serving {command}: {e}"}
+        conn.send(result)
+
+class _ZygoteWorker:
+    """Process handle for a worker forked by a WorkerZygote, which also reaps it."""
+
+    def __init__(self, pid):
+        self.pid = pid
+
+    def is_alive(self):
+        try:
+            os.kill(self.pid, 0)
+        except ProcessLookupError:
+            return False
+        return True
+
+    def join(self, timeout=None):
+        end = None if timeout is None else time.monotonic() + timeout
+        while self.is_alive() and (end is None or time.monotonic() < end):
+            time.sleep(0.01)
+
+    def terminate(self):
+        self._signal(signal.SIGTERM)
+
+    def kill(self):
+        self._signal(signal.SIGKILL)
+
+    def _signal(self, signum):
+        try:
+            os.kill(self.pid, signum)
+        except ProcessLookupError:
+            pass
+
+class WorkerZygote:
+    """
+    Fork template for process lane workers in pre-fork mode. The master forks it
+    right after gc.freeze(), while the master is single-threaded and holds every
+    model. The zygote then forks each worker from that state, so the workers of
+    all server processes share the master's model pages copy-on-write instead of
+    each loading private copies. A request is the worker's end of a socket pair,
+    passed over a Unix socket that the server processes inherit. The new worker
+    sends its pid down that channel first.
+    """
+
+    def __init__(self):
+        self._requests, zygote_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.pid = os.fork()
+        if self.pid == 0:
+            self._requests.close()
+            self._serve(zygote_end)
+        zygote_end.close()
+
+    @staticmethod
+    def _serve(requests):
+        # Ignoring SIGCHLD makes the kernel reap exited workers
+        signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        while True:
+            try:
+                _, fds, _, _ = socket.recv_fds(requests, 16, 1)
+            except OSError:
+                fds = []
+            if not fds:
+                # Every process holding the request socket has closed it
+                os._exit(0)
+            if os.fork() == 0:
+                requests.close()
+                signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                conn = multiprocessing.connection.Connection(fds[0])
+                try:
+                    conn.send(os.getpid())
+                    _worker_main(conn)
+                finally:
+                    os._exit(0)
+            os.close(fds[0])
+
+    def spawn(self):
+        """Returns (pid, connection) for a new worker."""
+        parent_end, worker_end = socket.socketpair()
+        try:
+            socket.send_fds(self._requests, [b'w'], [worker_end.fileno()])
+        finally:
+            worker_end.close()
+        conn = multiprocessing.connection.Connection(parent_end.detach())
+        return conn.recv(), conn
+
+    def close(self):
+        self._requests.close()
+        try:
+            os.kill(self.pid, signal.SIGTERM)
+            os.waitpid(self.pid, 0)
+        except (ProcessLookupError, ChildProcessError):
+            pass
+
+class WorkerProcess:
+    """A single child process that can be killed mid-command and replaced."""
+
+    def __init__(self, context, zygote=None):
+        self._context = context
+        self._zygote = zygote
+        self.restarts = 0
+        self._start()
+
+    def _start(self):
+        if self._zygote is not None:
+            pid, self.conn = self._zygote.spawn()
+            self.process = _ZygoteWorker(pid)
+            return
+        self.conn, child_conn = self._context.Pipe()
+        self.process = self._context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def restart(self):
+        self.conn.close()
+        self.process.terminate()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.restarts += 1
+        self._start()
+
+    def call(self, command, input_data, budget_s):
+        start = time.perf_counter()
+        cpu_start = _process_cpu_seconds(self.process.pid)
+        try:
+            self.conn.send((command, input_data))
+            if self.conn.poll(budget_s):
+                return self.conn.recv()
+        except (EOFError, OSError):
+            self.restart()
+            return {"error": f"The worker running {command} exited unexpectedly"}
+        cpu_end = _process_cpu_seconds(self.process.pid)
+        self.restart()
+        cpu_s = cpu_end - cpu_start if cpu_start is not None and cpu_end is not None else None
+        raise ExecutionTimeout(command, budget_s, time.perf_counter() - start, cpu_s)
+
+class ProcessWorkerPool:
+    """
+    Fixed set of worker processes for budgeted commands. Workers are forked from
+    a forkserver that has already imported ai_ml (or, in pre-fork mode, from the
+    master's WorkerZygote), so a worker killed on timeout is replaced in
+    milliseconds and its slot is immediately usable again.
+    """
+
+    def __init__(self, size=2, zygote=None):
+        context = None
+        if zygote is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            if 'forkserver' in methods:
+                context.set_forkserver_preload(['ai_ml'])
+        self._workers = [WorkerProcess(context, zygote) for _ in range(size)]
+        self._idle = queue.Queue()
+        for worker in self._workers:
+            self._idle.put(worker)
+        self.timeouts = defaultdict(int)
+
+    def call(self, command, input_data, deadline):
+        """Blocking; meant to run on a scheduler thread."""
+        worker = self._idle.get()
+        try:
+            budget_s = min(EXECUTION_BUDGETS_S[command], max(deadline - time.monotonic(), 0.001))
+            return worker.call(command, input_data, budget_s)
+        except ExecutionTimeout:
+            self.timeouts[command] += 1
+            raise
+        finally:
+            self._idle.put(worker)
+
+    def close(self):
+        for worker in self._workers:
+            worker.conn.close()
+            worker.process.join(1)
+            if worker.process.is_alive():
+                worker.process.kill()
+
+    def stats(self):
+        return {
+            "workers": len(self._workers),
+            "pids": [worker.process.pid for worker in self._workers],
+            "idle": self._idle.qsize(),
+            "restarts": sum(worker.restarts for worker in self._workers),
+            "timeouts": dict(self.timeouts)
+        }
+
+# ===============================================
+# === HOT RELOAD ===
+# ===============================================
+
+_PATIENT = {"age": 68, "bmi": 33.9, "heart_rate": 122, "blood_pressure": 145, "diagnosis": "Covid", "treatment_type": "Therapy"}
+
+# A canned request per served artifact: the predictor that loads it and one input
+# it must answer before a retrained version is installed
+SMOKE_INPUTS = {
+    "emergency_classifier.joblib": (ai_ml.predict_emergency, "car accident on the highway, driver trapped"),
+    "compatibility_model.joblib": (ai_ml.predict_compatibility, {
+        "receiver_blood_type": "A-", "receiver_age": 64, "receiver_gender": "Female", "donor_blood_type": "A-",
+        "donor_age": 29, "donor_gender": "Female", "organ_type": "Kidney", "location_distance": 113.2}),
+    "hospital_recommendation_model.joblib": (ai_ml.predict_hospital_recommendation, json.dumps([
+        {"emergency_type": "cardiac_issue", "distance_km": 12.5, "traffic_level": 3, "hospital_rating": 4.2}])),
+    "health_risk_model.joblib": (ai_ml.predict_health_risk, {
+        "age": 36, "bmi": 29.8, "blood_pressure": 159, "heart_rate": 63, "has_condition": 1, "lifestyle_factor": "Unhealthy"}),
+    "activity_cluster_model.joblib": (ai_ml.predict_activity_cluster, {"sos_usage": 9, "donations_made": 3, "health_logs": 24}),
+    "behavior_forecast_model.joblib": (ai_ml.predict_behavior_forecast, {"past_donations": 4}),
+    "emergency_hotspot_model.joblib": (ai_ml.predict_emergency_hotspots, json.dumps([
+        {"lat": 12.97, "lng": 74.99, "emergency_type": "Cardiac", "severity": "Low", "timestamp": "2024-01-01 08:00:00"}])),
+    "outbreak_forecast_models.joblib": (ai_ml.predict_outbreak_forecast, {"disease_name": "Flu", "region": "North", "days_to_predict": 3}),
+    "emergency_severity_model.joblib": (ai_ml.predict_severity, {
+        "population_density": 1866.4, "avg_response_time_min": 30.2, "emergency_type": "Cardiac", "region": "South"}),
+    "donor_availability_model.joblib": (ai_ml.predict_availability, {
+        "month": 5, "donation_frequency": 2.3, "hospital_stock_level": 84.4, "region": "North", "resource_type": "Kidney"}),
+    "allocation_q_table.joblib": (ai_ml.predict_allocation, {"emergency_count": 12, "hospital_capacity_percent": 70, "region_id": 0}),
+    "policy_segmentation_model.joblib": (ai_ml.predict_policy_segmentation, {
+        "emergency_rate": 5.2, "avg_response_time": 22.7, "hospital_bed_occupancy": 37.3}),
+    "healthcare_performance_model.joblib": (ai_ml.predict_healthcare_performance, {
+        "emergency_rate": 5.2, "avg_response_time": 22.7, "hospital_bed_occupancy": 37.3}),
+    "anomaly_detection_model.joblib": (ai_ml.predict_anomaly, {
+        "daily_emergency_count": 68, "hospital_admissions": 117, "disease_reports": 28, "region": "South"}),
+    "hospital_severity_model.joblib": (ai_ml.predict_hospital_severity, {
+        "age": 45, "heart_rate": 74, "blood_pressure_systolic": 179, "distance_km": 18.3, "emergency_type": "Fire"}),
+    "eta_model.joblib": (ai_ml.predict_eta_route, {"start_node": "Mercy West", "end_node": "West Suburbs", "hour": 9}),
+    "bed_forecast_model.joblib": (ai_ml.predict_bed_forecast, {
+        "hospital_id": 6, "emergency_count": 14, "disease_case_count": 89, "current_bed_occupancy": 0.39}),
+    "staff_allocation_model.joblib": (ai_ml.predict_staff_allocation, {"patient_load": "Low", "department": "ER", "shift": "Morning"}),
+    "hospital_performance_model.joblib": (ai_ml.predict_hospital_performance, {
+        "avg_response_time": 18.6, "treatment_success_rate": 0.82, "patient_satisfaction": 2.6, "resource_utilization": 0.3}),
+    "recovery_model.joblib": (ai_ml.predict_recovery, _PATIENT),
+    "stay_duration_model.joblib": (ai_ml.predict_stay_duration, _PATIENT),
+    "patient_outcome_model.joblib": (ai_ml.predict_patient_outcome, _PATIENT),
+    "hospital_disease_models.joblib": (ai_ml.predict_hospital_disease_forecast, {"disease_name": "Flu", "hospital_id": 1, "days_to_predict": 3}),
+    "inventory_prediction_model.joblib": (ai_ml.predict_inventory, {
+        "name": "Gloves", "quantity": 657, "minThreshold": 21, "category": "Consumables", "include_model_forecast": True}),
+}
+
+def _smoke_test(model_path, model, previous):
+    """
+    Raises unless a freshly loaded model answers its canned request. The
+    predictor runs against the candidate, which is registered under a scratch
+    cache key for the duration, so the serving entry is never touched.
+    """
+    smoke = SMOKE_INPUTS.get(os.path.basename(model_path))
+    if smoke is None:
+        # Not a served artifact: at least require the interface of the version it replaces
+        if type(model) is not type(previous):
+            raise TypeError(f"retrained artifact is a {type(model).__name__}, not a {type(previous).__name__}")
+        for method in ('predict', 'predict_proba', 'transform'):
+            if hasattr(previous, method) and not hasattr(model, method):
+                raise TypeError(f"retrained model has no {method}()")
+        return
+    predictor, sample = smoke
+    scratch_path = os.path.join(os.path.dirname(model_path), f".smoke-{os.path.basename(model_path)}")
+    ai_ml._MODEL_CACHE[scratch_path] = (ai_ml._model_version(scratch_path), model)
+    try:
+        # Unwrapped, so the result cache neither answers nor records the smoke request
+        result = inspect.unwrap(predictor)(sample, model_path=scratch_path)
+    finally:
+        ai_ml._MODEL_CACHE.pop(scratch_path, None)
+    if isinstance(result, dict) and "error" in result:
+        raise ValueError(result["error"])
+
+class ModelReloader:
+    """
+    Swaps retrained artifacts into ai_ml's resident model cache without a
+    restart. Every interval_s it stats the files of the loaded models; a file
+    whose size and mtime have changed and then held still for one poll is
+    loaded on a background thread, smoke-tested and installed with a single
+    dict assignment. Requests already holding the old model finish on it and
+    nothing waits for the load. A version that fails to load or predict is
+    not installed (the old model keeps serving) and is not retried until the
+    file changes again.
+    """
+
+    def __init__(self, interval_s=2.0):
+        self.interval = interval_s
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ml-reload')
+        self._seen = {}
+        self._rejected = {}
+        self.reloads = defaultdict(int)
+        self.failures = defaultdict(int)
+        self.last_reload = {}
+        self.last_error = {}
+
+    def changed(self):
+        ready = []
+        for model_path, (version, _) in list(ai_ml._MODEL_CACHE.items()):
+            current = ai_ml._model_version(model_path)
+            previous, self._seen[model_path] = self._seen.get(model_path), current
+            if current is None or current == version or self._rejected.get(model_path) == current:
+                continue
+            if previous == current:
+                ready.append((model_path, current))
+        return ready
+
+    def reload(self, model_path, version):
+        started = time.perf_counter()
+        previous = ai_ml._MODEL_CACHE[model_path][1]
+        try:
+            model = joblib.load(model_path)
+            if ai_ml._model_version(model_path) != version:
+                # Rewritten while loading; the next polls pick up the newer file
+                return False
+            _smoke_test(model_path, model, previous)
+        except Exception as e:
+            self._rejected[model_path] = version
+            self.failures[model_path] += 1
+            self.last_error[model_path] = f"{type(e).__name__}: {e}"
+            print(f"[{os.getpid()}] Kept the resident {model_path}: new version failed validation ({self.last_error[model_path]})", flush=True)
+            return False
+        ai_ml._MODEL_CACHE[model_path] = (version, model)
+        self.reloads[model_path] += 1
+        self.last_reload[model_path] = {"at": datetime.now().isoformat(timespec='seconds'),
+                                        "load_ms": round((time.perf_counter() - started) * 1000, 1)}
+        print(f"[{os.getpid()}] Reloaded {model_path} in {self.last_reload[model_path]['load_ms']} ms", flush=True)
+        return True
+
+    async def run(self):
+        ai_ml.MODEL_HOT_RELOAD = True
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                for model_path, version in self.changed():
+                    await loop.run_in_executor(self._executor, self.reload, model_path, version)
+        finally:
+            ai_ml.MODEL_HOT_RELOAD = False
+
+    def stats(self):
+        return {
+            "interval_s": self.interval,
+            "reloads": dict(self.reloads),
+            "failures": dict(self.failures),
+            "last_reload": dict(self.last_reload),
+            "last_error": dict(self.last_error)
+        }
+
+# ===============================================
+# === SERVER ===
+# ===============================================
+
+# Bulk requests (whole inventory catalogues, donor pools) are far larger than asyncio's 64 KB line default
+MAX_REQUEST_BYTES = int(os.environ.get('ML_MAX_REQUEST_BYTES', 64 * 1024 * 1024))
+
+class MLServer:
+
+    def __init__(self, window_ms=5.0, max_batch=64, workers=4, analytics_slots=1, shedder=None, process_workers=2,
+                 reload_interval_s=2.0, zygote=None):
+        # process_workers=0 runs heavy commands on the thread lane, without a killable execution budget
+        lanes = {THREAD: workers, PROCESS: process_workers} if process_workers else {THREAD: workers}
+        self.scheduler = PriorityScheduler(lanes=lanes, analytics_slots=analytics_slots)
+        self.process_pool = ProcessWorkerPool(size=process_workers, zygote=zygote) if process_workers else None
+        self.batcher = MicroBatcher(self.scheduler, window_ms=window_ms, max_batch=max_batch)
+        self.shedder = shedder or LoadShedder()
+        self.reloader = ModelReloader(interval_s=reload_interval_s) if reload_interval_s > 0 else None
+        self.requests = defaultdict(int)
+        self.latency_ms = defaultdict(float)
+        self.started_at = time.time()
+
+    async def execute(self, command, input_data, deadline):
+        if command == "server_stats":
+            return self.stats()
+        if command not in COMMANDS:
+            return {"error": f"Unknown command: {command}"}
+
+        reason = self.shedder.check(self.scheduler)
+        if reason and command in FALLBACKS:
+            self.shedder.degraded_responses[command] += 1
+            return _degraded(FALLBACKS[command](input_data), reason)
+        if reason and command in MATERIALIZED_COMMANDS:
+            self.shedder.degraded_responses[command] += 1
+            materialized = self.shedder.materialized(command, input_data)
+            if materialized is None:
+                return _degraded({"error": "Forecast is temporarily unavailable while the ML service is overloaded"}, reason)
+            materialized_at, result = materialized
+            return _degraded(result, reason, materialized_at=time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(materialized_at)))
+
+        cost_class = command_cost_class(command)
+        if cost_class == INLINE:
+            return COMMANDS[command](input_data)
+        if command in BATCHED_COMMANDS:
+            work = asyncio.ensure_future(self.batcher.submit(command, input_data, deadline))
+        elif cost_class == PROCESS and self.process_pool:
+            work = asyncio.ensure_future(self.scheduler.run(command_tier(command), deadline, self.process_pool.call,
+                                                            command, input_data, deadline, lane=PROCESS))
+        else:
+            work = asyncio.ensure_future(self.scheduler.run(command_tier(command), deadline, COMMANDS[command], input_data))
+
+        if command_tier(command) == TRIAGE and command in FALLBACKS:
+            try:
+                return await asyncio.wait_for(asyncio.shield(work), self.shedder.hard_limit)
+            except (asyncio.TimeoutError, DeadlineExceeded):
+                # The model keeps running; its answer is simply no longer waited for
+                work.add_done_callback(lambda done: done.cancelled() or done.exception())
+                self.shedder.degraded_responses[command] += 1
+                return _degraded(FALLBACKS[command](input_data), f"no model answer within {round(self.shedder.hard_limit * 1000)} ms")
+
+        result = await work
+        if command in MATERIALIZED_COMMANDS:
+            self.shedder.materialize(command, input_data, result)
+        return result
+
+    async def handle_request(self, request, respond):
+        start = time.perf_counter()
+        command = request.get('command') or ''
+        budget_ms = request.get('deadline_ms') or TIER_DEADLINE_MS[command_tier(command)]
+        deadline = time.monotonic() + float(budget_ms) / 1000
+        try:
+            result = await self.execute(command, request.get('input', {}), deadline)
+        except DeadlineExceeded as e:
+            result = {"error": str(e), "deadline_exceeded": True}
+        except AdmissionRejected as e:
+            result = {"error": str(e), "rejected": True}
+        except ExecutionTimeout as e:
+            result = e.to_result()
+        except Exception as e:
+            result = {"error": f"An error occurred while serving {command}: {e}"}
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.requests[command] += 1
+        self.latency_ms[command] += elapsed_ms
+        self.shedder.observe(command_tier(command), elapsed_ms)
+        await respond({"id": request.get('id'), "result": result})
+
+    async def handle_connection(self, reader, writer):
+        write_lock = asyncio.Lock()
+
+        async def respond(message):
+            async with write_lock:
+                if writer.is_closing():
+                    return
+                writer.write((json.dumps(message, default=str) + '\n').encode())
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    pass
+
+        tasks = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Longer than MAX_REQUEST_BYTES; the stream cannot be resynchronised
+                    await respond({"id": None, "result": {"error": f"Request exceeds {MAX_REQUEST_BYTES} bytes"}})
+                    break
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    await respond({"id": None, "result": {"error": "Invalid JSON request"}})
+                    continue
+                task = asyncio.ensure_future(self.handle_request(request, respond))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def stats(self):
+        return {
+            "pid": os.getpid(),
+            "memory": _process_memory_mb(os.getpid()),
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "requests": {command: {"count": count, "mean_latency_ms": round(self.latency_ms[command] / count, 3)}
+                         for command, count in self.requests.items()},
+            "scheduler": self.scheduler.stats(),
+            "load_shedding": self.shedder.stats(),
+            "process_workers": self.process_pool.stats() if self.process_pool else None,
+            "batching": self.batcher.stats(),
+            "prediction_cache": ai_ml.prediction_cache_stats(),
+            "hot_reload": self.reloader.stats() if self.reloader else None
+        }
+
+    async def serve(self, host=None, port=None, sock=None):
+        """Listens on host:port, or accepts on an already bound socket (pre-fork mode)."""
+        loaded = await asyncio.get_running_loop().run_in_executor(None, _warm_models, THREAD_WARM_MODELS)
+        print(f"[{os.getpid()}] Loaded {len(loaded)} of {len(THREAD_WARM_MODELS)} models for the thread lane", flush=True)
+        if sock is not None:
+            server = await asyncio.start_server(self.handle_connection, sock=sock, limit=MAX_REQUEST_BYTES)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_REQUEST_BYTES)
+        print(f"[{os.getpid()}] ML server listening on {server.sockets[0].getsockname()}", flush=True)
+        serving = asyncio.ensure_future(server.serve_forever())
+        watching = asyncio.ensure_future(self.reloader.run()) if self.reloader else None
+        # Stop cleanly on SIGTERM so worker processes are not orphaned
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                asyncio.get_running_loop().add_signal_handler(sig, serving.cancel)
+            except NotImplementedError:
+                pass
+        try:
+            await serving
+        except asyncio.CancelledError:
+            pass
+        finally:
+            server.close()
+            if watching:
+                watching.cancel()
+            if self.process_pool:
+                self.process_pool.close()
+
+# ===============================================
+# === PRE-FORK WORKERS ===
+# ===============================================
+
+def _process_memory_mb(pid):
+    """(rss, pss, private) in MB; PSS splits shared pages between the processes mapping them."""
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            fields = {line.split(':')[0]: int(line.split()[1]) for line in f if line.endswith('kB\n')}
+    except (OSError, ValueError):
+        return None
+    private = fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    return {"rss_mb": round(fields.get('Rss', 0) / 1024, 1), "pss_mb": round(fields.get('Pss', 0) / 1024, 1),
+            "private_mb": round(private / 1024, 1)}
+
+class PreforkMaster:
+    """
+    Loads every model once, freezes the garbage collector's view of them and
+    forks N server processes that accept on one shared listening socket. The
+    children map the master's model pages copy-on-write; gc.freeze() keeps the
+    collector from writing to those objects' headers and so copying the pages.
+    With a process lane, the process workers are forked from a WorkerZygote
+    the master starts at the same point, so they share those pages too; if the
+    zygote dies it is replaced and the children are restarted onto it.
+    Children that exit are respawned. A child that crashes within
+    CRASH_WINDOW_S of starting is respawned after an increasing delay, so a
+    crash loop does not spin.
+    """
+
+    CRASH_WINDOW_S = 10
+
+    def __init__(self, args, workers):
+        self.args = args
+        self.workers = workers
+        self.children = {}
+        self.crashes = defaultdict(int)
+        self.stopping = False
+        self.zygote = None
+
+    def _spawn(self, slot, sock):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                asyncio.run(_build_server(self.args, self.zygote).serve(sock=sock))
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = (slot, time.monotonic())
+
+    def _stop(self, signum, frame):
+        self.stopping = True
+        self._stop_children()
+
+    def _stop_children(self):
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        loaded = _warm_models(THREAD_WARM_MODELS + PROCESS_WARM_MODELS)
+        print(f"Master {os.getpid()} loaded {len(loaded)} models", flush=True)
+        gc.collect()
+        gc.freeze()
+        if self.args.process_workers:
+            self.zygote = WorkerZygote()
+        sock = socket.create_server((self.args.host, self.args.port))
+        sock.set_inheritable(True)
+
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        for slot in range(self.workers):
+            self._spawn(slot, sock)
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            if self.zygote is not None and pid == self.zygote.pid and not self.stopping:
+                print(f"Worker zygote {pid} exited with status {status}; restarting workers", flush=True)
+                self.zygote.close()
+                self.zygote = WorkerZygote()
+                self._stop_children()
+                continue
+            if pid not in self.children:
+                continue
+            slot, started_at = self.children.pop(pid)
+            if self.stopping:
+                continue
+            if time.monotonic() - started_at < self.CRASH_WINDOW_S:
+                self.crashes[slot] += 1
+            else:
+                self.crashes[slot] = 0
+            delay = min(30, 0.5 * (2 ** self.crashes[slot])) if self.crashes[slot] else 0
+            print(f"Worker {pid} (slot {slot}) exited with status {status}; respawning in {delay:.1f}s", flush=True)
+            time.sleep(delay)
+            self._spawn(slot, sock)
+        if self.zygote is not None:
+            self.zygote.close()
+        sock.close()
+
+def _build_server(args, zygote=None):
+    shedder = LoadShedder(max_queue_depth=args.max_queue_depth, max_latency_ms=args.max_latency_ms,
+                          hard_limit_ms=args.triage_hard_limit_ms)
+    return MLServer(window_ms=args.batch_window_ms, max_batch=args.max_batch,
+                    workers=args.workers, analytics_slots=args.analytics_slots, shedder=shedder,
+                    process_workers=args.process_workers, reload_interval_s=args.reload_interval_s,
+                    zygote=zygote)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve ai_ml predictions over newline-delimited JSON.")
+    parser.add_argument('--host', default=os.environ.get('ML_SERVER_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('ML_SERVER_PORT', 8765)))
+    parser.add_argument('--batch-window-ms', type=float, default=float(os.environ.get('ML_BATCH_WINDOW_MS', 5)))
+    parser.add_argument('--max-batch', type=int, default=int(os.environ.get('ML_MAX_BATCH', 64)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('ML_WORKERS', 4)))
+    parser.add_argument('--analytics-slots', type=int, default=int(os.environ.get('ML_ANALYTICS_SLOTS', 1)))
+    parser.add_argument('--max-queue-depth', type=int, default=int(os.environ.get('ML_MAX_QUEUE_DEPTH', 64)))
+    parser.add_argument('--max-latency-ms', type=float, default=float(os.environ.get('ML_MAX_LATENCY_MS', 1000)))
+    parser.add_argument('--triage-hard-limit-ms', type=float, default=float(os.environ.get('ML_TRIAGE_HARD_LIMIT_MS', 250)))
+    parser.add_argument('--process-workers', type=int, default=int(os.environ.get('ML_PROCESS_WORKERS', 2)))
+    parser.add_argument('--reload-interval-s', type=float, default=float(os.environ.get('ML_RELOAD_INTERVAL_S', 2)),
+                        help="how often to check model artifacts for retrained versions (0: reload on request instead)")
+    parser.add_argument('--prefork', type=int, default=int(os.environ.get('ML_PREFORK_WORKERS', 0)),
+                        help="fork this many server processes sharing the master's models (0: single process)")
+    args = parser.parse_args()
+    if args.prefork > 0:
+        PreforkMaster(args, args.prefork).run()
+    else:
+        asyncio.run(_build_server(args).serve(args.host, args.port))
+
+if __name__ == "__main__":
+    main()
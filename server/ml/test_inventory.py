@@ -33,6 +33,7 @@ print("\n" + "="*80)
 print("INVENTORY PREDICTION TEST RESULTS")
 print("="*80 + "\n")
 
+# Single-item path
 for i, test in enumerate(test_cases, 1):
     result = ai_ml.predict_inventory(test)
     print(f"Test {i}: {test['name'].upper()}")
@@ -42,3 +43,14 @@ for i, test in enumerate(test_cases, 1):
     print(f"  Usage Rate: {result['usage_rate_per_day']} units/day")
     print(f"  Recommendation: {result['recommendation'][:100]}...")
     print()
+
+# Whole catalogue in one call, most urgent first
+bulk = ai_ml.predict_inventory_bulk({"items": test_cases})
+print("="*80)
+print(f"BULK RESULTS (most urgent first): {bulk['summary']}")
+print("="*80 + "\n")
+for result in bulk["items"]:
+    print(f"  {result['item_name']:<12} {result['status']:<30} {result['days_left']:>4} days left")
+    single = ai_ml.predict_inventory(next(t for t in test_cases if t['name'] == result['item_name']))
+    assert single == result, f"Bulk and single-item results differ for {result['item_name']}"
+print()
@@ -0,0 +1,66 @@
+import asyncio
+import os
+import tempfile
+import time
+
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.linear_model import LinearRegression, LogisticRegression
+from sklearn.preprocessing import OneHotEncoder
+
+import ml_server
+from ml_server import PriorityScheduler, TRIAGE, ANALYTICS
+
+
+def test_deferred_analytics_runs_after_triage_pressure_expires():
+    async def scenario():
+        scheduler = PriorityScheduler(lanes={ml_server.THREAD: 2})
+        scheduler.PRESSURE_WINDOW_S = 0.5
+        # Slow triage jobs push the triage latency budget above triage_pressure
+        for _ in range(6):
+            await scheduler.run(TRIAGE, time.monotonic() + 0.1, time.sleep, 0.09)
+        assert scheduler.triage_threatened()
+
+        started = time.monotonic()
+        job = asyncio.ensure_future(scheduler.run(ANALYTICS, started + 10, lambda: "done"))
+        await asyncio.sleep(0.05)
+        assert not job.done(), "Analytics job should be deferred while triage is threatened"
+        # No other job arrives or finishes; only the expiring window may wake it
+        result = await asyncio.wait_for(job, timeout=3)
+        return result, time.monotonic() - started
+
+    result, waited = asyncio.run(scenario())
+    assert result == "done"
+    print(f"Deferred analytics job ran {round(waited, 2)} s after submission")
+
+
+def _patient_outcome_candidate():
+    rows = pd.DataFrame([dict(ml_server._PATIENT, age=age, diagnosis=diagnosis)
+                         for age, diagnosis in [(30, "Flu"), (50, "Covid"), (70, "Covid"), (85, "Flu")]])
+    preprocessor = ColumnTransformer([
+        ('num', 'passthrough', ['age', 'bmi', 'heart_rate', 'blood_pressure']),
+        ('cat', OneHotEncoder(handle_unknown='ignore'), ['diagnosis', 'treatment_type'])
+    ]).fit(rows)
+    features = preprocessor.transform(rows)
+    return {
+        "preprocessor": preprocessor,
+        "recovery": LogisticRegression().fit(features, [1, 1, 0, 0]),
+        "stay_duration": LinearRegression().fit(features, [3, 5, 9, 12])
+    }
+
+
+def test_smoke_test_runs_the_patient_outcome_candidate():
+    # The scratch path never exists on disk, and neither do the legacy recovery/stay models here
+    model_path = os.path.join(tempfile.mkdtemp(), "patient_outcome_model.joblib")
+    ml_server._smoke_test(model_path, _patient_outcome_candidate(), None)
+    try:
+        ml_server._smoke_test(model_path, {"garbage": 1}, None)
+    except ValueError as e:
+        print(f"Broken patient outcome candidate rejected: {e}")
+    else:
+        raise AssertionError("A broken patient outcome candidate passed the smoke test")
+
+
+if __name__ == "__main__":
+    test_deferred_analytics_runs_after_triage_pressure_expires()
+    test_smoke_test_runs_the_patient_outcome_candidate()
@@ -45,6 +45,7 @@ createPredictionRoute('/hosp/predict_severity', 'predict_hosp_severity');
 // Government / Analytics
 createPredictionRoute('/gov/predict_outbreak', 'predict_forecast_outbreak');
 createPredictionRoute('/gov/predict_severity', 'predict_severity');
+createPredictionRoute('/gov/triage_sos', 'triage_sos'); // Cascaded SOS triage, accepts { messages: [...] }
 createPredictionRoute('/gov/predict_availability', 'predict_availability');
 createPredictionRoute('/gov/predict_allocation', 'predict_allocation');
 createPredictionRoute('/gov/predict_policy_segment', 'predict_policy_seg');
@@ -112,6 +113,17 @@ router.post('/hospital/patient/stay', async (req, res) => {
     }
 });
 
+// 8b. Patient Outcome - recovery and stay from one process; accepts { patients: [...] } for list views
+router.post('/hospital/patient/outcome', async (req, res) => {
+    try {
+        const result = await runPythonModel('predict_patient_outcome', req.body);
+        res.json(result);
+    } catch (error) {
+        console.error('Patient Outcome Prediction Error:', error.message);
+        res.status(500).json({ error: error.message });
+    }
+});
+
 // ... existing routes
 // 9. Inventory Prediction
 router.post('/hospital/inventory/predict', async (req, res) => {
@@ -124,6 +136,17 @@ router.post('/hospital/inventory/predict', async (req, res) => {
     }
 });
 
+// 9b. Bulk Inventory Prediction - whole catalogue (or several hospitals), most urgent first
+router.post('/hospital/inventory/predict-bulk', async (req, res) => {
+    try {
+        const result = await runPythonModel('predict_inventory_bulk', req.body);
+        res.json(result);
+    } catch (error) {
+        console.error('Bulk Inventory Prediction Error:', error.message);
+        res.status(500).json({ error: error.message });
+    }
+});
+
 // 10. Ambulance ETA Prediction
 router.post('/ml/predict-eta', async (req, res) => {
     try {
@@ -135,4 +158,15 @@ router.post('/ml/predict-eta', async (req, res) => {
     }
 });
 
+// 11. Multi-incident Ambulance Dispatch Plan
+router.post('/ml/dispatch', async (req, res) => {
+    try {
+        const result = await runPythonModel('optimize_dispatch', req.body);
+        res.json(result);
+    } catch (error) {
+        console.error('Dispatch Optimization Error:', error.message);
+        res.status(500).json({ error: error.message });
+    }
+});
+
 module.exports = router;
\ No newline at end of file
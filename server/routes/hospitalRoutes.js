@@ -46,6 +46,14 @@ router.post('/staff', async (req, res) => {
     } catch (error) { res.status(500).json({ error: error.message }); }
 });
 
+// 4b. Staff Rota - allocation for every department and shift in one call
+router.post('/staff/rota', async (req, res) => {
+    try {
+        const result = await runPythonModel('predict_staff_rota', req.body, ML_SCRIPT);
+        res.json(result);
+    } catch (error) { res.status(500).json({ error: error.message }); }
+});
+
 // 5. Donor Search - using compatibility prediction
 router.post('/donors', async (req, res) => {
     try {
@@ -54,6 +62,14 @@ router.post('/donors', async (req, res) => {
     } catch (error) { res.status(500).json({ error: error.message }); }
 });
 
+// 5b. Donor Matching - rank the whole donor pool for one or more receivers
+router.post('/donors/match', async (req, res) => {
+    try {
+        const result = await runPythonModel('match_donors', req.body, ML_SCRIPT);
+        res.json(result);
+    } catch (error) { res.status(500).json({ error: error.message }); }
+});
+
 // 6. Hospital Performance
 router.post('/performance', async (req, res) => {
     try {
@@ -277,8 +277,12 @@ app.post('/api/alerts', async (req, res) => {
     try {
         const { userId, locationDetails, message } = req.body;
         
-        // 1. Use ML model to analyze severity
-        const severityResult = await runPythonModel('predict_sos_severity', { message }, 'ai_ml.py');
+        // 1. Use ML model to analyze severity (keyword rules first, heavier models only for ambiguous messages)
+        let severityResult = await runPythonModel('triage_sos', { message }, 'ai_ml.py');
+        if (!severityResult || severityResult.error) {
+            // The keyword scorer has no model to fail, so an alert never loses its severity estimate
+            severityResult = await runPythonModel('predict_sos_severity', { message }, 'ai_ml.py');
+        }
         
         // 2. Create the alert in MongoDB with ML-predicted severity
         // Normalize ML severity to match the Alert.schema `priority` enum (High, Medium, Low)
@@ -1,14 +1,113 @@
 // server/utils/pythonRunner.js
 const { spawn } = require('child_process');
+const net = require('net');
 const path = require('path');
 
+// Linux caps a single argv string at 128 KB
+const MAX_ARG_BYTES = 64 * 1024;
+
+// Execution budget per command. A spawned process that overruns it is killed and the
+// caller gets a structured { error, timed_out: true } result; 0 disables the limit.
+const DEFAULT_TIMEOUT_MS = Number(process.env.ML_TIMEOUT_MS || 30000);
+const COMMAND_TIMEOUT_MS = {
+    predict_forecast_outbreak: 60000,
+    predict_hosp_disease: 60000,
+    predict_hotspot: 60000,
+    match_donors: 60000,
+    predict_inventory_bulk: 60000,
+};
+
+const timeoutFor = (command) => {
+    if (command.startsWith('train')) return 0;
+    return COMMAND_TIMEOUT_MS[command] ?? DEFAULT_TIMEOUT_MS;
+};
+
+const timeoutResult = (command, timeoutMs, startedAt) => ({
+    error: `${command} exceeded its ${timeoutMs} ms execution budget and was cancelled`,
+    timed_out: true,
+    budget_ms: timeoutMs,
+    elapsed_ms: Date.now() - startedAt
+});
+
+// --- Persistent ML server (server/ml/ml_server.py) ---
+// When ML_SERVER_PORT is set, ai_ml.py predictions go over long-lived sockets
+// instead of spawning a process per request; spawning remains the fallback.
+// Requests are spread round-robin over ML_SERVER_CONNECTIONS sockets so that a
+// pre-forked server (--prefork N) gets work on all of its processes.
+const ML_SERVER_HOST = process.env.ML_SERVER_HOST || '127.0.0.1';
+const ML_SERVER_PORT = process.env.ML_SERVER_PORT;
+const ML_SERVER_CONNECTIONS = Math.max(1, Number(process.env.ML_SERVER_CONNECTIONS || 4));
+
+const serverConnections = new Array(ML_SERVER_CONNECTIONS).fill(null);
+let nextConnection = 0;
+let nextRequestId = 1;
+const pendingRequests = new Map();
+
+const connectToServer = (slot) => {
+    if (serverConnections[slot]) return serverConnections[slot];
+    serverConnections[slot] = new Promise((resolve, reject) => {
+        const socket = net.createConnection({ host: ML_SERVER_HOST, port: Number(ML_SERVER_PORT) });
+        let buffer = '';
+        socket.setEncoding('utf8');
+        socket.once('connect', () => resolve(socket));
+        socket.on('data', (chunk) => {
+            buffer += chunk;
+            let newline;
+            while ((newline = buffer.indexOf('\n')) >= 0) {
+                const line = buffer.slice(0, newline);
+                buffer = buffer.slice(newline + 1);
+                try {
+                    const message = JSON.parse(line);
+                    const pending = pendingRequests.get(message.id);
+                    if (pending) {
+                        pendingRequests.delete(message.id);
+                        pending.resolve(message.result);
+                    }
+                } catch (e) {
+                    console.error('Invalid message from ML server:', line);
+                }
+            }
+        });
+        socket.on('error', reject);
+        socket.on('close', () => {
+            serverConnections[slot] = null;
+            // Requests still waiting on this connection fall back to spawning
+            for (const [id, pending] of pendingRequests) {
+                if (pending.socket === socket) {
+                    pendingRequests.delete(id);
+                    pending.reject(new Error('ML server connection closed'));
+                }
+            }
+        });
+    });
+    return serverConnections[slot];
+};
+
+const requestFromServer = async (command, input) => {
+    const slot = nextConnection;
+    nextConnection = (nextConnection + 1) % ML_SERVER_CONNECTIONS;
+    const socket = await connectToServer(slot);
+    const id = nextRequestId++;
+    const timeoutMs = timeoutFor(command);
+    const startedAt = Date.now();
+    return new Promise((resolve, reject) => {
+        // The server enforces its own budgets; this only guards against a wedged server
+        const timer = timeoutMs ? setTimeout(() => {
+            pendingRequests.delete(id);
+            resolve(timeoutResult(command, timeoutMs, startedAt));
+        }, timeoutMs) : null;
+        const settle = (callback) => (value) => {
+            if (timer) clearTimeout(timer);
+            callback(value);
+        };
+        pendingRequests.set(id, { resolve: settle(resolve), reject: settle(reject), socket });
+        socket.write(JSON.stringify({ id, command, input }) + '\n');
+    });
+};
+
 // Added 'scriptName' parameter (defaults to ai_ml.py if not provided)
 const runPythonModel = (command, jsonInput, scriptName = 'ai_ml.py') => {
     return new Promise((resolve, reject) => {
-        const mlFolder = path.join(__dirname, '..', 'ml');
-        const scriptPath = path.join(mlFolder, scriptName);
-        const pythonExec = process.env.PYTHON_PATH || 'python3';
-        
         // --- FIXED LOGIC ---
         // We must ensure 'jsonInput' is always an object so Python can use .get()
         let finalInput = jsonInput;
@@ -25,14 +124,54 @@ const runPythonModel = (command, jsonInput, scriptName = 'ai_ml.py') => {
             }
         }
 
+        if (ML_SERVER_PORT && scriptName === 'ai_ml.py') {
+            return requestFromServer(command, finalInput)
+                .then((result) => {
+                    // Commands the server does not serve (e.g. training) still run as a one-off process
+                    if (result && typeof result.error === 'string' && result.error.startsWith('Unknown command')) {
+                        return runPythonProcess(command, finalInput, scriptName).then(resolve, reject);
+                    }
+                    resolve(result);
+                })
+                .catch((err) => {
+                    console.error(`ML server unavailable (${err.message}), spawning ${scriptName} instead`);
+                    runPythonProcess(command, finalInput, scriptName).then(resolve, reject);
+                });
+        }
+
+        runPythonProcess(command, finalInput, scriptName).then(resolve, reject);
+    });
+};
+
+const runPythonProcess = (command, finalInput, scriptName) => {
+    return new Promise((resolve, reject) => {
+        const mlFolder = path.join(__dirname, '..', 'ml');
+        const scriptPath = path.join(mlFolder, scriptName);
+        const pythonExec = process.env.PYTHON_PATH || 'python3';
+
         const inputString = JSON.stringify(finalInput);
         // -------------------
 
+        // Large payloads (e.g. bulk catalogues) exceed the OS per-argument limit, so they go through stdin
+        const useStdin = Buffer.byteLength(inputString) > MAX_ARG_BYTES;
+
         // Spawn process
-        const pythonProcess = spawn(pythonExec, [scriptPath, command, inputString], { cwd: mlFolder });
+        const pythonProcess = spawn(pythonExec, [scriptPath, command, useStdin ? '-' : inputString], { cwd: mlFolder });
+        if (useStdin) {
+            pythonProcess.stdin.end(inputString);
+        }
 
         let dataString = '';
         let errorString = '';
+        let timedOut = false;
+        const startedAt = Date.now();
+        const timeoutMs = timeoutFor(command);
+        const timer = timeoutMs ? setTimeout(() => {
+            timedOut = true;
+            pythonProcess.kill('SIGTERM');
+            // Escalate if the process ignores SIGTERM (e.g. stuck in native code)
+            setTimeout(() => pythonProcess.kill('SIGKILL'), 2000).unref();
+        }, timeoutMs) : null;
 
         pythonProcess.stdout.on('data', (data) => {
             dataString += data.toString();
@@ -43,6 +182,11 @@ const runPythonModel = (command, jsonInput, scriptName = 'ai_ml.py') => {
         });
 
         pythonProcess.on('close', (code) => {
+            if (timer) clearTimeout(timer);
+            if (timedOut) {
+                console.error(`Python Timeout (${scriptName} - ${command}) after ${Date.now() - startedAt} ms`);
+                return resolve(timeoutResult(command, timeoutMs, startedAt));
+            }
             if (code !== 0) {
                 console.error(`Python Error (${scriptName} - ${command}):`, errorString || dataString);
                 return reject(new Error(errorString || dataString || 'Python script execution failed'));